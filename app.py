@@ -1,226 +1,531 @@
 # app.py (с добавленными изменениями)
-from flask import Flask, render_template, jsonify, request
-import sqlite3
+from flask import Flask, render_template, jsonify, request, Response
 import json
 from datetime import datetime, timedelta
-import threading
 import time
-from database import Database
-from modbus_client import ProductionMonitor
-from models import ShiftManager, OEECalculator, DowntimeMonitor
+from database import Database, utc_timestamp
+from ingest import WriteBehindBuffer
+from journal import SampleJournal, JournalReplayer
+from rollups import RollupEngine
+from retention import RetentionManager
+from shift_reports import ShiftReportJob
+from snapshot import StateSnapshot
+from push import EventBroadcaster
+from grid_codec import (
+    MINUTE_GRID_MEDIA_TYPE, compress_body, minute_grid_to_rows, pack_minute_grid, wants_minute_grid
+)
+from poller import PollerEngine
+from models import LineRegistry, ShiftManager, OEECalculator, OutageDetector
+from downtime import DowntimeEngine
+from oee_batch import BatchOEECalculator
+from history import HistoryQuery, BUCKETS, bucket_for_seconds
 from config import Config
+import metrics
 
 app = Flask(__name__)
 app.config.from_object(Config)
+if Config.METRICS_ENABLED:
+    metrics.install_flask(app)
 
 # Инициализация компонентов
-db = Database()
-monitor = ProductionMonitor()
-downtime_monitor = DowntimeMonitor()
+db = Database(line_codes=LineRegistry.get_line_codes())
 oee_calculator = OEECalculator()
+batch_oee_calculator = BatchOEECalculator()
+history = HistoryQuery(db, batch_oee_calculator)
 
-# Глобальные переменные для хранения текущего состояния
-current_state = {
-    'production_data': {},
-    'oee_data': {},
-    'downtime_status': {'is_downtime': False, 'info': None},
-    'shift_info': {},
-    'last_update': ''
+# Отложенная пакетная запись: опрос не ждет диска
+ingest = WriteBehindBuffer(db)
+ingest.start()
+
+# Журнал показаний: выборка сначала пишется в отображенный файл, в БД ее переносит
+# фоновый поток - опрос не теряет данных при блокировке БД и перезапуске
+journal = None
+replayer = None
+if Config.JOURNAL_ENABLED:
+    journal = SampleJournal()
+    replayer = JournalReplayer(db, journal)
+    replayer.recover()
+    replayer.start()
+
+# Фоновая очистка и агрегация старых сырых данных
+retention = RetentionManager(db)
+retention.start()
+
+# Итоговые отчеты по закрытым сменам
+shift_reports = ShiftReportJob(db, oee_calculator, LineRegistry.get_line_codes())
+shift_reports.start()
+
+# Инкрементальные агрегаты минута/час/смена
+rollups = RollupEngine()
+
+def save_rollups(buckets):
+    """Постановка закрытых корзин агрегатов в очередь записи"""
+    for bucket in buckets:
+        if bucket['level'] == 'minute':
+            ingest.submit('minute_rollup', bucket)
+        elif bucket['level'] == 'hour':
+            ingest.submit('hourly_rollup', bucket)
+
+# Простои: автомат состояния на линию, запись в БД - подписчик на его события
+downtime_engine = DowntimeEngine(LineRegistry.get_line_codes())
+
+# Перерывы связи с устройствами: явные интервалы в device_outages
+outage_detectors = {
+    device['line_code']: OutageDetector(device.get('polling_interval'))
+    for device in Config.DEVICES
 }
 
-def background_monitoring():
-    """Фоновая задача для мониторинга оборудования"""
-    while True:
-        try:
-            # Получаем текущие данные
-            production_data = monitor.get_production_data()
-            
-            if production_data and production_data['success']:
-                try:
-                    # Сохраняем в БД
-                    production_delta = db.save_production_data(production_data)
-                except Exception as db_error:
-                    print(f"❌ Ошибка сохранения в БД: {db_error}")
-                    production_delta = 0
-                
-                # Проверяем простой
-                is_downtime, downtime_info = downtime_monitor.check_downtime(
-                    production_data['ivams_total'], 
-                    datetime.now().timestamp()
-                )
-                
-                # Получаем информацию о текущей смене
-                current_shift = ShiftManager.get_current_shift()
-                
-                # Рассчитываем OEE (упрощенный расчет для теста)
-                test_production = 1 if production_delta == 0 else production_delta
-                
-                oee_data = oee_calculator.calculate_oee(
-                    actual_production=test_production,
-                    planned_production=Config.TARGET_PRODUCTION_RATE / 20,
-                    operating_time=3,
-                    available_time=3
-                )
-                
-                # РАСЧЕТ И СОХРАНЕНИЕ ПОЧАСОВОЙ МОЩНОСТИ
-                current_hour = datetime.now().hour
-                current_power = 0
-                
-                # Используем production_delta для расчета мощности
-                if production_delta > 0:
-                    current_power = production_delta * 20  # Переводим в шт/мин
-                
-                # Сохраняем почасовую мощность в БД
-                if current_power > 0:
-                    db.save_hourly_power(current_hour, current_power)
-
-                # После расчета current_power добавьте:
-                current_time = datetime.now()
-                current_hour = current_time.hour
-                current_minute = current_time.minute
-
-                # Сохраняем поминутную мощность
-                if current_power > 0:
-                    db.save_minute_power(current_hour, current_minute, current_power)    
-                
-                # Сохраняем OEE метрики
-                if oee_data:
-                    try:
-                        db.save_oee_metrics(oee_data)
-                    except Exception as e:
-                        print(f"❌ Ошибка сохранения OEE: {e}")
-                
-                # Обновляем глобальное состояние с безопасными данными
-                current_state['production_data'] = production_data
-                current_state['oee_data'] = oee_data or {
-                    'oee_percentage': 0,
-                    'availability': 0, 
-                    'performance': 0,
-                    'quality': 0,
-                    'production_rate': 0
-                }
-                current_state['downtime_status'] = {
-                    'is_downtime': is_downtime,
-                    'info': str(downtime_info) if downtime_info else None
-                }
-                current_state['shift_info'] = current_shift
-                current_state['last_update'] = datetime.now().isoformat()
-                
-                # Сохраняем событие простоя
-                if is_downtime and downtime_info and current_shift:
-                    try:
-                        db.save_downtime_event(
-                            downtime_info, 
-                            current_shift['number']
-                        )
-                    except Exception as e:
-                        print(f"❌ Ошибка сохранения простоя: {e}")
+def save_downtime(event):
+    """Запись простоя: одна строка на простой (микроостановки в БД не пишутся)"""
+    line_code = event['line_code']
+    _, shift_number = ShiftManager.get_shift_key(datetime.fromtimestamp(event['start_time']), line_code)
+    if event['type'] == 'downtime_ended':
+        ingest.submit('downtime_close', event, shift_number, line_code)
+        print(f"✅ Простой {line_code} завершен: {round(event['duration'] / 60, 1)} мин")
+    else:
+        # Открытие, обновление длительности (не чаще DOWNTIME_FLUSH_INTERVAL), смена причины
+        ingest.submit('downtime_event', event, shift_number, line_code)
+        if event['type'] == 'downtime_started':
+            print(f"⚠️ Простой {line_code} с {datetime.fromtimestamp(event['start_time']).isoformat()}")
+
+downtime_engine.subscribe(
+    save_downtime,
+    ('downtime_started', 'downtime_updated', 'downtime_resumed', 'reason_changed', 'downtime_ended')
+)
+
+def create_line_state():
+    """Начальное состояние линии"""
+    return {
+        'production_data': {},
+        'oee_data': {},
+        'downtime_status': {'is_downtime': False, 'state': None, 'info': None},
+        'shift_info': {},
+        'outage': None,
+        'last_update': ''
+    }
+
+# Глобальные переменные для хранения текущего состояния
+# (current_state - линия по умолчанию из LineRegistry, line_states - все линии)
+line_states = {line_code: create_line_state() for line_code in LineRegistry.get_line_codes()}
+current_state = line_states[LineRegistry.get_default_code()]
+
+# Сериализованные снимки состояния для /api/current_data (публикуются раз в тик)
+state_snapshots = {line_code: StateSnapshot(state) for line_code, state in line_states.items()}
+
+# Рассылка изменений подключенным dashboard (/api/stream)
+broadcaster = EventBroadcaster()
+
+def minute_cells(line_code, closed_buckets):
+    """Ячейки поминутной карты, затронутые тиком: закрытые минуты и текущая"""
+    buckets = [bucket for bucket in closed_buckets if bucket['level'] == 'minute']
+    open_minute = rollups.get_open_bucket(line_code, 'minute')
+    if open_minute:
+        buckets.append(open_minute)
+    return [(b['date'], b['hour'], b['minute'], b['power_value']) for b in buckets]
+
+def publish_state(line_code, closed_buckets=()):
+    """Публикация снимка состояния линии и рассылка изменений после обработки тика"""
+    try:
+        state_snapshots[line_code].publish(line_states[line_code])
+        broadcaster.publish_tick(line_code, line_states[line_code], minute_cells(line_code, closed_buckets))
+    except Exception as e:
+        print(f"❌ Ошибка публикации состояния {line_code}: {e}")
+
+def process_production_data(device, production_data):
+    """Обработка результата опроса одной линии (вызывается движком опроса)"""
+    line_code = device['line_code']
+    state = line_states[line_code]
+    closed_buckets = []
+    # Интервал тика от движка опроса - только для агрегатов, в состояние линии не попадает
+    sample_interval = production_data.pop('sample_interval', None) if production_data else None
+    
+    try:
+        if production_data and production_data['success']:
+            # Прирост считаем по последнему показанию в памяти, строка пишется пакетом
+            production_delta = db.compute_production_delta(production_data, line_code)
+            if journal is not None:
+                journal.append(line_code, production_data, production_delta)
+                replayer.notify()
             else:
-                # Тестовые данные если оборудование не отвечает
-                current_shift = ShiftManager.get_current_shift()
-                current_state['production_data'] = {
-                    'ivams_total': 2265349,
-                    'hour_count': 37094,
-                    'aux_count': 1414,
-                    'success': False
-                }
-                current_state['oee_data'] = {
-                    'oee_percentage': 78.5,
-                    'availability': 85.0,
-                    'performance': 92.1,
-                    'quality': 98.0,
-                    'production_rate': 850
-                }
-                current_state['downtime_status'] = {
-                    'is_downtime': False,
-                    'info': None
-                }
-                current_state['shift_info'] = current_shift
-                current_state['last_update'] = datetime.now().isoformat()
+                ingest.submit(
+                    'production_data',
+                    utc_timestamp(production_data['timestamp']),
+                    production_data,
+                    production_delta,
+                    line_code
+                )
+            
+            # Связь восстановлена: прирост за перерыв распределяется по его минутам в rollups
+            finished_outage = outage_detectors[line_code].sample_succeeded(
+                production_data['timestamp'],
+                production_data['ivams_total'],
+                production_delta
+            )
+            if finished_outage:
+                ingest.submit('device_outage', finished_outage, line_code)
+                print(f"✅ Связь с {line_code} восстановлена через {round(finished_outage['duration'])} сек, "
+                      f"выпуск за перерыв: {production_delta} шт")
+            
+            # Автомат простоев: события переходов получают подписчики
+            downtime_engine.observe(line_code, production_data['timestamp'], production_delta)
+            
+            # Получаем информацию о текущей смене
+            current_shift = ShiftManager.get_current_shift(line_code)
+            
+            # Рассчитываем OEE (упрощенный расчет для теста)
+            test_production = 1 if production_delta == 0 else production_delta
+            target_rate = LineRegistry.get_target_rate(line_code)
+            
+            oee_data = oee_calculator.calculate_oee(
+                actual_production=test_production,
+                planned_production=target_rate / 20,
+                operating_time=3,
+                available_time=3,
+                target_rate=target_rate
+            )
             
-            time.sleep(Config.POLLING_INTERVAL)
+            # ПОМИНУТНАЯ И ПОЧАСОВАЯ МОЩНОСТЬ: агрегаты пишутся один раз при закрытии минуты/часа
+            closed_buckets = rollups.add_sample(
+                line_code,
+                production_data['timestamp'],
+                production_delta,
+                sample_interval or device.get('polling_interval')
+            )
+            save_rollups(closed_buckets)
             
-        except Exception as e:
-            print(f"❌ Ошибка в фоновом мониторинге: {e}")
-            current_state['last_update'] = datetime.now().isoformat()
-            time.sleep(5)
+            # OEE метрики пишутся в БД пакетами
+            if oee_data:
+                ingest.submit('oee_metrics', utc_timestamp(), oee_data, line_code)
+            
+            # Обновляем состояние линии с безопасными данными
+            state['production_data'] = production_data
+            state['oee_data'] = oee_data or {
+                'oee_percentage': 0,
+                'availability': 0, 
+                'performance': 0,
+                'quality': 0,
+                'production_rate': 0
+            }
+            state['downtime_status'] = downtime_engine.get_downtime_status(line_code, production_data['timestamp'])
+            state['shift_info'] = current_shift
+            state['outage'] = None
+            state['last_update'] = datetime.now().isoformat()
+        else:
+            # Закрываем истекшие минуты/часы, даже если выборок нет
+            closed_buckets = rollups.close_expired(line_code, time.time())
+            save_rollups(closed_buckets)
+            
+            # Нет связи: перерыв фиксируется явно, показатели не подменяются
+            monitor = poller.monitors.get(line_code)
+            opened_outage = outage_detectors[line_code].sample_failed(
+                time.time(),
+                monitor.health['last_error'] if monitor else None
+            )
+            if opened_outage:
+                ingest.submit('device_outage', opened_outage, line_code)
+                print(f"⚠️ Нет связи с {line_code} с {datetime.fromtimestamp(opened_outage['start_time']).isoformat()}")
+            
+            state['production_data'] = {
+                'ivams_total': None,
+                'hour_count': None,
+                'aux_count': None,
+                'success': False
+            }
+            state['oee_data'] = {
+                'oee_percentage': 0,
+                'availability': 0,
+                'performance': 0,
+                'quality': 0,
+                'production_rate': 0
+            }
+            # Без выборок автомат простоев не меняет состояние
+            state['downtime_status'] = downtime_engine.get_downtime_status(line_code)
+            state['shift_info'] = ShiftManager.get_current_shift(line_code)
+            state['outage'] = outage_detectors[line_code].get_status()
+            state['last_update'] = datetime.now().isoformat()
+        
+    except Exception as e:
+        print(f"❌ Ошибка в фоновом мониторинге {line_code}: {e}")
+        state['last_update'] = datetime.now().isoformat()
+    
+    publish_state(line_code, closed_buckets)
+
+# Запускаем асинхронный опрос всех устройств
+poller = PollerEngine(Config.DEVICES, process_production_data)
+poller.start()
 
-# Запускаем фоновый мониторинг
-monitor_thread = threading.Thread(target=background_monitoring, daemon=True)
-monitor_thread.start()
+# Метрики, которые уже считаются компонентами, выдаются в /metrics по запросу
+def ingest_operations():
+    stats = ingest.get_stats()
+    return {('written',): stats['written'], ('dropped',): stats['dropped']}
+
+def per_line(values, key, scale=1):
+    return {
+        (line_code,): item[key] * scale if item.get(key) is not None else None
+        for line_code, item in values.items()
+    }
+
+metrics.REGISTRY.gauge(
+    'oee_ingest_queue_depth', 'Операций в очереди записи',
+    callback=lambda: ingest.get_stats()['queue_depth']
+)
+metrics.REGISTRY.counter(
+    'oee_ingest_operations_total', 'Операции очереди записи: записанные и отброшенные', ('result',),
+    callback=ingest_operations
+)
+metrics.REGISTRY.gauge(
+    'oee_journal_pending', 'Выборок в журнале, еще не перенесенных в БД',
+    callback=lambda: journal.pending() if journal is not None else None
+)
+metrics.REGISTRY.counter(
+    'oee_journal_overwritten_total', 'Выборки журнала, перезаписанные до переноса в БД',
+    callback=lambda: journal.get_stats()['overwritten'] if journal is not None else None
+)
+metrics.REGISTRY.gauge(
+    'oee_modbus_connected', 'Подключение к устройству (1 - есть)', ('line',),
+    callback=lambda: {(line_code,): int(item['connected']) for line_code, item in poller.get_health().items()}
+)
+metrics.REGISTRY.gauge(
+    'oee_poll_lag_seconds', 'Опоздание последнего тика опроса относительно сетки', ('line',),
+    callback=lambda: per_line(poller.get_schedule_metrics(), 'last_lag_ms', 0.001)
+)
+metrics.REGISTRY.counter(
+    'oee_poll_overruns_total', 'Тики опроса дольше интервала', ('line',),
+    callback=lambda: per_line(poller.get_schedule_metrics(), 'overruns')
+)
+metrics.REGISTRY.counter(
+    'oee_poll_skipped_ticks_total', 'Пропущенные тики опроса', ('line',),
+    callback=lambda: per_line(poller.get_schedule_metrics(), 'skipped_ticks')
+)
+metrics.REGISTRY.gauge(
+    'oee_downtime_lines', 'Линии по состоянию автомата простоев', ('state',),
+    callback=lambda: {(state,): count for state, count in downtime_engine.count_states().items()}
+)
+metrics.REGISTRY.gauge(
+    'oee_push_clients', 'Подключенные клиенты Server-Sent Events',
+    callback=lambda: broadcaster.get_stats()['clients']
+)
 
 # ==================== ROUTES ====================
 
+def requested_line():
+    """Код линии из параметра ?line= (по умолчанию - первая линия реестра), None - линия неизвестна"""
+    line_code = request.args.get('line') or LineRegistry.get_default_code()
+    return line_code if LineRegistry.is_known(line_code) else None
+
+def unknown_line_response():
+    return jsonify({'error': f"Unknown line: {request.args.get('line')}"}), 404
+
 @app.route('/')
 def index():
-    """Главная страница dashboard"""
+    """Главная страница dashboard (?line= - линия)"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    line = LineRegistry.describe(line_code)
     return render_template('index.html', 
-                         line_name=Config.LINE_NAME,
-                         target_rate=Config.TARGET_PRODUCTION_RATE)
+                         line_name=line['line_name'],
+                         target_rate=line['target_rate'])
+
+@app.route('/api/lines')
+def get_lines():
+    """API для получения списка линий"""
+    return jsonify({
+        'default': LineRegistry.get_default_code(),
+        'lines': [LineRegistry.describe(line_code) for line_code in LineRegistry.get_line_codes()]
+    })
 
 @app.route('/api/current_data')
 def get_current_data():
-    """API для получения текущих данных"""
-    try:
-        # Создаем безопасную копию для JSON сериализации
-        safe_state = {}
-        
-        for key, value in current_state.items():
-            if value is None:
-                safe_state[key] = None
-            elif hasattr(value, 'isoformat'):  # Для datetime, time объектов
-                safe_state[key] = value.isoformat()
-            elif isinstance(value, dict):
-                # Рекурсивно обрабатываем словари
-                safe_state[key] = {}
-                for k, v in value.items():
-                    if hasattr(v, 'isoformat'):
-                        safe_state[key][k] = v.isoformat()
-                    else:
-                        safe_state[key][k] = v
-            else:
-                safe_state[key] = value
-        
-        return jsonify(safe_state)
-    except Exception as e:
-        print(f"Ошибка сериализации JSON: {e}")
-        return jsonify({'error': 'Data serialization error'})
+    """API для получения текущих данных (готовый снимок последнего тика)"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    snapshot = state_snapshots[line_code]
+    
+    body, etag = snapshot.get()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/stream')
+def stream_updates():
+    """Push канал (Server-Sent Events): полный снимок, далее изменения каждого тика"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    snapshot = state_snapshots[line_code]
+    
+    response = Response(broadcaster.stream(line_code, snapshot), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def parse_history_range():
+    """
+    Параметры диапазонного запроса: from, to (ISO, местное время), bucket, points, line
+    
+    Returns:
+        Кортеж (начало, конец, корзина, максимум точек, линия); ValueError при ошибке
+    """
+    end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now()
+    start = (datetime.fromisoformat(request.args['from']) if request.args.get('from')
+             else end - timedelta(days=1))
+    bucket = request.args.get('bucket', '1h')
+    if bucket not in BUCKETS or start >= end:
+        raise ValueError(f'Invalid range or bucket: {bucket}')
+    line_code = requested_line()
+    if line_code is None:
+        raise ValueError(f"Unknown line: {request.args.get('line')}")
+    return start, end, bucket, request.args.get('points', type=int), line_code
 
 @app.route('/api/production_history')
 def get_production_history():
-    """API для получения исторических данных производства"""
-    limit = request.args.get('limit', 100, type=int)
-    data = db.get_latest_data(limit)
-    return jsonify(data)
+    """API для получения исторических данных производства
+    
+    Без параметров диапазона - последние limit записей, с from/to/bucket -
+    выпуск по корзинам 1m|5m|1h|shift|day (не больше points точек).
+    """
+    if not any(key in request.args for key in ('from', 'to', 'bucket')):
+        line_code = requested_line()
+        if line_code is None:
+            return unknown_line_response()
+        limit = request.args.get('limit', 100, type=int)
+        data = db.get_latest_data(limit, line_code)
+        return jsonify(data)
+    
+    try:
+        start, end, bucket, max_points, line_code = parse_history_range()
+        return jsonify(history.production(start, end, bucket, line_code, max_points))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"❌ Ошибка диапазонного запроса производства: {e}")
+        return jsonify({'points': []})
 
 @app.route('/api/oee_history')
 def get_oee_history():
-    """API для получения истории OEE"""
-    limit = request.args.get('limit', 50, type=int)
-    data = db.get_oee_history(limit)
-    return jsonify(data)
+    """API для получения истории OEE (с from/to/bucket - OEE по корзинам)"""
+    if not any(key in request.args for key in ('from', 'to', 'bucket')):
+        line_code = requested_line()
+        if line_code is None:
+            return unknown_line_response()
+        limit = request.args.get('limit', 50, type=int)
+        data = db.get_oee_history(limit, line_code)
+        return jsonify(data)
+    
+    try:
+        start, end, bucket, max_points, line_code = parse_history_range()
+        return jsonify(history.oee(start, end, bucket, line_code, max_points))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"❌ Ошибка диапазонного запроса OEE: {e}")
+        return jsonify({'points': []})
+
+@app.route('/api/oee_trend')
+def get_oee_trend():
+    """API для расчета OEE по диапазону: ?from=...&to=...&bucket=<секунды>&line=...
+
+    Прежний формат запроса к диапазонному режиму /api/oee_history: по
+    умолчанию - последние 7 дней, корзина в секундах округляется вверх до
+    1m|5m|1h|day.
+    """
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now()
+        start = (datetime.fromisoformat(request.args['from']) if request.args.get('from')
+                 else end - timedelta(days=7))
+        bucket = request.args.get('bucket', 3600, type=int)
+        line_code = requested_line()
+        if line_code is None:
+            return unknown_line_response()
+        
+        if start >= end or bucket <= 0:
+            return jsonify({'error': 'Invalid range'}), 400
+        
+        result = history.oee(start, end, bucket_for_seconds(bucket), line_code, request.args.get('points', type=int))
+        result['line_code'] = line_code
+        return jsonify(result)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    except Exception as e:
+        print(f"❌ Ошибка расчета OEE по диапазону: {e}")
+        return jsonify({'points': []})
+
+@app.route('/api/outages')
+def get_outages():
+    """API для получения перерывов связи с устройством за диапазон from/to (по умолчанию - сутки)"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now()
+        start = (datetime.fromisoformat(request.args['from']) if request.args.get('from')
+                 else end - timedelta(days=1))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'line_code': line_code,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'current': outage_detectors[line_code].get_status(),
+        'outages': db.get_device_outages(start, end, line_code)
+    })
+
+@app.route('/api/downtime_state')
+def get_downtime_state():
+    """API для получения состояния автомата простоев линии (пороги, текущая остановка, счетчики)"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    status = downtime_engine.get_status(line_code)
+    status['line_code'] = line_code
+    return jsonify(status)
+
+@app.route('/api/product', methods=['POST'])
+def set_product():
+    """API для смены продукта линии (пороги простоев по продукту)"""
+    data = request.get_json(silent=True) or {}
+    line_code = data.get('line') or request.args.get('line') or LineRegistry.get_default_code()
+    if not LineRegistry.is_known(line_code):
+        return jsonify({'success': False, 'error': f'Unknown line: {line_code}'}), 404
+    
+    try:
+        thresholds = downtime_engine.set_product(line_code, data.get('product'))
+        return jsonify({'success': True, 'product': data.get('product'), 'thresholds': thresholds})
+    except Exception as e:
+        print(f"❌ Ошибка смены продукта {line_code}: {e}")
+        return jsonify({'success': False, 'error': 'Internal server error'})
 
 @app.route('/api/shift_data')
 def get_shift_data():
     """API для получения данных по смене"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
     try:
         shift_date = request.args.get('date', '')
         shift_number_str = request.args.get('shift', '')
         
         # Проверяем и преобразуем параметры
+        current_date, current_number = ShiftManager.get_shift_key(line_code=line_code)
         if not shift_date:
-            shift_date = datetime.now().date().isoformat()
+            shift_date = current_date
             
         if shift_number_str:
             shift_number = int(shift_number_str)
         else:
-            current_shift = ShiftManager.get_current_shift()
-            if current_shift and isinstance(current_shift, dict):
-                shift_number = current_shift.get('number', 1)
-            else:
-                shift_number = 1
+            shift_number = current_number or 1
         
-        data = db.get_shift_data(shift_date, shift_number)
+        # Закрытая смена - готовый отчет, текущая - расчет по сырым данным
+        data = db.get_shift_report(shift_date, shift_number, line_code)
+        if data is None:
+            data = db.get_shift_data(shift_date, shift_number, line_code)
+            data['finalized'] = False
         return jsonify(data)
     except Exception as e:
         print(f"Ошибка в get_shift_data: {e}")
@@ -233,8 +538,17 @@ def get_shift_data():
 @app.route('/api/hourly_power')
 def get_hourly_power():
     """API для получения почасовой мощности за сегодня"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
     try:
-        hourly_data = db.get_today_hourly_power()
+        hourly_data = db.get_today_hourly_power(line_code)
+        
+        # Текущий незакрытый час берем из агрегатора
+        open_hour = rollups.get_open_bucket(line_code, 'hour')
+        if open_hour and open_hour['date'] == datetime.now().date().isoformat():
+            hourly_data[open_hour['hour']] = open_hour['power_value']
+        
         return jsonify({
             'hourly_power': hourly_data,
             'current_hour': datetime.now().hour
@@ -250,12 +564,19 @@ def update_downtime_reason():
         # Получаем данные с проверкой
         data = request.get_json(silent=True) or {}
         reason = data.get('reason')
+        line_code = data.get('line') or request.args.get('line') or LineRegistry.get_default_code()
+        if not LineRegistry.is_known(line_code):
+            return jsonify({'success': False, 'error': f'Unknown line: {line_code}'}), 404
         
-        if reason:
-            downtime_monitor.add_downtime_reason(reason)
-            return jsonify({'success': True, 'message': f'Причина простоя обновлена: {reason}'})
-        else:
+        if not reason:
             return jsonify({'success': False, 'error': 'No reason provided'})
+        
+        result = downtime_engine.set_reason(line_code, reason)
+        if result == 'applied':
+            return jsonify({'success': True, 'message': f'Причина простоя обновлена: {reason}'})
+        if result == 'pending':
+            return jsonify({'success': True, 'message': f'Причина будет присвоена простою после микроостановки: {reason}'})
+        return jsonify({'success': False, 'error': 'No active downtime'}), 409
             
     except Exception as e:
         print(f"❌ Ошибка обновления причины простоя: {e}")
@@ -268,98 +589,76 @@ def get_system_info():
         'line_name': Config.LINE_NAME,
         'target_production_rate': Config.TARGET_PRODUCTION_RATE,
         'shift_duration': '12 часов',
+        'lines': LineRegistry.get_line_codes(),
         'downtime_threshold': f"{Config.DOWNTIME_THRESHOLD} секунд",
-        'polling_interval': f"{Config.POLLING_INTERVAL} секунд"
+        'polling_interval': f"{Config.POLLING_INTERVAL} секунд",
+        'connection': poller.get_health(),
+        'schedule': poller.get_schedule_metrics(),
+        'ingest': ingest.get_stats(),
+        'journal': replayer.get_stats() if replayer is not None else None,
+        'downtime': downtime_engine.get_stats(),
+        'retention': retention.get_stats(),
+        'shift_reports': shift_reports.get_stats(),
+        'push': broadcaster.get_stats(),
+        'day_cache': db.day_cache.get_stats(),
+        'storage': db.connections.get_stats()
     })
-        'oee_data': {
-            'oee_percentage': 78.5,
-            'availability': 85.0,
-            'performance': 92.1,
-            'quality': 98.0
-        }
-    })
-
-@app.route('/api/minute_power')   'hour_count': 37094,
-            'aux_count': 1414,
-            'success': True
-        },
-        'oee_data': {
-            'oee_percentage': 78.5,
-            'availability': 85.0,
-            'performance': 92.1,
-            'quality': 98.0
-  @app.route('/api/minute_power')
-def get_minute_power():
-    """API для получения поминутной мощности за сегодня"""
-    try:
-        minute_data = db.get_today_minute_power()
-        current_time = datetime.now()
-        return jsonify({
-            'minute_power': minute_data,
-            'current_hour': current_time.hour,
-            'current_minute': current_time.minute
-        })
-    except Exception as e:
-        print(f"Ошибка получения поминутной мощности: {e}")
-        return jsonify({
-            'minute_power': [[0] * 60 for _ in range(24)],
-            'current_hour': 0,
-            'current_minute': 0
-        })
-
-@app.route('/api/minute_power/<date>')
-def get_minute_power_by_date(date):
-    """API для получения поминутной мощности за конкретную дату"""
-    try:
-        minute_data = db.get_minute_power_by_date(date)
-        return jsonify({
-            'minute_power': minute_data,
-            'date': date,
-            'current_hour': 0,
-            'current_minute': 0
-        })
-    except Exception as e:
-        print(f"Ошибка получения поминутной мощности за {date}: {e}")
-        return jsonify({
-            'minute_power': [[0] * 60 for _ in range(24)],
-            'date': date,
-            'current_hour': 0,
-            'current_minute': 0
-        })
-
-@app.route('/api/available_dates')
-def get_available_dates():
-    """API для получения списка доступных дат с данными"""
-    try:
-        dates = db.get_available_dates()
-        return jsonify({
-            'dates': dates,
-            'count': len(dates)
-        })
-    except Exception as e:
-        print(f"Ошибка получения списка дат: {e}")
-        return jsonify({
-            'dates': [],
-            'count': 0
-        })
-
-@app.route('/api/hourly_power/<date>')
-def get_hourly_power_by_date(date):
-    """API для получения почасовой мощности за конкретную дату"""
-    try:
-        hourly_data = db.get_hourly_power_by_date(date)
-        return jsonify({
-            'hourly_power': hourly_data,
-            'date': date,
-            'current_hour': 0
-        })
-    except Exception as e:
-        print(f"Ошибка получения почасовой мощности за {date}: {e}")
-        return jsonify({
-            'hourly_power': [0] * 24,
-            'date': date,
-            'current_hour': 0
-        })our,
+
+@app.route('/metrics')
+def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    if not Config.METRICS_ENABLED:
+        return Response('metrics disabled\n', status=404, mimetype='text/plain')
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def cacheable_response(response, closed):
+    """ETag и Cache-Control: закрытый день не меняется, открытый - проверяется каждый раз"""
+    if closed:
+        response.headers['Cache-Control'] = f'public, max-age={Config.DAY_CACHE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+def minute_power_response(grid, meta):
+    """
+    Ответ с поминутной картой
+    
+    По заголовку Accept - упакованный float32 массив (параметры в заголовках X-*)
+    или прежний JSON; тело сжимается по Accept-Encoding.
+    """
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if wants_minute_grid(request.accept_mimetypes):
+        body = pack_minute_grid(grid)
+        mimetype = MINUTE_GRID_MEDIA_TYPE
+        for key, value in meta.items():
+            headers['X-' + key.replace('_', '-').title()] = str(value)
+    else:
+        body = json.dumps({'minute_power': minute_grid_to_rows(grid), **meta}).encode('utf-8')
+        mimetype = 'application/json'
+    
+    body, encoding = compress_body(body, request.accept_encodings)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype=mimetype, headers=headers)
+
+@app.route('/api/minute_power')
+def get_minute_power():
+    """API для получения поминутной мощности за сегодня"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    try:
+        current_time = datetime.now()
+        minute_data = db.get_minute_power_grid(current_time.date().isoformat(), line_code)
+        
+        # Текущая незакрытая минута берется из агрегатора
+        open_minute = rollups.get_open_bucket(line_code, 'minute')
+        if open_minute and open_minute['date'] == current_time.date().isoformat():
+            minute_data[open_minute['hour'] * 60 + open_minute['minute']] = open_minute['power_value']
+
+        return minute_power_response(minute_data, {
+            'current_hour': current_time.hour,
             'current_minute': current_time.minute
         })
     except Exception as e:
@@ -370,6 +669,69 @@ def get_hourly_power_by_date(date):
             'current_minute': 0
         })
 
+@app.route('/api/minute_power/<date>')
+def get_minute_power_by_date(date):
+    """API для получения поминутной мощности за конкретную дату"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    try:
+        minute_data = db.get_minute_power_grid(date, line_code)
+        response = minute_power_response(minute_data, {
+            'date': date,
+            'current_hour': 0,
+            'current_minute': 0
+        })
+        return cacheable_response(response, db.is_day_closed(date))
+    except Exception as e:
+        print(f"Ошибка получения поминутной мощности за {date}: {e}")
+        return jsonify({
+            'minute_power': [[0] * 60 for _ in range(24)],
+            'date': date,
+            'current_hour': 0,
+            'current_minute': 0
+        })
+
+@app.route('/api/available_dates')
+def get_available_dates():
+    """API для получения списка доступных дат с данными"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    try:
+        dates = db.get_available_dates(line_code)
+        return cacheable_response(jsonify({
+            'dates': dates,
+            'count': len(dates)
+        }), closed=False)
+    except Exception as e:
+        print(f"Ошибка получения списка дат: {e}")
+        return jsonify({
+            'dates': [],
+            'count': 0
+        })
+
+@app.route('/api/hourly_power/<date>')
+def get_hourly_power_by_date(date):
+    """API для получения почасовой мощности за конкретную дату"""
+    line_code = requested_line()
+    if line_code is None:
+        return unknown_line_response()
+    try:
+        hourly_data = db.get_hourly_power_by_date(date, line_code)
+        return cacheable_response(jsonify({
+            'hourly_power': hourly_data,
+            'date': date,
+            'current_hour': 0
+        }), db.is_day_closed(date))
+    except Exception as e:
+        print(f"Ошибка получения почасовой мощности за {date}: {e}")
+        return jsonify({
+            'hourly_power': [0] * 24,
+            'date': date,
+            'current_hour': 0
+        })
+
 if __name__ == '__main__':
     print(f"🚀 Запуск системы мониторинга OEE для {Config.LINE_NAME}")
     print(f"📊 Целевой показатель: {Config.TARGET_PRODUCTION_RATE} шт/час")
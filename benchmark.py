@@ -0,0 +1,282 @@
+# benchmark.py
+"""
+Сквозной нагрузочный тест сбора данных на имитаторе (simulator.py)
+
+Для каждого числа линий N поднимается N имитируемых контроллеров и все
+приложение (опрос, очередь записи, БД, API) на временной БД. Замеры:
+  - опросов в секунду (фактически / по плану);
+  - задержка образца: от чтения счетчика до фиксации строки в БД;
+  - пропускная способность записи (фактическая и предельная write_batch);
+  - задержка API (p50/p95/p99) под нагрузкой опроса.
+
+Каждое N запускается в отдельном процессе - app.py стартует фоновые
+службы при импорте и читает Config.DEVICES один раз.
+
+Запуск:
+    python benchmark.py --lines 1,5,20 --duration 30 --save before.json
+    python benchmark.py --lines 1,5,20 --duration 30 --compare before.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from config import Config
+
+# Запросы API для замера (подставляется ?line= первой линии)
+API_ENDPOINTS = (
+    '/api/current_data',
+    '/api/minute_power',
+    '/api/hourly_power',
+    '/api/oee_history?bucket=1h',
+    '/api/production_history?bucket=5m',
+    '/api/system_info',
+)
+
+def percentiles(values):
+    """p50/p95/p99/max в миллисекундах"""
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    array = np.asarray(values, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {
+        'count': len(values),
+        'p50': round(float(p50), 2),
+        'p95': round(float(p95), 2),
+        'p99': round(float(p99), 2),
+        'max': round(float(array.max()), 2)
+    }
+
+def measure_write_throughput(db_path, lines, seconds=2.0):
+    """Предельная запись: пакеты INGEST_BATCH_SIZE строк production_data подряд, строк/с"""
+    from database import Database, utc_timestamp
+
+    line_codes = [f'SIM_{index + 1}' for index in range(lines)]
+    db = Database(db_path, line_codes=line_codes)
+    written = 0
+    counter = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        batch = []
+        for _ in range(Config.INGEST_BATCH_SIZE):
+            counter += 1
+            data = {'ivams_total': counter, 'hour_count': counter % 65536, 'aux_count': counter // 10}
+            batch.append(('production_data', (utc_timestamp(), data, 1, line_codes[counter % lines])))
+        db.write_batch(batch)
+        written += Config.INGEST_BATCH_SIZE
+    return round(written / (time.perf_counter() - started), 1)
+
+def run_single(args):
+    """Один прогон с N линиями (в отдельном процессе), результат - в JSON файл"""
+    from simulator import Simulator
+
+    workdir = tempfile.mkdtemp(prefix='oee-bench-')
+    simulator = Simulator(args.profile, args.single, args.base_port, speed=args.speed).start()
+
+    # Конфигурация до импорта app - приложение читает ее при старте
+    Config.DEVICES = simulator.get_devices(args.interval, args.timeout)
+    Config.POLLING_INTERVAL = args.interval
+    Config.DATABASE_PATH = os.path.join(workdir, 'oee.db')
+    Config.SHARD_DIR = os.path.join(workdir, 'shards')
+    Config.JOURNAL_PATH = os.path.join(workdir, 'journal.bin')
+    Config.RETENTION_ARCHIVE_PATH = None
+
+    import app as application
+
+    # Задержка образца фиксируется после транзакции пакета (очередь записи
+    # вызывает db.write_batch на каждый пакет, подмена - только у экземпляра)
+    sample_latencies = []
+    latency_lock = threading.Lock()
+    write_batch = application.db.write_batch
+
+    def timed_write_batch(operations):
+        polled = [op_args[1]['timestamp'] for name, op_args in operations if name == 'production_data']
+        result = write_batch(operations)
+        committed = time.time()
+        with latency_lock:
+            sample_latencies.extend(committed - moment for moment in polled)
+        return result
+
+    application.db.write_batch = timed_write_batch
+
+    time.sleep(args.warmup)
+
+    def snapshot():
+        schedule = application.poller.get_schedule_metrics()
+        return {
+            'ticks': sum(metrics['ticks'] for metrics in schedule.values()),
+            'written': application.ingest.get_stats()['written'] + (
+                application.journal.get_stats()['replayed'] if application.journal is not None else 0
+            ),
+            'failures': sum(
+                stats['exceptions'] + stats['dropped'] + stats['silenced']
+                for stats in simulator.get_stats().values()
+            ),
+            'moment': time.perf_counter()
+        }
+
+    with latency_lock:
+        sample_latencies.clear()
+    before = snapshot()
+    time.sleep(args.duration)
+    after = snapshot()
+    with latency_lock:
+        latencies = list(sample_latencies)
+
+    elapsed = after['moment'] - before['moment']
+    polls = after['ticks'] - before['ticks']
+
+    # API под продолжающимся опросом
+    client = application.app.test_client()
+    line_code = Config.DEVICES[0]['line_code']
+    api = {}
+    for endpoint in API_ENDPOINTS:
+        separator = '&' if '?' in endpoint else '?'
+        url = f'{endpoint}{separator}line={line_code}'
+        timings = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                print(f"⚠️ {url}: HTTP {response.status_code}")
+                break
+        api[endpoint] = percentiles(timings)
+
+    health = application.poller.get_health()
+    rtts = [item['avg_rtt_ms'] for item in health.values() if item.get('avg_rtt_ms') is not None]
+
+    application.poller.stop()
+    application.ingest.stop()
+    simulator.stop()
+
+    result = {
+        'lines': args.single,
+        'profile': args.profile,
+        'interval': args.interval,
+        'duration': round(elapsed, 2),
+        'polls_per_second': round(polls / elapsed, 2),
+        'planned_polls_per_second': round(args.single / args.interval, 2),
+        'samples_written': len(latencies),
+        'failed_polls': after['failures'] - before['failures'],
+        'poll_rtt_ms': round(sum(rtts) / len(rtts), 2) if rtts else None,
+        'sample_latency_ms': percentiles(latencies),
+        'ingest_ops_per_second': round((after['written'] - before['written']) / elapsed, 1),
+        'db_write_rows_per_second': measure_write_throughput(os.path.join(workdir, 'write.db'), args.single),
+        'api_latency_ms': api,
+        'simulator': simulator.get_stats()
+    }
+
+    with open(args.result_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+def run_suite(args):
+    """Прогоны по всем N в отдельных процессах"""
+    results = []
+    for lines in args.lines:
+        print(f"🔄 Прогон: {lines} лин., сценарий '{args.profile}', {args.duration} сек")
+        handle, result_file = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            '--single', str(lines),
+            '--result-file', result_file,
+            '--profile', args.profile,
+            '--duration', str(args.duration),
+            '--warmup', str(args.warmup),
+            '--interval', str(args.interval),
+            '--timeout', str(args.timeout),
+            '--requests', str(args.requests),
+            '--base-port', str(args.base_port),
+            '--speed', str(args.speed),
+        ]
+        output = None if args.verbose else subprocess.DEVNULL
+        completed = subprocess.run(command, stdout=output, stderr=output)
+        try:
+            if completed.returncode != 0:
+                raise RuntimeError(f'код завершения {completed.returncode}')
+            with open(result_file, encoding='utf-8') as f:
+                results.append(json.load(f))
+        except Exception as e:
+            print(f"❌ Прогон {lines} лин. не удался: {e}")
+        finally:
+            os.remove(result_file)
+    return results
+
+def flatten(result):
+    """Основные показатели прогона для таблицы"""
+    rows = {
+        'опросов/с': result['polls_per_second'],
+        'опросов/с по плану': result['planned_polls_per_second'],
+        'сбоев опроса': result['failed_polls'],
+        'RTT опроса, мс': result['poll_rtt_ms'],
+        'образец→БД p50, мс': result['sample_latency_ms']['p50'],
+        'образец→БД p99, мс': result['sample_latency_ms']['p99'],
+        'запись, оп/с': result['ingest_ops_per_second'],
+        'предел записи, строк/с': result['db_write_rows_per_second'],
+    }
+    for endpoint, timings in result['api_latency_ms'].items():
+        rows[f'{endpoint} p95, мс'] = timings['p95']
+    return rows
+
+def print_report(results, baseline=None):
+    baseline = {item['lines']: item for item in baseline or ()}
+    for result in results:
+        print(f"\n📊 {result['lines']} лин. ({result['profile']}, {result['duration']} сек)")
+        previous = flatten(baseline[result['lines']]) if result['lines'] in baseline else {}
+        for name, value in flatten(result).items():
+            line = f"  {name:<42} {value if value is not None else '-':>12}"
+            before = previous.get(name)
+            if before is not None and value is not None:
+                change = f"{(value - before) / before * 100:+.1f}%" if before else ''
+                line += f"   было {before:>12} {change}"
+            print(line)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест сбора данных на имитаторе Modbus')
+    parser.add_argument('--lines', default='1,5,20', help='числа линий через запятую')
+    parser.add_argument('--profile', default='steady', help='сценарий имитатора (simulator.PROFILES)')
+    parser.add_argument('--duration', type=float, default=30, help='секунды замера')
+    parser.add_argument('--warmup', type=float, default=5, help='секунды прогрева')
+    parser.add_argument('--interval', type=float, default=1, help='интервал опроса, секунды')
+    parser.add_argument('--timeout', type=float, default=2, help='таймаут опроса, секунды')
+    parser.add_argument('--requests', type=int, default=50, help='запросов на каждый API')
+    parser.add_argument('--base-port', type=int, default=15020)
+    parser.add_argument('--speed', type=float, default=1.0, help='ускорение времени сценария')
+    parser.add_argument('--save', help='сохранить результаты в JSON')
+    parser.add_argument('--compare', help='сравнить с сохраненными результатами')
+    parser.add_argument('--verbose', action='store_true', help='показывать вывод приложения')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.lines = [int(item) for item in args.lines.split(',') if item.strip()]
+    return args
+
+def main():
+    args = parse_args()
+    if args.single:
+        run_single(args)
+        # Фоновые потоки приложения не ждем
+        os._exit(0)
+
+    results = run_suite(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Результаты сохранены: {args.save}")
+
+if __name__ == '__main__':
+    main()
@@ -7,11 +7,28 @@ class Config:
     MODBUS_HOST = '10.0.0.175'
     MODBUS_PORT = 502
     MODBUS_DEVICE_ID = 175
+    MODBUS_TIMEOUT = 5  # секунды ожидания ответа
+    
+    # Постоянное подключение и переподключение с экспоненциальной задержкой
+    MODBUS_PERSISTENT_CONNECTION = True
+    MODBUS_RECONNECT_MIN_DELAY = 1   # секунды
+    MODBUS_RECONNECT_MAX_DELAY = 60  # секунды
     
     # Адреса счетчиков
     IVAMS_COUNTER_ADDR = 6000    # 32-битный общий счетчик (Big-endian)
     HOUR_COUNTER_ADDR = 6001     # 16-битный часовой счетчик
     AUX_COUNTER_ADDR = 6011      # 16-битный дополнительный счетчик
+    COUNTER_MAX = 2 ** 32        # разрядность общего счетчика
+    COUNTER_ROLLOVER_WINDOW = 100000  # окрестность нуля/максимума для распознавания переполнения и сброса
+    
+    # Карта регистров: по ней планируется минимальный набор блочных чтений
+    REGISTER_MAP = {
+        'ivams_total': {'address': IVAMS_COUNTER_ADDR, 'type': 'uint32'},
+        'hour_count': {'address': HOUR_COUNTER_ADDR, 'type': 'uint16'},
+        'aux_count': {'address': AUX_COUNTER_ADDR, 'type': 'uint16'},
+    }
+    MODBUS_MAX_READ_COUNT = 125  # максимум регистров в одном запросе (ограничение Modbus)
+    MODBUS_MAX_READ_GAP = 16     # неиспользуемые регистры, которые дешевле дочитать, чем делать новый запрос
     
     # === Настройки линии ===
     LINE_NAME = "Линия 5"
@@ -29,13 +46,107 @@ class Config:
     
     # === Настройки мониторинга простоев ===
     DOWNTIME_THRESHOLD = 3 * 60  # 3 минуты в секундах
+    MICRO_STOP_THRESHOLD = 30  # секунды без выпуска до микроостановки
+    DOWNTIME_RECOVERY_MIN = 30  # секунды устойчивого выпуска до завершения простоя
+    # Пороги по продукту: {'код продукта': {'micro_stop': 20, 'downtime': 120, 'recovery': 15}}
+    DOWNTIME_PRODUCT_THRESHOLDS = {}
+    DOWNTIME_FLUSH_INTERVAL = 60  # секунды между обновлениями длительности открытого простоя в БД
+    DOWNTIME_LOOKBACK_DAYS = 7  # насколько раньше диапазона искать начало простоя (пакетный OEE)
     POLLING_INTERVAL = 3  # секунды между опросами
     
+    # === Реестр линий: по одному контроллеру на линию ===
+    # Необязательные ключи линии (иначе берутся общие настройки):
+    # 'register_map', 'target_rate' (шт/час), 'target_shift_production', 'shifts',
+    # 'product' (продукт при запуске), 'downtime_thresholds' (пороги простоев линии),
+    # 'product_downtime_thresholds' ({продукт: пороги} только для этой линии)
+    # Первая линия - линия по умолчанию для API без параметра line.
+    DEVICES = [
+        {
+            'line_code': LINE_CODE,
+            'line_name': LINE_NAME,
+            'host': MODBUS_HOST,
+            'port': MODBUS_PORT,
+            'device_id': MODBUS_DEVICE_ID,
+            'polling_interval': POLLING_INTERVAL,
+            'timeout': MODBUS_TIMEOUT,  # предельное время одного опроса
+        },
+    ]
+    POLLER_WORKERS = 4  # потоки обработки результатов опроса (БД, OEE, простои)
+    
+    # Фиксированная сетка опроса: что делать с тиками, пропущенными из-за долгого опроса
+    POLLING_MISSED_TICK_POLICY = 'skip'  # 'skip' - пропустить, 'catch_up' - догнать
+    POLLING_MAX_CATCH_UP = 3  # максимум тиков подряд при догоне
+    
     # === Настройки OEE ===
     QUALITY_RATE = 0.98  # Плановый показатель качества (98%)
+    HISTORY_MAX_POINTS = 500     # максимум точек в ответе диапазонных запросов истории (LTTB)
+    HISTORY_MAX_BUCKETS = 50000  # максимум корзин до укрупнения (ограничивает стоимость запроса)
     
     # === Настройки БД ===
     DATABASE_URL = 'sqlite:///oee.db'
+    DATABASE_PATH = 'oee.db'
+    DATABASE_READ_POOL_SIZE = 4    # соединения только для чтения (запросы API)
+    DATABASE_CACHE_SIZE_KB = 8192  # кэш страниц SQLite на соединение
+    DATABASE_BUSY_TIMEOUT = 5000   # мс ожидания блокировки
+    
+    # Шарды: файл на линию (агрегаты, простои, отчеты) и на месяц сырых данных линии.
+    # При первом запуске с шардами данные DATABASE_PATH переносятся в SHARD_DIR
+    DATABASE_SHARDING = False
+    SHARD_DIR = 'data/shards'
+    SHARD_SEAL_GRACE = 3600        # секунды после конца месяца до перевода файла в режим только чтения
+    SHARD_MAX_ATTACHED = 8         # помесячных файлов в одном запросе (лимит ATTACH в SQLite - 10)
+    SHARD_READER_CACHE = 8         # простаивающих соединений чтения с присоединенными файлами
+    
+    # Отложенная пакетная запись (write-behind)
+    INGEST_BATCH_SIZE = 200      # операций в одной транзакции
+    INGEST_FLUSH_INTERVAL = 5    # секунды - максимальная задержка записи
+    INGEST_QUEUE_SIZE = 10000    # предел очереди, сверх него операции отбрасываются
+    INGEST_MAX_RETRIES = 3       # повторы записи пакета при ошибке БД
+
+    # Журнал показаний (кольцевой буфер в отображенном файле): опрос пишет в него до БД,
+    # выборки переживают блокировку БД и перезапуск процесса
+    JOURNAL_ENABLED = True
+    JOURNAL_PATH = 'data/journal.bin'
+    JOURNAL_CAPACITY = 65536         # записей по 80 байт (~5 МБ, одна линия при опросе 3 с - больше двух суток)
+    JOURNAL_RETRY_MAX_DELAY = 30     # секунды - предельная задержка повтора переноса при ошибке БД
+    
+    # Агрегаты минута/час/смена: интервал больше ROLLUP_GAP_FACTOR * интервал опроса считается пропуском
+    ROLLUP_GAP_FACTOR = 2
+
+    # Перерывы связи с устройством (device_outages): прирост счетчика за перерыв
+    # распределяется по его минутам и часам в minute_power/hourly_power
+    OUTAGE_BACKFILL_MAX_HOURS = 168  # более длинный перерыв не распределяется - прирост в минуту восстановления
+    
+    # Хранение сырых данных: старше срока - агрегаты в minute_power/hourly_power, сырые строки удаляются
+    RAW_RETENTION_DAYS = 30
+    RETENTION_ARCHIVE_PATH = None    # путь к архивной БД (например 'archive/oee_archive.db'), None - без архива
+    RETENTION_CHUNK_MINUTES = 60     # порция сырых данных на одну транзакцию
+    RETENTION_BATCH_SIZE = 5000      # строк oee_metrics на одну транзакцию
+    RETENTION_BATCH_PAUSE = 0.5      # секунды паузы между порциями
+    RETENTION_CHECK_INTERVAL = 3600  # секунды между проверками
+
+    # Сменные отчеты: расчет после закрытия смены (задержка больше INGEST_FLUSH_INTERVAL,
+    # чтобы последние выборки смены успели попасть в БД) и дозаполнение пропущенных смен
+    SHIFT_REPORT_DELAY = 60          # секунды после окончания смены
+    SHIFT_REPORT_BACKFILL_DAYS = 30  # глубина дозаполнения (не больше RAW_RETENTION_DAYS)
+
+    # Push обновлений dashboard (Server-Sent Events)
+    PUSH_CLIENT_QUEUE_SIZE = 100     # кадров в очереди клиента, при переполнении клиент отключается
+    PUSH_KEEPALIVE_INTERVAL = 15     # секунды между keepalive комментариями
+
+    # Сжатие ответов API (brotli используется, если установлен)
+    RESPONSE_COMPRESS_MIN_SIZE = 512  # байт, меньшие ответы не сжимаются
+    RESPONSE_GZIP_LEVEL = 6
+    RESPONSE_BROTLI_QUALITY = 5
+
+    # Кэш данных по закрытым дням (/api/minute_power/<date>, /api/hourly_power/<date>)
+    DAY_CACHE_SIZE = 64              # записей в LRU кэше
+    DAY_CACHE_GRACE = 120            # секунды после полуночи до закрытия дня (больше INGEST_FLUSH_INTERVAL)
+    DAY_CACHE_MAX_AGE = 86400        # Cache-Control max-age для закрытых дней
+
+    # Метрики опроса, записи и API (/metrics в формате Prometheus)
+    METRICS_ENABLED = True
+    METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # секунды
     
     # === Настройки Flask ===
     SECRET_KEY = 'your-secret-key-here'
@@ -1,272 +1,612 @@
 # database.py
+import os
 import sqlite3
 import json
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from config import Config
+from models import CounterTracker, LineRegistry, ShiftManager
+from migrations import apply_migrations
+from grid_codec import empty_minute_grid, minute_grid_to_rows
+from day_cache import DayCache
+from shards import ShardedConnections, month_of
+from metrics import DB_CALL, instrument_methods
+from array import array
 
+def utc_timestamp(timestamp=None):
+    """Время (по умолчанию текущее) в формате CURRENT_TIMESTAMP SQLite (UTC)"""
+    if timestamp is None:
+        moment = datetime.utcnow()
+    else:
+        moment = datetime.utcfromtimestamp(timestamp)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+class ConnectionManager:
+    """
+    Долгоживущие соединения SQLite
+
+    Одно соединение на запись (используется потоком опроса, доступ через
+    блокировку) и небольшой пул соединений только для чтения для API.
+    БД работает в режиме WAL, поэтому чтение не блокирует запись.
+    """
+
+    def __init__(self, db_path, read_pool_size=None):
+        self.config = Config
+        self.db_path = db_path
+        self.read_pool_size = read_pool_size or self.config.DATABASE_READ_POOL_SIZE
+        self.write_lock = threading.RLock()
+        self.write_conn = None
+        self.read_pool = queue.LifoQueue(maxsize=self.read_pool_size)
+        self.pool_lock = threading.Lock()
+        self.readers_created = 0
+
+    def _configure(self, conn):
+        """Общие настройки соединения"""
+        conn.execute(f'PRAGMA busy_timeout = {int(self.config.DATABASE_BUSY_TIMEOUT)}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.config.DATABASE_CACHE_SIZE_KB)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def _open_writer(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._configure(conn)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _open_reader(self):
+        conn = sqlite3.connect(
+            f'file:{self.db_path}?mode=ro',
+            uri=True,
+            check_same_thread=False
+        )
+        self._configure(conn)
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    @contextmanager
+    def writer(self, line_code=None, month=None):
+        """
+        Соединение на запись: транзакция фиксируется при выходе из блока
+
+        line_code и month - маршрутизация для ShardedConnections, для одного
+        файла не используются.
+        """
+        with self.write_lock:
+            if self.write_conn is None:
+                self.write_conn = self._open_writer()
+            try:
+                yield self.write_conn
+                self.write_conn.commit()
+            except Exception:
+                self.write_conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self, line_code=None, raw_range=None):
+        """Соединение только для чтения из пула (параметры - как у ShardedConnections.reader)"""
+        try:
+            conn = self.read_pool.get_nowait()
+        except queue.Empty:
+            with self.pool_lock:
+                can_create = self.readers_created < self.read_pool_size
+                if can_create:
+                    self.readers_created += 1
+            if can_create:
+                try:
+                    conn = self._open_reader()
+                except Exception:
+                    with self.pool_lock:
+                        self.readers_created -= 1
+                    raise
+            else:
+                # Пул исчерпан - ждем освобождения соединения
+                conn = self.read_pool.get()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.read_pool.put(conn)
+
+    def close(self):
+        """Закрытие всех соединений"""
+        with self.write_lock:
+            if self.write_conn is not None:
+                self.write_conn.close()
+                self.write_conn = None
+        while True:
+            try:
+                self.read_pool.get_nowait().close()
+            except queue.Empty:
+                break
+        with self.pool_lock:
+            self.readers_created = 0
+
+    def get_stats(self):
+        return {'mode': 'single', 'path': self.db_path, 'readers': self.readers_created}
+
+@instrument_methods(DB_CALL, exclude=('close',))
 class Database:
-    def __init__(self):
-        self.db_path = 'oee.db'
-        self._init_database()  # Переименовали метод
-    
+    def __init__(self, db_path=None, line_codes=None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        self.line_codes = line_codes or [Config.LINE_CODE]
+
+        # Один файл или шарды по линиям и месяцам (DATABASE_SHARDING)
+        self.sharded = Config.DATABASE_SHARDING
+        if self.sharded:
+            first_start = not os.path.isdir(Config.SHARD_DIR) or not os.listdir(Config.SHARD_DIR)
+            self.connections = ShardedConnections(
+                init_schema=self._create_schema, manager_class=ConnectionManager
+            )
+            if first_start and os.path.exists(self.db_path):
+                self._import_into_shards()
+            print(f"✅ Хранилище по линиям и месяцам: {Config.SHARD_DIR}")
+        else:
+            self.connections = ConnectionManager(self.db_path)
+            self._init_database()  # Переименовали метод
+
+        # Последние значения счетчиков держим в памяти - прирост считается без запросов
+        self.counters = CounterTracker()
+        self._seed_counters(line_codes)
+
+        # Агрегаты закрытых дней не меняются - читаем их из памяти
+        self.day_cache = DayCache()
+
     def _init_database(self):
         """Инициализация структуры БД"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Включаем foreign keys
-            cursor.execute('PRAGMA foreign_keys = ON')
-            
-            # Таблица для сырых данных
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS production_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    ivams_total INTEGER,
-                    hour_count INTEGER,
-                    aux_count INTEGER,
-                    production_delta INTEGER DEFAULT 0,
-                    line_code TEXT DEFAULT 'LINE_5'
-                )
-            ''')
-            
-            # Таблица для OEE показателей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS oee_metrics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    oee_percentage REAL,
-                    availability REAL,
-                    performance REAL,
-                    quality REAL,
-                    production_rate REAL
-                )
-            ''')
-            
-            # Таблица для сменных отчетов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS shift_reports (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    shift_date DATE,
-                    shift_number INTEGER,
-                    line_code TEXT DEFAULT 'LINE_5',
-                    total_production INTEGER,
-                    planned_production INTEGER,
-                    downtime_minutes INTEGER,
-                    oee_percentage REAL,
-                    availability REAL,
-                    performance REAL,
-                    quality REAL,
-                    actual_production_rate REAL
-                )
-            ''')
-            
-            # Таблица для мониторинга простоев
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS downtime_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    start_time DATETIME,
-                    end_time DATETIME,
-                    duration_seconds INTEGER,
-                    reason TEXT,
-                    line_code TEXT DEFAULT 'LINE_5',
-                    shift_number INTEGER,
-                    resolved BOOLEAN DEFAULT FALSE
-                )
-            ''')
-            
-            # Таблица для причин простоев (справочник)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS downtime_reasons (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    reason_code TEXT UNIQUE,
-                    reason_name TEXT,
-                    category TEXT,
-                    line_code TEXT DEFAULT 'LINE_5'
-                )
-            ''')
-            
-            # Таблица для хранения почасовой мощности (НОВАЯ ТАБЛИЦА)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS hourly_power (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date DATE,
-                    hour INTEGER,
-                    power_value REAL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(date, hour)
-                )
-            ''')
-            
-            # Начальное заполнение справочника причин простоев
-            cursor.execute('''
-                INSERT OR IGNORE INTO downtime_reasons 
-                (reason_code, reason_name, category) 
-                VALUES 
-                ('AUTO_DETECTED', 'Автоматически детектированный простой', 'Неопределенный'),
-                ('MAINTENANCE', 'Плановое техническое обслуживание', 'Плановый'),
-                ('MATERIAL_WAIT', 'Ожидание материалов', 'Организационный'),
-                ('QUALITY_ISSUE', 'Проблемы с качеством', 'Технический')
-            ''')
-
-            # поминутка:
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS minute_power (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date DATE,
-                    hour INTEGER,
-                    minute INTEGER,
-                    power_value REAL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(date, hour, minute)
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
+            with self.connections.writer() as conn:
+                self._create_schema(conn)
+
             print("✅ База данных инициализирована успешно")
-            
+
         except Exception as e:
             print(f"❌ Ошибка инициализации БД: {e}")
 
-    def save_production_data(self, data):
+    def _import_into_shards(self):
+        """Перенос однофайловой БД в шарды при первом запуске в режиме шардов"""
+        try:
+            source = ConnectionManager(self.db_path)
+            with source.writer() as conn:
+                self._create_schema(conn)
+            source.close()
+            self.connections.import_database(self.db_path, self.line_codes)
+        except Exception as e:
+            print(f"❌ Ошибка переноса {self.db_path} в шарды: {e}")
+
+    def _create_schema(self, conn):
+        """Таблицы, справочник причин простоев и миграции (для каждого файла БД)"""
+        cursor = conn.cursor()
+
+        # Таблица для сырых данных
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS production_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                ivams_total INTEGER,
+                hour_count INTEGER,
+                aux_count INTEGER,
+                production_delta INTEGER DEFAULT 0,
+                line_code TEXT
+            )
+        ''')
+
+        # Таблица для OEE показателей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS oee_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                oee_percentage REAL,
+                availability REAL,
+                performance REAL,
+                quality REAL,
+                production_rate REAL
+            )
+        ''')
+
+        # Таблица для сменных отчетов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS shift_reports (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                shift_date DATE,
+                shift_number INTEGER,
+                line_code TEXT,
+                total_production INTEGER,
+                planned_production INTEGER,
+                downtime_minutes INTEGER,
+                oee_percentage REAL,
+                availability REAL,
+                performance REAL,
+                quality REAL,
+                actual_production_rate REAL
+            )
+        ''')
+
+        # Таблица для мониторинга простоев
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS downtime_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                start_time DATETIME,
+                end_time DATETIME,
+                duration_seconds INTEGER,
+                reason TEXT,
+                line_code TEXT,
+                shift_number INTEGER,
+                resolved BOOLEAN DEFAULT FALSE
+            )
+        ''')
+
+        # Таблица для причин простоев (справочник)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS downtime_reasons (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                reason_code TEXT UNIQUE,
+                reason_name TEXT,
+                category TEXT,
+                line_code TEXT
+            )
+        ''')
+
+        # Таблица для хранения почасовой мощности (НОВАЯ ТАБЛИЦА)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS hourly_power (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date DATE,
+                hour INTEGER,
+                power_value REAL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(date, hour)
+            )
+        ''')
+
+        # Начальное заполнение справочника причин простоев
+        cursor.execute('''
+            INSERT OR IGNORE INTO downtime_reasons
+            (reason_code, reason_name, category)
+            VALUES
+            ('AUTO_DETECTED', 'Автоматически детектированный простой', 'Неопределенный'),
+            ('MAINTENANCE', 'Плановое техническое обслуживание', 'Плановый'),
+            ('MATERIAL_WAIT', 'Ожидание материалов', 'Организационный'),
+            ('QUALITY_ISSUE', 'Проблемы с качеством', 'Технический')
+        ''')
+
+        # поминутка:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS minute_power (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date DATE,
+                hour INTEGER,
+                minute INTEGER,
+                power_value REAL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(date, hour, minute)
+            )
+        ''')
+
+        # Индексы и изменения схемы существующих БД
+        apply_migrations(conn)
+
+    def close(self):
+        """Закрытие соединений с БД"""
+        self.connections.close()
+
+    def write_batch(self, operations):
+        """
+        Запись пакета операций одной транзакцией
+
+        Args:
+            operations: Список кортежей (имя операции, аргументы), где имя
+                соответствует методу _write_<имя>, например
+                ('minute_rollup', (bucket,))
+
+        В режиме шардов операции группируются по файлам, каждая группа -
+        своя транзакция; записанные группы удаляются из operations, чтобы
+        повтор пакета после ошибки не задвоил строки.
+        """
+        # Даты агрегатов для сброса кэша дней (до записи - в шардах operations сокращается)
+        dates = set()
+        for name, args in operations:
+            if name in ('minute_rollup', 'hourly_rollup'):
+                dates.add(args[0]['date'])
+
+        if self.sharded:
+            groups = {}
+            for operation in operations:
+                groups.setdefault(self._operation_shard(*operation), []).append(operation)
+        else:
+            groups = {(None, None): list(operations)}
+
+        for (line_code, month), group in groups.items():
+            with self.connections.writer(line_code, month) as conn:
+                cursor = conn.cursor()
+                for name, args in group:
+                    getattr(self, f'_write_{name}')(cursor, *args)
+            if self.sharded:
+                written = set(map(id, group))
+                operations[:] = [operation for operation in operations if id(operation) not in written]
+
+        # После фиксации сбрасываем кэш дней, агрегаты которых изменились
+        if dates:
+            self.invalidate_cached_days(dates)
+
+    # Позиция кода линии в аргументах операций write_batch (агрегаты - в самой корзине)
+    OPERATION_LINE_ARG = {
+        'production_data': 3,
+        'oee_metrics': 2,
+        'downtime_event': 2,
+        'downtime_close': 2,
+        'device_outage': 1
+    }
+
+    def _operation_shard(self, name, args):
+        """Файл операции write_batch: (линия, месяц для сырых выборок или None)"""
+        if name in ('minute_rollup', 'hourly_rollup'):
+            return args[0]['line_code'], None
+        position = self.OPERATION_LINE_ARG[name]
+        line_code = (args[position] if len(args) > position else None) or Config.LINE_CODE
+        if name in ('production_data', 'oee_metrics'):
+            return line_code, month_of(args[0])
+        return line_code, None
+
+    def is_day_closed(self, target_date):
+        """День закрыт: прошла полночь и последние агрегаты дня уже записаны"""
+        try:
+            day = datetime.strptime(target_date, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            return False
+        return datetime.now() >= day + timedelta(days=1, seconds=Config.DAY_CACHE_GRACE)
+
+    def invalidate_cached_days(self, dates=None):
+        """Сброс кэша по датам (None - полностью), например после дозаполнения агрегатов"""
+        self.day_cache.invalidate(dates)
+        if dates is None:
+            return
+
+        # Список дат меняется только с появлением новой даты (у любой из линий)
+        for line_code in LineRegistry.get_line_codes():
+            cached_dates = self.day_cache.get(('available_dates', None, line_code))
+            if cached_dates is not None and not set(dates) <= set(cached_dates):
+                self.day_cache.invalidate({None})
+                break
+
+    def _seed_counters(self, line_codes=None):
+        """Загрузка последних сохраненных значений счетчиков (один раз при старте)"""
+        try:
+            for line_code in line_codes or [Config.LINE_CODE]:
+                with self.connections.reader(line_code, (None, None)) as conn:
+                    row = conn.execute('''
+                        SELECT ivams_total FROM production_data
+                        WHERE line_code = ?
+                        ORDER BY timestamp DESC, id DESC LIMIT 1
+                    ''', (line_code,)).fetchone()
+                if row:
+                    self.counters.seed(line_code, row[0])
+        except Exception as e:
+            print(f"❌ Ошибка загрузки последних значений счетчиков: {e}")
+
+    def compute_production_delta(self, data, line_code=None):
+        """Прирост производства с предыдущего показания (из кэша в памяти)"""
+        return self.counters.update(line_code or Config.LINE_CODE, data.get('ivams_total'))
+
+    def save_production_data(self, data, line_code=None):
         """Сохранение данных производства"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Получаем предыдущее значение для расчета дельты
-            cursor.execute('''
-                SELECT ivams_total FROM production_data 
-                ORDER BY timestamp DESC LIMIT 1
-            ''')
-            last_row = cursor.fetchone()
-            
-            production_delta = 0
-            if last_row and data.get('ivams_total'):
-                production_delta = max(0, data['ivams_total'] - last_row[0])
-            
-            cursor.execute('''
-                INSERT INTO production_data 
-                (ivams_total, hour_count, aux_count, production_delta)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                data.get('ivams_total'), 
-                data.get('hour_count'), 
-                data.get('aux_count'), 
-                production_delta
-            ))
-            
-            conn.commit()
-            conn.close()
-            
+            line_code = line_code or Config.LINE_CODE
+            production_delta = self.compute_production_delta(data, line_code)
+            timestamp = utc_timestamp(data.get('timestamp'))
+
+            with self.connections.writer(line_code, month_of(timestamp)) as conn:
+                self._write_production_data(conn.cursor(), timestamp, data, production_delta, line_code)
+
             return production_delta
-            
+
         except Exception as e:
             print(f"❌ Ошибка сохранения production_data: {e}")
             return 0
 
-    def save_oee_metrics(self, oee_data):
+    def _write_production_data(self, cursor, timestamp, data, production_delta, line_code):
+        cursor.execute('''
+            INSERT INTO production_data
+            (timestamp, ivams_total, hour_count, aux_count, production_delta, line_code)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            timestamp,
+            data.get('ivams_total'),
+            data.get('hour_count'),
+            data.get('aux_count'),
+            production_delta,
+            line_code
+        ))
+
+    def save_oee_metrics(self, oee_data, line_code=None):
         """Сохранение OEE показателей"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO oee_metrics 
-                (oee_percentage, availability, performance, quality, production_rate)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                oee_data.get('oee_percentage', 0),
-                oee_data.get('availability', 0),
-                oee_data.get('performance', 0),
-                oee_data.get('quality', 0),
-                oee_data.get('production_rate', 0)
-            ))
-            
-            conn.commit()
-            conn.close()
+            timestamp = utc_timestamp()
+            with self.connections.writer(line_code, month_of(timestamp)) as conn:
+                self._write_oee_metrics(conn.cursor(), timestamp, oee_data, line_code)
             return True
         except Exception as e:
             print(f"❌ Ошибка сохранения OEE метрик: {e}")
             return False
 
-    def save_downtime_event(self, downtime_data, shift_number):
-        """Сохранение события простоя"""
+    def _write_oee_metrics(self, cursor, timestamp, oee_data, line_code=None):
+        cursor.execute('''
+            INSERT INTO oee_metrics
+            (timestamp, oee_percentage, availability, performance, quality, production_rate, line_code)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            timestamp,
+            oee_data.get('oee_percentage', 0),
+            oee_data.get('availability', 0),
+            oee_data.get('performance', 0),
+            oee_data.get('quality', 0),
+            oee_data.get('production_rate', 0),
+            line_code or Config.LINE_CODE
+        ))
+
+    def save_downtime_event(self, downtime_data, shift_number, line_code=None):
+        """Сохранение события простоя (открытие или обновление длительности)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Преобразуем timestamp в datetime строку
-            start_time = datetime.fromtimestamp(downtime_data['start_time']).isoformat()
-            
-            cursor.execute('''
-                INSERT INTO downtime_events 
-                (start_time, duration_seconds, reason, shift_number, line_code)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                start_time,
-                downtime_data.get('duration', 0),
-                downtime_data.get('reason', 'Неизвестно'),
-                shift_number,
-                'LINE_5'
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self.connections.writer(line_code) as conn:
+                self._write_downtime_event(conn.cursor(), downtime_data, shift_number, line_code)
+
             print(f"✅ Сохранен простой: {downtime_data.get('reason', 'Неизвестно')}")
             return True
         except Exception as e:
             print(f"❌ Ошибка сохранения события простоя: {e}")
             return False
 
-    def get_shift_data(self, shift_date, shift_number):
+    def _write_downtime_event(self, cursor, downtime_data, shift_number, line_code=None):
+        # Преобразуем timestamp в datetime строку
+        start_time = datetime.fromtimestamp(downtime_data['start_time']).isoformat()
+
+        # Одна строка на простой: повторная запись только обновляет длительность и причину
+        cursor.execute('''
+            INSERT INTO downtime_events
+            (start_time, duration_seconds, reason, shift_number, line_code)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(line_code, start_time) DO UPDATE SET
+                duration_seconds = excluded.duration_seconds,
+                reason = excluded.reason
+        ''', (
+            start_time,
+            downtime_data.get('duration', 0),
+            downtime_data.get('reason', 'Неизвестно'),
+            shift_number,
+            line_code or Config.LINE_CODE
+        ))
+
+    def _write_downtime_close(self, cursor, downtime_data, shift_number, line_code=None):
+        """Закрытие простоя: время окончания, итоговая длительность, resolved"""
+        start_time = datetime.fromtimestamp(downtime_data['start_time']).isoformat()
+        end_time = datetime.fromtimestamp(downtime_data['end_time']).isoformat()
+
+        cursor.execute('''
+            INSERT INTO downtime_events
+            (start_time, end_time, duration_seconds, reason, shift_number, line_code, resolved)
+            VALUES (?, ?, ?, ?, ?, ?, TRUE)
+            ON CONFLICT(line_code, start_time) DO UPDATE SET
+                end_time = excluded.end_time,
+                duration_seconds = excluded.duration_seconds,
+                reason = excluded.reason,
+                resolved = TRUE
+        ''', (
+            start_time,
+            end_time,
+            downtime_data.get('duration', 0),
+            downtime_data.get('reason', 'Неизвестно'),
+            shift_number,
+            line_code or Config.LINE_CODE
+        ))
+
+    def _write_device_outage(self, cursor, outage, line_code=None):
+        """Перерыв связи с устройством: одна строка, дополняется при восстановлении связи"""
+        start_time = datetime.fromtimestamp(outage['start_time']).isoformat()
+        end_time = datetime.fromtimestamp(outage['end_time']).isoformat() if outage.get('end_time') else None
+
+        cursor.execute('''
+            INSERT INTO device_outages
+            (line_code, start_time, end_time, duration_seconds, counter_before, counter_after, recovered_count, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(line_code, start_time) DO UPDATE SET
+                end_time = excluded.end_time,
+                duration_seconds = excluded.duration_seconds,
+                counter_after = excluded.counter_after,
+                recovered_count = excluded.recovered_count,
+                error = COALESCE(excluded.error, device_outages.error)
+        ''', (
+            line_code or Config.LINE_CODE,
+            start_time,
+            end_time,
+            round(outage.get('duration', 0), 1),
+            outage.get('counter_before'),
+            outage.get('counter_after'),
+            outage.get('recovered_count'),
+            outage.get('error')
+        ))
+
+    def get_device_outages(self, start, end, line_code=None):
+        """
+        Перерывы связи с устройством, пересекающие [start, end) (datetime, местное время)
+
+        Returns:
+            Список словарей перерывов (незакрытый перерыв - с end_time None)
+        """
+        try:
+            with self.connections.reader(line_code) as conn:
+                rows = conn.execute('''
+                    SELECT start_time, end_time, duration_seconds, counter_before,
+                           counter_after, recovered_count, error
+                    FROM device_outages
+                    WHERE line_code = ? AND start_time < ?
+                    AND (end_time IS NULL OR end_time >= ?)
+                    ORDER BY start_time
+                ''', (line_code or Config.LINE_CODE, end.isoformat(), start.isoformat())).fetchall()
+
+            return [{
+                'start_time': row[0],
+                'end_time': row[1],
+                'duration_seconds': row[2],
+                'counter_before': row[3],
+                'counter_after': row[4],
+                'recovered_count': row[5],
+                'error': row[6]
+            } for row in rows]
+        except Exception as e:
+            print(f"❌ Ошибка получения перерывов связи: {e}")
+            return []
+
+    def get_shift_data(self, shift_date, shift_number, line_code=None):
         """Получение данных по конкретной смене"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Упрощенный расчет времени смены
-            if shift_number == 1:
-                shift_start = f"{shift_date} 07:00:00"
-                shift_end = f"{shift_date} 19:00:00"
-            else:
-                shift_start = f"{shift_date} 19:00:00"
-                next_date = (datetime.strptime(shift_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-                shift_end = f"{next_date} 07:00:00"
-            
-            cursor.execute('''
-                SELECT 
-                    SUM(production_delta) as total_production,
-                    COUNT(*) as data_points
-                FROM production_data 
-                WHERE timestamp BETWEEN ? AND ?
-            ''', (shift_start, shift_end))
-            
-            production_data = cursor.fetchone()
-            
-            # Получаем данные о простоях
-            cursor.execute('''
-                SELECT SUM(duration_seconds) as total_downtime
-                FROM downtime_events 
-                WHERE shift_number = ? 
-                AND DATE(start_time) = ?
-            ''', (shift_number, shift_date))
-            
-            downtime_data = cursor.fetchone()
-            
-            conn.close()
-            
+            # Границы смены по ShiftManager (местное время)
+            shift_start, shift_end = ShiftManager.get_shift_window(shift_date, shift_number, line_code)
+
+            with self.connections.reader(line_code, (
+                utc_timestamp(shift_start.timestamp()), utc_timestamp(shift_end.timestamp())
+            )) as conn:
+                cursor = conn.cursor()
+
+                # production_data хранит время в UTC
+                cursor.execute('''
+                    SELECT
+                        SUM(production_delta) as total_production,
+                        COUNT(*) as data_points
+                    FROM production_data
+                    WHERE timestamp >= ? AND timestamp < ?
+                    AND line_code = ?
+                ''', (
+                    utc_timestamp(shift_start.timestamp()),
+                    utc_timestamp(shift_end.timestamp()),
+                    line_code or Config.LINE_CODE
+                ))
+
+                production_data = cursor.fetchone()
+
+                # Получаем данные о простоях (диапазон вместо DATE() - используется индекс)
+                cursor.execute('''
+                    SELECT SUM(duration_seconds) as total_downtime
+                    FROM downtime_events
+                    WHERE shift_number = ?
+                    AND start_time >= ? AND start_time < ?
+                    AND line_code = ?
+                ''', (shift_number, shift_start.isoformat(), shift_end.isoformat(), line_code or Config.LINE_CODE))
+
+                downtime_data = cursor.fetchone()
+
             result = {
                 'total_production': production_data[0] or 0,
                 'data_points': production_data[1] or 0,
                 'downtime_minutes': (downtime_data[0] or 0) / 60
             }
-            
-            print(f"📊 Данные смены {shift_number} за {shift_date}: {result}")
+
             return result
-            
+
         except Exception as e:
             print(f"❌ Ошибка получения данных смены: {e}")
             return {
@@ -275,27 +615,201 @@ class Database:
                 'downtime_minutes': 0
             }
 
-    def get_latest_data(self, limit=100):
+    def save_shift_report(self, report, line_code=None):
+        """Сохранение (перезапись) итогового отчета по смене"""
+        try:
+            with self.connections.writer(line_code) as conn:
+                conn.execute('''
+                    INSERT INTO shift_reports
+                    (shift_date, shift_number, line_code, total_production, planned_production,
+                     downtime_minutes, oee_percentage, availability, performance, quality,
+                     actual_production_rate, data_points, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(line_code, shift_date, shift_number) DO UPDATE SET
+                        total_production = excluded.total_production,
+                        planned_production = excluded.planned_production,
+                        downtime_minutes = excluded.downtime_minutes,
+                        oee_percentage = excluded.oee_percentage,
+                        availability = excluded.availability,
+                        performance = excluded.performance,
+                        quality = excluded.quality,
+                        actual_production_rate = excluded.actual_production_rate,
+                        data_points = excluded.data_points,
+                        created_at = excluded.created_at
+                ''', (
+                    report['shift_date'],
+                    report['shift_number'],
+                    line_code or Config.LINE_CODE,
+                    report['total_production'],
+                    report['planned_production'],
+                    report['downtime_minutes'],
+                    report['oee_percentage'],
+                    report['availability'],
+                    report['performance'],
+                    report['quality'],
+                    report['production_rate'],
+                    report['data_points']
+                ))
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения сменного отчета: {e}")
+            return False
+
+    def get_shift_report(self, shift_date, shift_number, line_code=None):
+        """Готовый отчет по смене или None, если смена еще не закрыта"""
+        try:
+            with self.connections.reader(line_code) as conn:
+                row = conn.execute('''
+                    SELECT total_production, data_points, downtime_minutes, planned_production,
+                           oee_percentage, availability, performance, quality, actual_production_rate
+                    FROM shift_reports
+                    WHERE line_code = ? AND shift_date = ? AND shift_number = ?
+                ''', (line_code or Config.LINE_CODE, shift_date, shift_number)).fetchone()
+
+            if row is None:
+                return None
+
+            return {
+                'total_production': row[0] or 0,
+                'data_points': row[1] or 0,
+                'downtime_minutes': row[2] or 0,
+                'planned_production': row[3],
+                'oee_percentage': row[4],
+                'availability': row[5],
+                'performance': row[6],
+                'quality': row[7],
+                'production_rate': row[8],
+                'finalized': True
+            }
+        except Exception as e:
+            print(f"❌ Ошибка получения сменного отчета: {e}")
+            return None
+
+    def get_shift_report_keys(self, line_code=None):
+        """Смены, по которым уже есть отчет: множество (дата, номер)"""
+        with self.connections.reader(line_code) as conn:
+            rows = conn.execute('''
+                SELECT shift_date, shift_number FROM shift_reports WHERE line_code = ?
+            ''', (line_code or Config.LINE_CODE,)).fetchall()
+        return {(row[0], row[1]) for row in rows}
+
+    def get_first_sample_time(self):
+        """Время самой ранней сырой выборки (местное) или None"""
+        first = None
+        # В режиме шардов сырые выборки каждой линии - в своих файлах
+        for line_code in self.line_codes if self.sharded else [None]:
+            with self.connections.reader(line_code, (None, None)) as conn:
+                row = conn.execute('''
+                    SELECT datetime(MIN(timestamp), 'localtime') FROM production_data
+                ''').fetchone()
+            if row and row[0] is not None and (first is None or row[0] < first):
+                first = row[0]
+        if first is None:
+            return None
+        return datetime.strptime(first, '%Y-%m-%d %H:%M:%S')
+
+    def get_production_series(self, start, end, line_code=None, by_minute=False):
+        """
+        Приросты производства за [start, end) для пакетного расчета
+
+        Пока сырые выборки хранятся - берутся они, для более старой части
+        диапазона - минутные суммы из minute_power (у строк, записанных до
+        статистики агрегатов, sample_count = 0 и выпуск - в power_value).
+
+        Args:
+            start, end: Границы диапазона (unix time)
+            by_minute: Суммировать сырые выборки по минутам внутри SQLite
+                (для корзин от минуты - в десятки раз меньше строк); сумма
+                неполной первой минуты помечается временем start
+
+        Returns:
+            Список кортежей (unix time, прирост)
+        """
+        retention_start = datetime.now().timestamp() - Config.RAW_RETENTION_DAYS * 86400
+        rows = []
+        with self.connections.reader(line_code, (
+            utc_timestamp(max(start, retention_start)), utc_timestamp(end)
+        )) as conn:
+            if start < retention_start:
+                first_day = datetime.fromtimestamp(start).date().isoformat()
+                rows.extend(conn.execute('''
+                    SELECT ts, delta FROM (
+                        SELECT
+                            CAST(strftime('%s', date || printf(' %02d:%02d:00', hour, minute), 'utc') AS INTEGER) AS ts,
+                            CASE WHEN sample_count > 0 THEN total_count ELSE power_value END AS delta
+                        FROM minute_power
+                        WHERE line_code = ? AND date >= ?
+                    )
+                    WHERE ts >= ? AND ts < ?
+                    ORDER BY ts
+                ''', (line_code or Config.LINE_CODE, first_day, start, min(end, retention_start))).fetchall())
+
+            if by_minute:
+                query = '''
+                    SELECT MAX(CAST(strftime('%s', timestamp) AS INTEGER) / 60 * 60, ?) AS ts, SUM(production_delta)
+                    FROM production_data
+                    WHERE timestamp >= ? AND timestamp < ?
+                    AND line_code = ?
+                    GROUP BY ts
+                    ORDER BY ts
+                '''
+            else:
+                query = '''
+                    SELECT CAST(strftime('%s', timestamp) AS INTEGER), production_delta
+                    FROM production_data
+                    WHERE timestamp >= ? AND timestamp < ?
+                    AND line_code = ?
+                    ORDER BY timestamp
+                '''
+            params = (max(start, retention_start),) if by_minute else ()
+            rows.extend(conn.execute(query, params + (
+                utc_timestamp(max(start, retention_start)),
+                utc_timestamp(end),
+                line_code or Config.LINE_CODE
+            )).fetchall())
+        return rows
+
+    def get_downtime_intervals(self, start, end, line_code=None):
+        """
+        Интервалы простоев, пересекающие [start, end)
+
+        Returns:
+            Список кортежей (начало, конец) в unix time; для незакрытого
+            простоя конец - начало плюс записанная длительность
+        """
+        # Простои длиннее DOWNTIME_LOOKBACK_DAYS, начавшиеся до диапазона, не учитываются
+        lookback = datetime.fromtimestamp(start - Config.DOWNTIME_LOOKBACK_DAYS * 86400).isoformat()
+        with self.connections.reader(line_code) as conn:
+            rows = conn.execute('''
+                SELECT
+                    CAST(strftime('%s', start_time, 'utc') AS INTEGER) AS started,
+                    COALESCE(
+                        CAST(strftime('%s', end_time, 'utc') AS INTEGER),
+                        CAST(strftime('%s', start_time, 'utc') AS INTEGER) + COALESCE(duration_seconds, 0)
+                    ) AS ended
+                FROM downtime_events
+                WHERE start_time >= ? AND start_time < ?
+                AND line_code = ?
+            ''', (lookback, datetime.fromtimestamp(end).isoformat(), line_code or Config.LINE_CODE)).fetchall()
+        return [row for row in rows if row[0] is not None and row[1] > start]
+
+    def get_latest_data(self, limit=100, line_code=None):
         """Получение последних записей"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT 
-                    datetime(timestamp, 'localtime') as local_time,
-                    ivams_total,
-                    hour_count,
-                    aux_count,
-                    production_delta
-                FROM production_data 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            ''', (limit,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
+            with self.connections.reader(line_code, (None, None)) as conn:
+                rows = conn.execute('''
+                    SELECT
+                        datetime(timestamp, 'localtime') as local_time,
+                        ivams_total,
+                        hour_count,
+                        aux_count,
+                        production_delta
+                    FROM production_data
+                    WHERE line_code = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                ''', (line_code or Config.LINE_CODE, limit)).fetchall()
+
             return [{
                 'timestamp': row[0],
                 'ivams_total': row[1],
@@ -307,28 +821,39 @@ class Database:
             print(f"❌ Ошибка получения последних данных: {e}")
             return []
 
-    def get_oee_history(self, limit=50):
+    def get_production_keys(self, start, end, line_code=None):
+        """
+        Записанные выборки линии за [start, end] (UTC строки) для проверки повторов
+
+        Returns:
+            Множество кортежей (timestamp, ivams_total)
+        """
+        with self.connections.reader(line_code, (start, end)) as conn:
+            rows = conn.execute('''
+                SELECT timestamp, ivams_total
+                FROM production_data
+                WHERE line_code = ? AND timestamp >= ? AND timestamp <= ?
+            ''', (line_code or Config.LINE_CODE, start, end)).fetchall()
+        return set(rows)
+
+    def get_oee_history(self, limit=50, line_code=None):
         """Получение истории OEE"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT 
-                    datetime(timestamp, 'localtime') as local_time,
-                    oee_percentage,
-                    availability,
-                    performance,
-                    quality,
-                    production_rate
-                FROM oee_metrics 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            ''', (limit,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
+            with self.connections.reader(line_code, (None, None)) as conn:
+                rows = conn.execute('''
+                    SELECT
+                        datetime(timestamp, 'localtime') as local_time,
+                        oee_percentage,
+                        availability,
+                        performance,
+                        quality,
+                        production_rate
+                    FROM oee_metrics
+                    WHERE line_code = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                ''', (line_code or Config.LINE_CODE, limit)).fetchall()
+
             return [{
                 'timestamp': row[0],
                 'oee_percentage': row[1],
@@ -340,237 +865,180 @@ class Database:
         except Exception as e:
             print(f"❌ Ошибка получения истории OEE: {e}")
             return []
-        
-    def save_hourly_power(self, hour, power_value):
-        """Сохранение почасовой мощности"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            today = datetime.now().date().isoformat()
-            
-            # Проверяем, есть ли уже запись за этот час сегодня
-            cursor.execute('''
-                SELECT id FROM hourly_power 
-                WHERE date = ? AND hour = ?
-            ''', (today, hour))
-            
-            existing_record = cursor.fetchone()
-            
-            if existing_record:
-                # Обновляем существующую запись, если новая мощность больше
-                cursor.execute('''
-                    UPDATE hourly_power 
-                    SET power_value = MAX(power_value, ?), timestamp = CURRENT_TIMESTAMP
-                    WHERE date = ? AND hour = ?
-                ''', (power_value, today, hour))
-            else:
-                # Вставляем новую запись
-                cursor.execute('''
-                    INSERT INTO hourly_power (date, hour, power_value)
-                    VALUES (?, ?, ?)
-                ''', (today, hour, power_value))
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"❌ Ошибка сохранения почасовой мощности: {e}")
-            return False
 
-    def get_today_hourly_power(self):
+    def get_today_hourly_power(self, line_code=None):
         """Получение почасовой мощности за сегодня"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             today = datetime.now().date().isoformat()
-            
-            cursor.execute('''
-                SELECT hour, power_value 
-                FROM hourly_power 
-                WHERE date = ? 
-                ORDER BY hour
-            ''', (today,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            # Создаем массив на 24 часа с нулевыми значениями
-            hourly_data = [0] * 24
-            for hour, power in rows:
-                if 0 <= hour < 24:
-                    hourly_data[hour] = float(power) if power else 0
-            
-            return hourly_data
+            return self._read_hourly_power(today, line_code)
         except Exception as e:
             print(f"❌ Ошибка получения почасовой мощности: {e}")
             return [0] * 24
 
-    def get_hourly_power_history(self, days=7):
+    def get_hourly_power_history(self, days=7, line_code=None):
         """Получение истории почасовой мощности за несколько дней"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             start_date = (datetime.now() - timedelta(days=days)).date().isoformat()
-            
-            cursor.execute('''
-                SELECT date, hour, power_value 
-                FROM hourly_power 
-                WHERE date >= ? 
-                ORDER BY date, hour
-            ''', (start_date,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
+
+            with self.connections.reader(line_code) as conn:
+                rows = conn.execute('''
+                    SELECT date, hour, power_value
+                    FROM hourly_power
+                    WHERE line_code = ? AND date >= ?
+                    ORDER BY date, hour
+                ''', (line_code or Config.LINE_CODE, start_date)).fetchall()
+
             # Группируем по дням
-     def save_minute_power(self, hour, minute, power_value):
-        """Сохранение поминутной мощности"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            today = datetime.now().date().isoformat()
-            
-            # Проверяем, есть ли уже запись за эту минуту сегодня
-            cursor.execute('''
-                SELECT id FROM minute_power 
-                WHERE date = ? AND hour = ? AND minute = ?
-            ''', (today, hour, minute))
-            
-            existing_record = cursor.fetchone()
-            
-            if existing_record:
-                # Обновляем существующую запись, если новая мощность больше
-                cursor.execute('''
-                    UPDATE minute_power 
-                    SET power_value = MAX(power_value, ?), timestamp = CURRENT_TIMESTAMP
-                    WHERE date = ? AND hour = ? AND minute = ?
-                ''', (power_value, today, hour, minute))
-            else:
-                # Вставляем новую запись
-                cursor.execute('''
-                    INSERT INTO minute_power (date, hour, minute, power_value)
-                    VALUES (?, ?, ?, ?)
-                ''', (today, hour, minute, power_value))
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"❌ Ошибка сохранения поминутной мощности: {e}")
-            return False
-
-    def get_today_minute_power(self):as e:
+            history = {}
+            for date, hour, power in rows:
+                day_data = history.setdefault(date, [0] * 24)
+                if 0 <= hour < 24:
+                    day_data[hour] = float(power) if power else 0
+
+            return history
+        except Exception as e:
             print(f"❌ Ошибка получения истории почасовой мощности: {e}")
-            return {}   
+            return {}
+
+    def _write_minute_rollup(self, cursor, bucket):
+        """Запись закрытой минутной корзины RollupEngine (мощность = шт за минуту)"""
+        cursor.execute('''
+            INSERT INTO minute_power
+            (line_code, date, hour, minute, power_value, total_count, min_delta, max_delta, sample_count, gap_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(line_code, date, hour, minute) DO UPDATE SET
+                total_count = minute_power.total_count + excluded.total_count,
+                power_value = minute_power.total_count + excluded.total_count,
+                min_delta = MIN(COALESCE(minute_power.min_delta, excluded.min_delta), excluded.min_delta),
+                max_delta = MAX(COALESCE(minute_power.max_delta, excluded.max_delta), excluded.max_delta),
+                sample_count = minute_power.sample_count + excluded.sample_count,
+                gap_seconds = minute_power.gap_seconds + excluded.gap_seconds,
+                timestamp = CURRENT_TIMESTAMP
+        ''', (
+            bucket['line_code'], bucket['date'], bucket['hour'], bucket['minute'], bucket['power_value'],
+            bucket['total'], bucket['min_delta'], bucket['max_delta'],
+            bucket['sample_count'], bucket['gap_seconds']
+        ))
+
+    def _write_hourly_rollup(self, cursor, bucket):
+        """Запись закрытой часовой корзины RollupEngine (мощность = средняя шт/мин)"""
+        cursor.execute('''
+            INSERT INTO hourly_power
+            (line_code, date, hour, power_value, total_count, min_delta, max_delta, sample_count, gap_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(line_code, date, hour) DO UPDATE SET
+                total_count = hourly_power.total_count + excluded.total_count,
+                power_value = (hourly_power.total_count + excluded.total_count) / 60.0,
+                min_delta = MIN(COALESCE(hourly_power.min_delta, excluded.min_delta), excluded.min_delta),
+                max_delta = MAX(COALESCE(hourly_power.max_delta, excluded.max_delta), excluded.max_delta),
+                sample_count = hourly_power.sample_count + excluded.sample_count,
+                gap_seconds = hourly_power.gap_seconds + excluded.gap_seconds,
+                timestamp = CURRENT_TIMESTAMP
+        ''', (
+            bucket['line_code'], bucket['date'], bucket['hour'], bucket['power_value'],
+            bucket['total'], bucket['min_delta'], bucket['max_delta'],
+            bucket['sample_count'], bucket['gap_seconds']
+        ))
+
+    def get_today_minute_power(self, line_code=None):
+        """Получение поминутной мощности за сегодня"""
+        return self.get_minute_power_by_date(datetime.now().date().isoformat(), line_code)
 
-    def save_minute_power(self, hour, minute, power_value):
-        """Сохранение поминутной мощности"""
+    def get_minute_power_by_date(self, target_date, line_code=None):
+        """Получение поминутной мощности за конкретную дату (24 списка по 60 значений)"""
+        return minute_grid_to_rows(self.get_minute_power_grid(target_date, line_code))
+
+    def get_minute_power_grid(self, target_date, line_code=None):
+        """Поминутная мощность за дату плоским массивом float32 (индекс час*60 + минута)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            today = datetime.now().date().isoformat()
-            
-                def get_today_minute_power(self):
-        """Получение поминутной мощности за сегодня"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            today = datetime.now().date().isoformat()
-            
-            cursor.execute('''
-                SELECT hour, minute, power_value 
-                FROM minute_power 
-                WHERE date = ? 
-                ORDER BY hour, minute
-            ''', (today,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            # Создаем массив 24×60 с нулевыми значениями
-            minute_data = [[0] * 60 for _ in range(24)]
-            
-            for hour, minute, power in rows:
-                if 0 <= hour < 24 and 0 <= minute < 60:
-                    minute_data[hour][minute] = float(power) if power else 0
-            
-            return minute_data
-        except Exception as e:
-            print(f"❌ Ошибка получения поминутной мощности: {e}")
-            return [[0] * 60 for _ in range(24)]
-
-    def get_minute_power_by_date(self, target_date):
-        """Получение поминутной мощности за конкретную дату"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT hour, minute, power_value 
-                FROM minute_power 
-                WHERE date = ? 
-                ORDER BY hour, minute
-            ''', (target_date,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            # Создаем массив 24×60 с нулевыми значениями
-            minute_data = [[0] * 60 for _ in range(24)]
-            
-            for hour, minute, power in rows:
-                if 0 <= hour < 24 and 0 <= minute < 60:
-                    minute_data[hour][minute] = float(power) if power else 0
-            
-            return minute_data
-        except Exception as e:
-            print(f"❌ Ошибка получения поминутной мощности за {target_date}: {e}")
-            return [[0] * 60 for _ in range(24)]
-
-    def get_available_dates(self):
-        """Получение списка доступных дат с данными"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT DISTINCT date 
-                FROM minute_power 
-                ORDER BY date DESC
-            ''')
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            return [row[0] for row in rows]
-        except Exception as e:
-            print(f"❌ Ошибка получения списка дат: {e}")
-            return []
-
-    def get_hourly_power_by_date(self, target_date):
-        """Получение почасовой мощности за конкретную дату"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT hour, power_value 
-                FROM hourly_p            return hourly_data
-        except Exception as e:
-            print(f"❌ Ошибка получения почасовой мощности за {target_date}: {e}")
-            return [0] * 24     minute_data = [[0] * 60 for _ in range(24)]
-            
-            for hour, minute, power in rows:
-                if 0 <= hour < 24 and 0 <= minute < 60:
-                    minute_data[hour][minute] = float(power) if power else 0
-            
+            line_code = line_code or Config.LINE_CODE
+            closed = self.is_day_closed(target_date)
+            if closed:
+                cached = self.day_cache.get(('minute_power', target_date, line_code))
+                if cached is not None:
+                    return array('f', cached)
+
+            minute_data = self._read_minute_power(target_date, line_code)
+            if closed:
+                self.day_cache.put(('minute_power', target_date, line_code), array('f', minute_data))
             return minute_data
         except Exception as e:
-            print(f"❌ Ошибка получения поминутной мощности: {e}")
-            return [[0] * 60 for _ in range(24)]            
\ No newline at end of file
+            print(f"❌ Ошибка получения поминутной мощности за {target_date}: {e}")
+            return empty_minute_grid()
+
+    def get_available_dates(self, line_code=None):
+        """Получение списка доступных дат с данными"""
+        try:
+            line_code = line_code or Config.LINE_CODE
+            cached = self.day_cache.get(('available_dates', None, line_code))
+            if cached is not None:
+                return list(cached)
+
+            with self.connections.reader(line_code) as conn:
+                rows = conn.execute('''
+                    SELECT DISTINCT date
+                    FROM minute_power
+                    WHERE line_code = ?
+                    ORDER BY date DESC
+                ''', (line_code,)).fetchall()
+
+            dates = [row[0] for row in rows]
+            self.day_cache.put(('available_dates', None, line_code), tuple(dates))
+            return dates
+        except Exception as e:
+            print(f"❌ Ошибка получения списка дат: {e}")
+            return []
+
+    def get_hourly_power_by_date(self, target_date, line_code=None):
+        """Получение почасовой мощности за конкретную дату"""
+        try:
+            line_code = line_code or Config.LINE_CODE
+            closed = self.is_day_closed(target_date)
+            if closed:
+                cached = self.day_cache.get(('hourly_power', target_date, line_code))
+                if cached is not None:
+                    return list(cached)
+
+            hourly_data = self._read_hourly_power(target_date, line_code)
+            if closed:
+                self.day_cache.put(('hourly_power', target_date, line_code), tuple(hourly_data))
+            return hourly_data
+        except Exception as e:
+            print(f"❌ Ошибка получения почасовой мощности за {target_date}: {e}")
+            return [0] * 24
+
+    def _read_hourly_power(self, target_date, line_code=None):
+        """Чтение почасовой мощности за дату в массив на 24 часа"""
+        with self.connections.reader(line_code) as conn:
+            rows = conn.execute('''
+                SELECT hour, power_value
+                FROM hourly_power
+                WHERE line_code = ? AND date = ?
+                ORDER BY hour
+            ''', (line_code or Config.LINE_CODE, target_date)).fetchall()
+
+        # Создаем массив на 24 часа с нулевыми значениями
+        hourly_data = [0] * 24
+        for hour, power in rows:
+            if 0 <= hour < 24:
+                hourly_data[hour] = float(power) if power else 0
+
+        return hourly_data
+
+    def _read_minute_power(self, target_date, line_code=None):
+        """Чтение поминутной мощности за дату в плоский массив 24×60"""
+        with self.connections.reader(line_code) as conn:
+            rows = conn.execute('''
+                SELECT hour, minute, power_value
+                FROM minute_power
+                WHERE line_code = ? AND date = ?
+            ''', (line_code or Config.LINE_CODE, target_date)).fetchall()
+
+        # Массив float32 на 1440 минут с нулевыми значениями
+        minute_data = empty_minute_grid()
+
+        for hour, minute, power in rows:
+            if 0 <= hour < 24 and 0 <= minute < 60 and power:
+                minute_data[hour * 60 + minute] = power
+
+        return minute_data
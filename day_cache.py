@@ -0,0 +1,56 @@
+# day_cache.py
+import threading
+from collections import OrderedDict
+from config import Config
+
+class DayCache:
+    """
+    LRU кэш данных по закрытым дням
+
+    Ключ - кортеж (вид данных, дата, линия). Прошедшие дни не меняются, поэтому
+    после первого чтения отдаются из памяти; при записи агрегатов за дату
+    (дозаполнение, поздние данные) записи этой даты сбрасываются.
+    """
+
+    def __init__(self, max_entries=None):
+        self.config = Config
+        self.max_entries = max_entries or self.config.DAY_CACHE_SIZE
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, dates=None):
+        """Сброс записей за указанные даты (None - весь кэш)"""
+        with self.lock:
+            if dates is None:
+                removed = len(self.entries)
+                self.entries.clear()
+            else:
+                keys = [key for key in self.entries if key[1] in dates]
+                removed = len(keys)
+                for key in keys:
+                    del self.entries[key]
+            self.stats['invalidations'] += removed
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+        return stats
@@ -0,0 +1,327 @@
+# downtime.py
+import threading
+import time
+from datetime import datetime
+from config import Config
+from models import LineRegistry
+from metrics import DOWNTIME_EVENTS
+
+# Состояния линии
+RUNNING = 'running'
+MICRO_STOP = 'micro_stop'
+DOWNTIME = 'downtime'
+RECOVERING = 'recovering'
+
+DEFAULT_REASON = "Автоматически детектированный простой"
+
+class LineStateMachine:
+    """
+    Автомат состояния одной линии: работа → микроостановка → простой → восстановление
+
+    Переходы считаются по времени выборки и факту выпуска (прирост счетчика
+    больше нуля), поэтому переполнение и сброс счетчика не дают ложных
+    переходов. Выборка без перехода - несколько сравнений без выделения
+    памяти; словари событий создаются только на переходах.
+
+    Гистерезис:
+      - микроостановка - нет выпуска дольше micro_stop секунд;
+      - простой - микроостановка дольше downtime секунд (начало простоя -
+        последний выпуск, как у микроостановки);
+      - простой завершается, только если выпуск идет recovery секунд без
+        перерыва дольше micro_stop; окончание простоя - начало
+        восстановления. Короткий пуск посреди простоя не дробит его на части.
+    """
+
+    __slots__ = (
+        'line_code', 'state', 'since', 'product', 'micro_stop', 'downtime', 'recovery',
+        'flush_interval', 'last_production', 'stop_start', 'recovery_start', 'reason',
+        'pending_reason', 'flushed_at', 'stats'
+    )
+
+    def __init__(self, line_code, thresholds, product=None, flush_interval=None):
+        self.line_code = line_code
+        self.state = RUNNING
+        self.since = None
+        self.product = product
+        self.flush_interval = flush_interval or Config.DOWNTIME_FLUSH_INTERVAL
+        self.last_production = None
+        self.stop_start = None
+        self.recovery_start = None
+        self.reason = None
+        self.pending_reason = None
+        self.flushed_at = None
+        self.stats = {
+            'micro_stops': 0,
+            'micro_stop_seconds': 0.0,
+            'downtimes': 0,
+            'downtime_seconds': 0.0
+        }
+        self.set_thresholds(thresholds)
+
+    def set_thresholds(self, thresholds):
+        self.micro_stop = thresholds['micro_stop']
+        self.downtime = thresholds['downtime']
+        self.recovery = thresholds['recovery']
+
+    def observe(self, timestamp, produced):
+        """
+        Учет выборки
+
+        Returns:
+            Список событий перехода или None
+        """
+        if self.last_production is None:
+            # Первая выборка: отсчет простоя - от нее
+            self.last_production = timestamp
+            self.since = timestamp
+            return None
+
+        if produced:
+            if self.state == RUNNING:
+                self.last_production = timestamp
+                return None
+            return self._produced(timestamp)
+
+        idle = timestamp - self.last_production
+        if self.state == RUNNING:
+            if idle < self.micro_stop and idle < self.downtime:
+                return None
+        elif self.state == DOWNTIME:
+            if timestamp - self.flushed_at < self.flush_interval:
+                return None
+        return self._idle(timestamp, idle)
+
+    def _produced(self, timestamp):
+        events = []
+        if self.state == MICRO_STOP:
+            duration = timestamp - self.stop_start
+            self.stats['micro_stops'] += 1
+            self.stats['micro_stop_seconds'] += duration
+            events.append(self._event('micro_stop_ended', timestamp, RUNNING, end_time=timestamp, duration=duration))
+            self.stop_start = None
+            self.pending_reason = None
+        elif self.state == DOWNTIME:
+            self.recovery_start = timestamp
+            events.append(self._event('recovery_started', timestamp, RECOVERING))
+
+        self.last_production = timestamp
+        if self.state == RECOVERING and timestamp - self.recovery_start >= self.recovery:
+            events.append(self._finish_downtime(timestamp))
+        return events
+
+    def _idle(self, timestamp, idle):
+        events = []
+        if self.state == RUNNING:
+            self.stop_start = self.last_production
+            events.append(self._event('micro_stop_started', timestamp, MICRO_STOP))
+
+        if self.state == MICRO_STOP and idle >= self.downtime:
+            self.reason = self.pending_reason or DEFAULT_REASON
+            self.pending_reason = None
+            self.flushed_at = timestamp
+            events.append(self._event('downtime_started', timestamp, DOWNTIME))
+        elif self.state == DOWNTIME:
+            self.flushed_at = timestamp
+            events.append(self._event('downtime_updated', timestamp, DOWNTIME))
+        elif self.state == RECOVERING and idle >= self.micro_stop:
+            # Выпуск снова встал до конца восстановления - тот же простой продолжается.
+            # Завершает простой только выпуск (_produced), а не выборка без выпуска
+            self.recovery_start = None
+            self.flushed_at = timestamp
+            events.append(self._event('downtime_resumed', timestamp, DOWNTIME))
+        return events
+
+    def _finish_downtime(self, timestamp):
+        end_time = self.recovery_start
+        duration = end_time - self.stop_start
+        self.stats['downtimes'] += 1
+        self.stats['downtime_seconds'] += duration
+        event = self._event('downtime_ended', timestamp, RUNNING, end_time=end_time, duration=duration)
+        self.stop_start = None
+        self.recovery_start = None
+        self.reason = None
+        return event
+
+    def _event(self, kind, timestamp, state, end_time=None, duration=None):
+        """Переход в state и событие о нем (поля совместимы с записью downtime_events)"""
+        if state != self.state:
+            self.state = state
+            self.since = timestamp
+        return {
+            'type': kind,
+            'line_code': self.line_code,
+            'timestamp': timestamp,
+            'state': state,
+            'product': self.product,
+            'start_time': self.stop_start,
+            'end_time': end_time,
+            'duration': duration if duration is not None else (self.recovery_start or timestamp) - self.stop_start,
+            'reason': self.reason
+        }
+
+    def set_reason(self, reason, timestamp):
+        """
+        Причина текущего простоя
+
+        Returns:
+            Событие reason_changed (простой идет), False - причина отложена
+            до простоя (идет микроостановка), None - остановки нет
+        """
+        if self.state in (DOWNTIME, RECOVERING):
+            self.reason = reason
+            return self._event('reason_changed', timestamp, self.state)
+        if self.state == MICRO_STOP:
+            self.pending_reason = reason
+            return False
+        return None
+
+    def describe(self, now=None):
+        """Текущая остановка для dashboard или None"""
+        if self.stop_start is None:
+            return None
+        now = now or time.time()
+        end = self.recovery_start or now
+        return {
+            'since': datetime.fromtimestamp(self.stop_start).isoformat(),
+            'duration': round(end - self.stop_start),
+            'reason': self.reason or self.pending_reason
+        }
+
+class DowntimeEngine:
+    """
+    Обнаружение простоев по всем линиям: автомат состояния на линию и подписчики на события
+
+    Движок опроса передает каждую выборку в observe(); работа автомата -
+    O(1) на выборку, поэтому сотни линий на каждом тике не нагружают CPU.
+    Запись в БД, метрики и журналирование - подписчики (subscribe), они
+    получают только переходы, а не пересчитывают простой на каждом опросе.
+
+    Пороги (micro_stop, downtime, recovery, секунды) - по линии и продукту
+    (LineRegistry.get_downtime_thresholds), вычисляются при смене продукта,
+    а не на каждой выборке.
+    """
+
+    def __init__(self, line_codes=None):
+        self.config = Config
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.machines = {}
+        self.stats = {'samples': 0, 'events': 0, 'subscriber_errors': 0}
+
+        for line_code in line_codes or LineRegistry.get_line_codes():
+            product = LineRegistry.get_setting(line_code, 'product', None)
+            self.machines[line_code] = LineStateMachine(
+                line_code,
+                LineRegistry.get_downtime_thresholds(line_code, product),
+                product
+            )
+
+    def subscribe(self, callback, events=None):
+        """
+        Подписка на события простоев
+
+        Args:
+            callback: Функция от словаря события (вызывается в потоке выборки)
+            events: Типы событий (по умолчанию - все)
+        """
+        self.subscribers.append((callback, frozenset(events) if events else None))
+
+    def observe(self, line_code, timestamp, production_delta):
+        """
+        Учет выборки линии
+
+        Returns:
+            Список событий, разосланных подписчикам
+        """
+        machine = self.machines.get(line_code)
+        if machine is None:
+            return []
+
+        with self.lock:
+            self.stats['samples'] += 1
+            events = machine.observe(timestamp, production_delta > 0)
+        if events:
+            self._emit(events)
+        return events or []
+
+    def _emit(self, events):
+        self.stats['events'] += len(events)
+        for event in events:
+            DOWNTIME_EVENTS.inc(line=event['line_code'], type=event['type'])
+            for callback, kinds in self.subscribers:
+                if kinds is not None and event['type'] not in kinds:
+                    continue
+                try:
+                    callback(event)
+                except Exception as e:
+                    self.stats['subscriber_errors'] += 1
+                    print(f"❌ Ошибка обработки события простоя {event['type']} ({event['line_code']}): {e}")
+
+    def set_reason(self, line_code, reason):
+        """
+        Причина простоя линии
+
+        Returns:
+            'applied' - причина текущего простоя, 'pending' - причина
+            простоя, который начнется после микроостановки, None - линия работает
+        """
+        with self.lock:
+            event = self.machines[line_code].set_reason(reason, time.time())
+        if event:
+            self._emit([event])
+            return 'applied'
+        return 'pending' if event is False else None
+
+    def set_product(self, line_code, product):
+        """
+        Смена продукта линии: пороги пересчитываются для следующих выборок
+
+        Returns:
+            Действующие пороги
+        """
+        thresholds = LineRegistry.get_downtime_thresholds(line_code, product)
+        machine = self.machines[line_code]
+        with self.lock:
+            machine.product = product
+            machine.set_thresholds(thresholds)
+        return thresholds
+
+    def get_downtime_status(self, line_code, now=None):
+        """Состояние линии для dashboard (раздел downtime_status)"""
+        machine = self.machines[line_code]
+        with self.lock:
+            return {
+                'is_downtime': machine.state in (DOWNTIME, RECOVERING),
+                'state': machine.state,
+                'info': machine.describe(now)
+            }
+
+    def get_status(self, line_code):
+        """Подробное состояние линии: автомат, продукт, пороги, счетчики остановок"""
+        machine = self.machines[line_code]
+        with self.lock:
+            return {
+                'state': machine.state,
+                'since': datetime.fromtimestamp(machine.since).isoformat() if machine.since else None,
+                'product': machine.product,
+                'thresholds': {
+                    'micro_stop': machine.micro_stop,
+                    'downtime': machine.downtime,
+                    'recovery': machine.recovery
+                },
+                'current': machine.describe(),
+                'stats': {key: round(value, 1) for key, value in machine.stats.items()}
+            }
+
+    def count_states(self):
+        """Число линий в каждом состоянии"""
+        counts = dict.fromkeys((RUNNING, MICRO_STOP, DOWNTIME, RECOVERING), 0)
+        with self.lock:
+            for machine in self.machines.values():
+                counts[machine.state] += 1
+        return counts
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['lines'] = self.count_states()
+        return stats
@@ -0,0 +1,57 @@
+# grid_codec.py
+import gzip
+import sys
+from array import array
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен - без него только gzip
+    brotli = None
+
+# Поминутная карта: 24 × 60 значений float32 (little-endian) по порядку час*60 + минута
+MINUTE_GRID_MEDIA_TYPE = 'application/x-minute-grid'
+MINUTE_GRID_SIZE = 24 * 60
+
+def empty_minute_grid():
+    """Пустая поминутная карта"""
+    return array('f', bytes(4 * MINUTE_GRID_SIZE))
+
+def minute_grid_to_rows(grid):
+    """Плоская карта → список из 24 списков по 60 значений (JSON формат)"""
+    return [[round(value, 2) for value in grid[hour * 60:(hour + 1) * 60]] for hour in range(24)]
+
+def pack_minute_grid(grid):
+    """Упаковка карты в байты float32 little-endian"""
+    if sys.byteorder == 'big':
+        grid = array('f', grid)
+        grid.byteswap()
+    return grid.tobytes()
+
+def wants_minute_grid(accept_mimetypes):
+    """
+    Клиент предпочитает бинарную карту JSON (по заголовку Accept)
+
+    Карта отдается, только если ее тип указан в Accept явно и с качеством
+    выше JSON: */* (curl, fetch, браузер) по-прежнему получает JSON.
+    """
+    grid_quality = max(
+        (quality for value, quality in accept_mimetypes if value.lower() == MINUTE_GRID_MEDIA_TYPE),
+        default=0
+    )
+    return grid_quality > 0 and grid_quality > accept_mimetypes.quality('application/json')
+
+def compress_body(body, accept_encodings):
+    """
+    Сжатие тела ответа по Accept-Encoding
+
+    Returns:
+        Кортеж (тело, Content-Encoding или None)
+    """
+    if len(body) < Config.RESPONSE_COMPRESS_MIN_SIZE:
+        return body, None
+    if brotli is not None and 'br' in accept_encodings:
+        return brotli.compress(body, quality=Config.RESPONSE_BROTLI_QUALITY), 'br'
+    if 'gzip' in accept_encodings:
+        return gzip.compress(body, compresslevel=Config.RESPONSE_GZIP_LEVEL, mtime=0), 'gzip'
+    return body, None
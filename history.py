@@ -0,0 +1,182 @@
+# history.py
+from datetime import datetime, timedelta
+import numpy as np
+from models import LineRegistry, ShiftManager
+from oee_batch import BatchOEECalculator
+from config import Config
+
+# Размеры корзин диапазонных запросов (shift и day - по календарю)
+BUCKETS = {
+    '1m': timedelta(minutes=1),
+    '5m': timedelta(minutes=5),
+    '1h': timedelta(hours=1),
+    'shift': None,
+    'day': timedelta(days=1)
+}
+BUCKET_ORDER = ('1m', '5m', '1h', 'shift', 'day')
+
+def align_to_bucket(moment, bucket, line_code=None):
+    """Начало корзины, в которую попадает момент (местное время, смены - по плану линии)"""
+    if bucket == '1m':
+        return moment.replace(second=0, microsecond=0)
+    if bucket == '5m':
+        return moment.replace(minute=moment.minute - moment.minute % 5, second=0, microsecond=0)
+    if bucket == '1h':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if bucket == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    shift_date, shift_number = ShiftManager.get_shift_key(moment, line_code)
+    window = ShiftManager.get_shift_window(shift_date, shift_number, line_code) if shift_number else None
+    return window[0] if window else moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def bucket_edges(start, end, bucket, line_code=None):
+    """
+    Границы корзин, покрывающих [start, end)
+
+    Returns:
+        Список datetime: начало первой корзины ... конец последней
+    """
+    edges = [align_to_bucket(start, bucket, line_code)]
+    while edges[-1] < end:
+        if bucket == 'shift':
+            shift_date, shift_number = ShiftManager.get_shift_key(edges[-1], line_code)
+            window = ShiftManager.get_shift_window(shift_date, shift_number, line_code) if shift_number else None
+            next_edge = window[1] if window and window[1] > edges[-1] else edges[-1] + timedelta(days=1)
+        else:
+            next_edge = edges[-1] + BUCKETS[bucket]
+        edges.append(next_edge)
+    return edges
+
+def bucket_for_seconds(seconds):
+    """Наименьшая календарная корзина не короче seconds (для запросов с корзиной в секундах)"""
+    for bucket in BUCKET_ORDER:
+        if BUCKETS[bucket] is not None and BUCKETS[bucket].total_seconds() >= seconds:
+            return bucket
+    return 'day'
+
+def choose_bucket(start, end, bucket, line_code=None):
+    """
+    Корзина, при которой число корзин не превышает HISTORY_MAX_BUCKETS
+
+    Слишком мелкая корзина для широкого диапазона укрупняется - стоимость
+    запроса ограничена независимо от ширины окна.
+    """
+    span = (end - start).total_seconds()
+    for candidate in BUCKET_ORDER[BUCKET_ORDER.index(bucket):]:
+        if span / bucket_seconds(candidate, line_code) <= Config.HISTORY_MAX_BUCKETS:
+            return candidate
+    return 'day'
+
+def bucket_seconds(bucket, line_code=None):
+    """Длительность корзины в секундах (для смены - самая короткая смена линии)"""
+    if bucket == 'shift':
+        return min(
+            ShiftManager.get_shift_duration(shift['number'], line_code)
+            for shift in LineRegistry.get_shifts(line_code)
+        ) * 60
+    return BUCKETS[bucket].total_seconds()
+
+def lttb(points, threshold, x_key='timestamp_unix', y_key='value'):
+    """
+    Прореживание ряда Largest-Triangle-Three-Buckets
+
+    Сохраняет первую и последнюю точки и из каждой группы выбирает точку,
+    образующую наибольший треугольник с соседними - форма графика
+    (пики и провалы) сохраняется при малом числе точек.
+    """
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+
+    x = np.array([point[x_key] for point in points], dtype=np.float64)
+    y = np.array([point[y_key] or 0 for point in points], dtype=np.float64)
+
+    sampled = [0]
+    every = (count - 2) / (threshold - 2)
+    previous = 0
+    for i in range(threshold - 2):
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+
+        # Среднее следующей группы - третья вершина треугольника
+        next_start = range_end
+        next_end = min(int((i + 2) * every) + 1, count)
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[range_start:range_end] - y[previous])
+            - (x[previous] - x[range_start:range_end]) * (avg_y - y[previous])
+        )
+        previous = range_start + int(np.argmax(areas))
+        sampled.append(previous)
+
+    sampled.append(count - 1)
+    return [points[index] for index in sampled]
+
+class HistoryQuery:
+    """
+    Диапазонные запросы истории с агрегацией по корзинам
+
+    Выпуск суммируется по поминутным суммам (сырые данные внутри SQLite,
+    для старых дней - minute_power), OEE считается BatchOEECalculator по тем
+    же корзинам. Ответ содержит не больше max_points точек (LTTB).
+    """
+
+    def __init__(self, db, calculator=None):
+        self.config = Config
+        self.db = db
+        self.calculator = calculator or BatchOEECalculator()
+
+    def production(self, start, end, bucket, line_code=None, max_points=None):
+        """Выпуск по корзинам: шт за корзину и средняя мощность шт/мин"""
+        bucket = choose_bucket(start, end, bucket, line_code)
+        edges = self._edges(start, end, bucket, line_code)
+        samples = self.db.get_production_series(edges[0], edges[-1], line_code, by_minute=True)
+        totals = BatchOEECalculator.sum_by_bucket(edges, samples)
+
+        points = []
+        for index, total in enumerate(totals.tolist()):
+            minutes = (edges[index + 1] - edges[index]) / 60
+            points.append({
+                'timestamp': datetime.fromtimestamp(edges[index]).isoformat(),
+                'timestamp_unix': edges[index],
+                'total_production': total,
+                'power_value': round(total / minutes, 2) if minutes else 0,
+                'value': total
+            })
+        return self._result(points, bucket, start, end, max_points)
+
+    def oee(self, start, end, bucket, line_code=None, max_points=None):
+        """OEE по корзинам"""
+        bucket = choose_bucket(start, end, bucket, line_code)
+        edges = self._edges(start, end, bucket, line_code)
+        series = self.calculator.calculate_edges_for_range(self.db, edges, line_code)
+
+        points = BatchOEECalculator.to_records(series)
+        for point, bucket_start in zip(points, edges):
+            point['timestamp_unix'] = bucket_start
+            point['value'] = point['oee_percentage']
+        return self._result(points, bucket, start, end, max_points)
+
+    @staticmethod
+    def _edges(start, end, bucket, line_code=None):
+        # Последняя корзина обрезается концом диапазона (текущий час/смена - по сей момент)
+        edges = [edge.timestamp() for edge in bucket_edges(start, end, bucket, line_code)]
+        edges[-1] = min(edges[-1], end.timestamp())
+        return edges
+
+    def _result(self, points, bucket, start, end, max_points):
+        max_points = min(max_points or self.config.HISTORY_MAX_POINTS, self.config.HISTORY_MAX_POINTS)
+        sampled = lttb(points, max_points)
+        for point in sampled:
+            point.pop('timestamp_unix', None)
+            point.pop('value', None)
+        return {
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'bucket': bucket,
+            'bucket_count': len(points),
+            'downsampled': len(sampled) < len(points),
+            'points': sampled
+        }
@@ -0,0 +1,152 @@
+# ingest.py
+import queue
+import threading
+import time
+from config import Config
+from metrics import INGEST_BATCH, INGEST_FLUSH
+
+class WriteBehindBuffer:
+    """
+    Отложенная пакетная запись в БД
+
+    Цикл опроса только ставит операции в ограниченную очередь и не ждет диска.
+    Фоновый поток собирает операции в пакет и записывает его одной
+    транзакцией (Database.write_batch), когда набран batch_size операций
+    или прошло flush_interval секунд с первой операции пакета.
+    При переполнении очереди новые операции отбрасываются и учитываются.
+    """
+
+    def __init__(self, db, batch_size=None, flush_interval=None, queue_size=None, max_retries=None):
+        self.config = Config
+        self.db = db
+        self.batch_size = batch_size or self.config.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or self.config.INGEST_FLUSH_INTERVAL
+        self.max_retries = max_retries if max_retries is not None else self.config.INGEST_MAX_RETRIES
+        self.queue = queue.Queue(maxsize=queue_size or self.config.INGEST_QUEUE_SIZE)
+        self.thread = None
+        self._stopping = threading.Event()
+        self._flush_requested = threading.Event()
+        self._stats_lock = threading.Lock()
+
+        self.stats = {
+            'submitted': 0,
+            'written': 0,
+            'dropped': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'max_queue_depth': 0,
+            'last_flush_size': 0,
+            'last_flush_ms': 0,
+            'last_error': None
+        }
+
+    def start(self):
+        """Запуск фонового потока записи"""
+        self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        """Остановка с записью накопленных операций"""
+        self._stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def flush(self):
+        """Запрос немедленной записи накопленного пакета"""
+        self._flush_requested.set()
+
+    def submit(self, operation, *args):
+        """
+        Постановка операции в очередь записи
+
+        Returns:
+            True если операция принята, False если отброшена из-за переполнения
+        """
+        try:
+            self.queue.put_nowait((operation, args))
+        except queue.Full:
+            with self._stats_lock:
+                self.stats['dropped'] += 1
+            return False
+
+        with self._stats_lock:
+            self.stats['submitted'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self.queue.qsize())
+        return True
+
+    def get_stats(self):
+        """Статистика очереди записи"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['queue_depth'] = self.queue.qsize()
+        return stats
+
+    def _run(self):
+        batch = []
+        batch_started = None
+        retries = 0
+
+        while True:
+            stopping = self._stopping.is_set()
+
+            # Ждем не дольше срока записи текущего пакета
+            timeout = 0.5
+            if batch_started is not None:
+                timeout = max(0.0, min(timeout, batch_started + self.flush_interval - time.monotonic()))
+
+            if len(batch) < self.batch_size:
+                # Собираем операции до заполнения пакета
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                    if batch_started is None:
+                        batch_started = time.monotonic()
+                    while len(batch) < self.batch_size:
+                        batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    pass
+            else:
+                # Пакет заполнен, но не записан - новые операции остаются в очереди
+                self._flush_requested.wait(timeout)
+
+            expired = batch_started is not None and time.monotonic() - batch_started >= self.flush_interval
+            full = len(batch) >= self.batch_size and not retries
+            if batch and (full or expired or self._flush_requested.is_set() or stopping):
+                self._flush_requested.clear()
+                if self._write(batch):
+                    batch, batch_started, retries = [], None, 0
+                else:
+                    retries += 1
+                    if retries > self.max_retries or stopping:
+                        # Пакет так и не записан - отбрасываем, чтобы не блокировать очередь
+                        with self._stats_lock:
+                            self.stats['dropped'] += len(batch)
+                        batch, batch_started, retries = [], None, 0
+                    else:
+                        # Повторим попытку через интервал
+                        batch_started = time.monotonic()
+
+            if stopping and self.queue.empty() and not batch:
+                break
+
+    def _write(self, batch):
+        started = time.monotonic()
+        try:
+            self.db.write_batch(batch)
+        except Exception as e:
+            print(f"❌ Ошибка пакетной записи в БД ({len(batch)} операций): {e}")
+            INGEST_FLUSH.observe(time.monotonic() - started, result='error')
+            with self._stats_lock:
+                self.stats['failed_flushes'] += 1
+                self.stats['last_error'] = str(e)
+            return False
+
+        duration = time.monotonic() - started
+        INGEST_FLUSH.observe(duration, result='ok')
+        INGEST_BATCH.observe(len(batch))
+
+        with self._stats_lock:
+            self.stats['written'] += len(batch)
+            self.stats['flushes'] += 1
+            self.stats['last_flush_size'] = len(batch)
+            self.stats['last_flush_ms'] = round(duration * 1000, 2)
+        return True
@@ -0,0 +1,337 @@
+# journal.py
+import mmap
+import os
+import struct
+import threading
+import zlib
+from config import Config
+from database import utc_timestamp
+
+# Заголовок: сигнатура, версия, размер записи, емкость, head (номер следующей записи),
+# tail (первая не перенесенная в БД запись)
+HEADER = struct.Struct('<8sIIQQQ')
+HEADER_SIZE = 64
+HEAD_OFFSET = 24
+TAIL_OFFSET = 32
+MAGIC = b'OEEJRNL1'
+VERSION = 1
+
+# Запись: номер, время опроса (unix), линия, счетчики, прирост; затем CRC32 полей
+RECORD = struct.Struct('<Qd32sIIIq')
+CRC = struct.Struct('<I')
+RECORD_SIZE = 80
+SEQUENCE = struct.Struct('<Q')
+
+class SampleJournal:
+    """
+    Журнал показаний счетчиков: кольцевой буфер в файле, отображенном в память
+
+    Опрос дописывает показание в журнал до любой записи в БД - это запись
+    в память процесса без системных вызовов, она не ждет блокировок SQLite.
+    Данные в отображенном файле переживают падение процесса (страницы
+    остаются в кэше ОС), flush() сбрасывает их на диск. JournalReplayer
+    переносит записи в БД и сдвигает tail. Если БД недоступна дольше, чем
+    вмещает кольцо, самые старые записи перезаписываются (учитываются в
+    stats['overwritten']).
+    """
+
+    def __init__(self, path=None, capacity=None):
+        self.config = Config
+        self.path = path or self.config.JOURNAL_PATH
+        self.capacity = capacity or self.config.JOURNAL_CAPACITY
+        self.lock = threading.Lock()
+        self.stats = {'appended': 0, 'replayed': 0, 'overwritten': 0, 'corrupted': 0}
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        size = HEADER_SIZE + self.capacity * RECORD_SIZE
+        with open(self.path, 'r+b' if os.path.exists(self.path) else 'w+b') as f:
+            header = f.read(HEADER.size)
+            if not self._header_matches(header):
+                if header:
+                    print(f"⚠️ Журнал {self.path} другого формата или емкости - создается заново")
+                f.truncate(0)
+                f.truncate(size)
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE, self.capacity, 0, 0))
+                f.flush()
+            self.mm = mmap.mmap(f.fileno(), size)
+
+        self.head = self._read_position(HEAD_OFFSET)
+        self.tail = self._read_position(TAIL_OFFSET)
+        # Записи, оставшиеся с прошлого запуска (могли попасть в БД до падения)
+        self.recovery_end = self.head
+
+    def _header_matches(self, header):
+        if len(header) < HEADER.size:
+            return False
+        magic, version, record_size, capacity, _, _ = HEADER.unpack(header)
+        return magic == MAGIC and version == VERSION and record_size == RECORD_SIZE and capacity == self.capacity
+
+    def _read_position(self, offset):
+        return SEQUENCE.unpack_from(self.mm, offset)[0]
+
+    def _write_position(self, offset, value):
+        SEQUENCE.pack_into(self.mm, offset, value)
+
+    def _slot(self, sequence):
+        return HEADER_SIZE + (sequence % self.capacity) * RECORD_SIZE
+
+    def append(self, line_code, production_data, production_delta):
+        """
+        Запись показания в журнал
+
+        Returns:
+            Номер записи
+        """
+        with self.lock:
+            sequence = self.head
+            body = RECORD.pack(
+                sequence,
+                production_data['timestamp'],
+                line_code.encode('utf-8')[:32],
+                production_data['ivams_total'] or 0,
+                production_data.get('hour_count') or 0,
+                production_data.get('aux_count') or 0,
+                production_delta
+            )
+            offset = self._slot(sequence)
+            self.mm[offset:offset + RECORD.size] = body
+            CRC.pack_into(self.mm, offset + RECORD.size, zlib.crc32(body))
+
+            # head сдвигается после записи - недописанная запись не будет прочитана
+            self.head = sequence + 1
+            self._write_position(HEAD_OFFSET, self.head)
+
+            if self.head - self.tail > self.capacity:
+                self.stats['overwritten'] += self.head - self.tail - self.capacity
+                self.tail = self.head - self.capacity
+                self._write_position(TAIL_OFFSET, self.tail)
+
+            self.stats['appended'] += 1
+            return sequence
+
+    def read(self, limit, start=None, end=None):
+        """
+        Записи, еще не перенесенные в БД (от tail или от start до end)
+
+        Returns:
+            Кортеж (список словарей записи: sequence, timestamp, line_code,
+            ivams_total, hour_count, aux_count, production_delta;
+            номер записи, следующей за прочитанными)
+        """
+        with self.lock:
+            start = max(self.tail, start if start is not None else self.tail)
+            end = min(self.head, start + limit, end if end is not None else self.head)
+            raw = [bytes(self.mm[self._slot(sequence):self._slot(sequence) + RECORD_SIZE]) for sequence in range(start, end)]
+
+        records = []
+        for expected, data in zip(range(start, end), raw):
+            body = data[:RECORD.size]
+            sequence, timestamp, line_code, ivams_total, hour_count, aux_count, delta = RECORD.unpack(body)
+            if sequence != expected or CRC.unpack_from(data, RECORD.size)[0] != zlib.crc32(body):
+                self.stats['corrupted'] += 1
+                continue
+            records.append({
+                'sequence': sequence,
+                'timestamp': timestamp,
+                'line_code': line_code.rstrip(b'\0').decode('utf-8'),
+                'ivams_total': ivams_total,
+                'hour_count': hour_count,
+                'aux_count': aux_count,
+                'production_delta': delta
+            })
+        return records, end
+
+    def commit(self, end):
+        """Записи до end (не включая) перенесены в БД"""
+        with self.lock:
+            if end > self.tail:
+                self.stats['replayed'] += end - self.tail
+                self.tail = end
+                self._write_position(TAIL_OFFSET, self.tail)
+
+    def pending(self):
+        with self.lock:
+            return self.head - self.tail
+
+    def flush(self):
+        """Сброс страниц журнала на диск"""
+        self.mm.flush()
+
+    def close(self):
+        self.flush()
+        self.mm.close()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['pending'] = self.head - self.tail
+        stats['capacity'] = self.capacity
+        stats['path'] = self.path
+        return stats
+
+class JournalReplayer:
+    """
+    Перенос показаний из журнала в БД
+
+    Фоновый поток пишет записи пакетами по INGEST_BATCH_SIZE одной
+    транзакцией (Database.write_batch), не реже INGEST_FLUSH_INTERVAL.
+    При ошибке БД записи остаются в журнале, перенос повторяется с растущей
+    задержкой - выборки не теряются, пока их вмещает кольцо.
+
+    recover() при старте переносит записи прошлого запуска: строки, которые
+    успели попасть в БД до падения, пропускаются, а последние показания
+    счетчиков подставляются в Database.counters - прирост первой новой
+    выборки считается от них, а не от отстающей БД.
+    """
+
+    def __init__(self, db, journal, batch_size=None, flush_interval=None):
+        self.config = Config
+        self.db = db
+        self.journal = journal
+        self.batch_size = batch_size or self.config.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or self.config.INGEST_FLUSH_INTERVAL
+        self.thread = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        # Пакет, записанный не целиком: (операции, номер записи после пакета)
+        self.unwritten = None
+        self.stats = {
+            'recovered': 0,
+            'duplicates_skipped': 0,
+            'failed_flushes': 0,
+            'last_error': None
+        }
+
+    def start(self):
+        """Запуск фонового потока переноса"""
+        self.thread = threading.Thread(target=self._run, name='journal-replayer', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        """Остановка с переносом накопленных записей"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.journal.flush()
+
+    def notify(self):
+        """Новая запись в журнале: перенос сразу, если набран пакет"""
+        if self.journal.pending() >= self.batch_size:
+            self._wakeup.set()
+
+    def recover(self):
+        """Перенос записей прошлого запуска (вызывается до начала опроса)"""
+        if self.journal.tail >= self.journal.recovery_end:
+            return
+
+        # Последние показания по линиям - из журнала, он впереди БД
+        last_values = {}
+        position = self.journal.tail
+        while position < self.journal.recovery_end:
+            records, position = self.journal.read(self.batch_size, position, self.journal.recovery_end)
+            for record in records:
+                last_values[record['line_code']] = record['ivams_total']
+        for line_code, value in last_values.items():
+            self.db.counters.seed(line_code, value)
+
+        try:
+            while self.journal.tail < self.journal.recovery_end:
+                self._replay(*self.journal.read(self.batch_size, end=self.journal.recovery_end))
+            print(f"✅ Журнал: перенесено {self.stats['recovered']} выборок прошлого запуска")
+        except Exception as e:
+            print(f"❌ Ошибка переноса журнала прошлого запуска (повтор в фоне): {e}")
+
+    def _replay(self, records, end):
+        """Запись прочитанных записей в БД и сдвиг tail журнала"""
+        if records and records[0]['sequence'] < self.journal.recovery_end:
+            fresh = self._skip_written(records)
+            self.stats['recovered'] += len(fresh)
+            self.stats['duplicates_skipped'] += len(records) - len(fresh)
+            records = fresh
+
+        self.unwritten = ([
+            ('production_data', (
+                utc_timestamp(record['timestamp']),
+                {
+                    'timestamp': record['timestamp'],
+                    'ivams_total': record['ivams_total'],
+                    'hour_count': record['hour_count'],
+                    'aux_count': record['aux_count']
+                },
+                record['production_delta'],
+                record['line_code']
+            ))
+            for record in records
+        ], end)
+        self._write_unwritten()
+
+    def _write_unwritten(self):
+        """
+        Запись пакета и сдвиг tail журнала
+
+        При ошибке пакет остается в self.unwritten и повторяется как есть:
+        в режиме шардов write_batch удаляет из списка уже записанные группы,
+        поэтому повтор не задваивает их строки.
+        """
+        operations, end = self.unwritten
+        if operations:
+            self.db.write_batch(operations)
+        self.unwritten = None
+        self.journal.commit(end)
+
+    def _skip_written(self, records):
+        """Записи без строки в БД (та же линия, время и показание счетчика)"""
+        by_line = {}
+        for record in records:
+            by_line.setdefault(record['line_code'], []).append(record)
+
+        fresh = []
+        for line_code, items in by_line.items():
+            written = self.db.get_production_keys(
+                utc_timestamp(items[0]['timestamp']),
+                utc_timestamp(items[-1]['timestamp']),
+                line_code
+            )
+            fresh.extend(
+                record for record in items
+                if (utc_timestamp(record['timestamp']), record['ivams_total']) not in written
+            )
+        return sorted(fresh, key=lambda record: record['sequence'])
+
+    def _run(self):
+        retry_delay = 0
+
+        while True:
+            stopping = self._stopping.is_set()
+            self._wakeup.wait(retry_delay or self.flush_interval)
+            self._wakeup.clear()
+
+            while self.unwritten is not None or self.journal.pending():
+                try:
+                    if self.unwritten is not None:
+                        self._write_unwritten()
+                    else:
+                        self._replay(*self.journal.read(self.batch_size))
+                except Exception as e:
+                    # Записи остаются в журнале - повторим с растущей задержкой
+                    pending = len(self.unwritten[0]) if self.unwritten is not None else self.journal.pending()
+                    print(f"❌ Ошибка переноса журнала в БД ({pending} выборок): {e}")
+                    self.stats['failed_flushes'] += 1
+                    self.stats['last_error'] = str(e)
+                    retry_delay = min(self.config.JOURNAL_RETRY_MAX_DELAY, max(1, retry_delay * 2))
+                    break
+                retry_delay = 0
+
+            self.journal.flush()
+            if stopping:
+                break
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update(self.journal.get_stats())
+        return stats
@@ -0,0 +1,261 @@
+# metrics.py
+"""
+Метрики опроса, записи и API в текстовом формате Prometheus (/metrics)
+
+Счетчики, показатели и гистограммы с метками хранятся в памяти процесса.
+Запись метрики - несколько операций под блокировкой метрики, без внешних
+зависимостей. Метрики с callback вычисляются в момент запроса /metrics.
+"""
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from config import Config
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Базовая метрика: имя, описание, имена меток и значения по наборам меток"""
+
+    type = None
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        if self.callback is None:
+            with self._lock:
+                values = dict(self._values)
+        else:
+            try:
+                values = self.callback()
+            except Exception as e:
+                print(f"⚠️ Ошибка расчета метрики {self.name}: {e}")
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        return [
+            f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+            for key, value in sorted(values.items())
+            if value is not None
+        ]
+
+class Counter(Metric):
+    """Монотонный счетчик"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Текущее значение"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(Metric):
+    """Гистограмма: число наблюдений по границам корзин, сумма и количество"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=None):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets or Config.METRICS_LATENCY_BUCKETS))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Наблюдения по корзинам (не накопленные), сумма, количество
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер замера длительности блока (секунды)"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+
+        lines = []
+        for key, (counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, observed in zip(self.buckets + (float('inf'),), counts):
+                cumulative += observed
+                labels = _format_labels(self.label_names, key, (('le', _format_value(bound)),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(round(total, 6))}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class MetricsRegistry:
+    """
+    Набор метрик процесса (порядок выдачи - порядок регистрации)
+
+    callback счетчика или показателя вызывается при выдаче метрик и
+    возвращает число или словарь {кортеж значений меток: число} - так
+    выдаются значения, которые уже считаются в других местах (статистика
+    очереди, состояние подключения).
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=(), callback=None):
+        return self.register(Counter(name, documentation, labels, callback))
+
+    def gauge(self, name, documentation, labels=(), callback=None):
+        return self.register(Gauge(name, documentation, labels, callback))
+
+    def histogram(self, name, documentation, labels=(), buckets=None):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+# Опрос устройств
+POLL_DURATION = REGISTRY.histogram(
+    'oee_poll_duration_seconds',
+    'Длительность тика опроса по этапам: read - чтение Modbus, handle - обработка, total - весь тик',
+    ('line', 'stage')
+)
+POLLS = REGISTRY.counter('oee_polls_total', 'Опросы устройств по результату', ('line', 'result'))
+MODBUS_RTT = REGISTRY.histogram('oee_modbus_rtt_seconds', 'Время отклика на запрос чтения регистров', ('line',))
+MODBUS_ERRORS = REGISTRY.counter('oee_modbus_errors_total', 'Ошибки обмена и подключения Modbus', ('line',))
+
+# База данных и очередь записи
+DB_CALL = REGISTRY.histogram('oee_db_call_seconds', 'Длительность вызова метода Database', ('method',))
+INGEST_FLUSH = REGISTRY.histogram('oee_ingest_flush_seconds', 'Запись пакета очереди одной транзакцией', ('result',))
+INGEST_BATCH = REGISTRY.histogram(
+    'oee_ingest_batch_operations',
+    'Операций в записанном пакете',
+    buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000)
+)
+
+# Простои
+DOWNTIME_EVENTS = REGISTRY.counter('oee_downtime_events_total', 'События автомата простоев по типу', ('line', 'type'))
+
+# Расчеты и API
+OEE_COMPUTE = REGISTRY.histogram('oee_compute_seconds', 'Расчет OEE: current - текущий, batch - пакетный по корзинам', ('kind',))
+HTTP_REQUEST = REGISTRY.histogram(
+    'oee_http_request_seconds',
+    'Обработка запроса API по маршруту',
+    ('route', 'method', 'status')
+)
+
+def timed(histogram, **labels):
+    """Декоратор: длительность вызова функции в гистограмму"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+def instrument_methods(histogram, exclude=()):
+    """
+    Декоратор класса: длительность каждого публичного метода в гистограмму
+    с меткой method (при METRICS_ENABLED = False класс не меняется)
+    """
+    def decorator(cls):
+        if not Config.METRICS_ENABLED:
+            return cls
+        for name, attribute in list(vars(cls).items()):
+            if name.startswith('_') or name in exclude or not inspect.isfunction(attribute):
+                continue
+            setattr(cls, name, timed(histogram, method=name)(attribute))
+        return cls
+    return decorator
+
+def install_flask(app):
+    """Замер длительности запросов Flask по шаблону маршрута (/api/minute_power/<date>)"""
+    from flask import g, request
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            HTTP_REQUEST.observe(
+                time.perf_counter() - started,
+                route=request.url_rule.rule if request.url_rule else 'unmatched',
+                method=request.method,
+                status=response.status_code
+            )
+        return response
@@ -0,0 +1,179 @@
+# migrations.py
+"""
+Версионированные миграции схемы БД
+
+Номер примененной миграции хранится в PRAGMA user_version, поэтому
+существующие файлы oee.db обновляются на месте при старте приложения.
+Шаг миграции - SQL строка или функция, принимающая соединение.
+"""
+from config import Config
+
+# Колонки агрегатов мощности после миграции 2 (без id и line_code)
+POWER_COLUMNS = {
+    'minute_power': ('date', 'hour', 'minute', 'power_value', 'timestamp',
+                     'total_count', 'min_delta', 'max_delta', 'sample_count', 'gap_seconds'),
+    'hourly_power': ('date', 'hour', 'power_value', 'timestamp',
+                     'total_count', 'min_delta', 'max_delta', 'sample_count', 'gap_seconds'),
+}
+
+def _add_line_code_to_power_tables(conn):
+    """
+    Пересоздание minute_power / hourly_power с колонкой line_code
+
+    UNIQUE(date, hour[, minute]) нельзя изменить через ALTER TABLE, поэтому
+    таблицы копируются; существующие строки относятся к линии по умолчанию.
+    """
+    for table, columns in POWER_COLUMNS.items():
+        key = 'date, hour, minute' if table == 'minute_power' else 'date, hour'
+        conn.execute(f'''
+            CREATE TABLE {table}_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                line_code TEXT NOT NULL,
+                date DATE,
+                hour INTEGER,
+                {'minute INTEGER,' if table == 'minute_power' else ''}
+                power_value REAL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                total_count INTEGER DEFAULT 0,
+                min_delta INTEGER,
+                max_delta INTEGER,
+                sample_count INTEGER DEFAULT 0,
+                gap_seconds REAL DEFAULT 0,
+                UNIQUE(line_code, {key})
+            )
+        ''')
+        column_list = ', '.join(columns)
+        conn.execute(f'''
+            INSERT INTO {table}_new (id, line_code, {column_list})
+            SELECT id, ?, {column_list} FROM {table}
+        ''', (Config.LINE_CODE,))
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+def _assign_default_line(conn):
+    """Строки без линии относятся к линии по умолчанию"""
+    for table in ('production_data', 'oee_metrics', 'downtime_events', 'shift_reports'):
+        conn.execute(f'UPDATE {table} SET line_code = ? WHERE line_code IS NULL', (Config.LINE_CODE,))
+
+MIGRATIONS = [
+    (1, 'Индексы по времени и покрывающие индексы для сменных отчетов', [
+        # Выборки по времени; SUM(production_delta) по смене читается только из индекса
+        'CREATE INDEX IF NOT EXISTS idx_production_data_timestamp_delta '
+        'ON production_data(timestamp, production_delta)',
+        'CREATE INDEX IF NOT EXISTS idx_oee_metrics_timestamp '
+        'ON oee_metrics(timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_downtime_events_start_time '
+        'ON downtime_events(start_time)',
+        # SUM(duration_seconds) по смене читается только из индекса
+        'CREATE INDEX IF NOT EXISTS idx_downtime_events_shift '
+        'ON downtime_events(shift_number, start_time, duration_seconds)',
+    ]),
+    (2, 'Статистика агрегатов в minute_power и hourly_power', [
+        'ALTER TABLE minute_power ADD COLUMN total_count INTEGER DEFAULT 0',
+        'ALTER TABLE minute_power ADD COLUMN min_delta INTEGER',
+        'ALTER TABLE minute_power ADD COLUMN max_delta INTEGER',
+        'ALTER TABLE minute_power ADD COLUMN sample_count INTEGER DEFAULT 0',
+        'ALTER TABLE minute_power ADD COLUMN gap_seconds REAL DEFAULT 0',
+        'ALTER TABLE hourly_power ADD COLUMN total_count INTEGER DEFAULT 0',
+        'ALTER TABLE hourly_power ADD COLUMN min_delta INTEGER',
+        'ALTER TABLE hourly_power ADD COLUMN max_delta INTEGER',
+        'ALTER TABLE hourly_power ADD COLUMN sample_count INTEGER DEFAULT 0',
+        'ALTER TABLE hourly_power ADD COLUMN gap_seconds REAL DEFAULT 0',
+    ]),
+    (3, 'Одна строка на простой в downtime_events', [
+        # Раньше простой записывался на каждом опросе - оставляем последнюю (самую длинную) строку
+        '''
+        DELETE FROM downtime_events
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM downtime_events
+            GROUP BY line_code, start_time
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_downtime_events_line_start '
+        'ON downtime_events(line_code, start_time)',
+    ]),
+    (4, 'Один отчет на смену и линию в shift_reports', [
+        'ALTER TABLE shift_reports ADD COLUMN data_points INTEGER DEFAULT 0',
+        'ALTER TABLE shift_reports ADD COLUMN created_at DATETIME',
+        '''
+        DELETE FROM shift_reports
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM shift_reports
+            GROUP BY line_code, shift_date, shift_number
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_shift_reports_shift '
+        'ON shift_reports(line_code, shift_date, shift_number)',
+    ]),
+    (5, 'Код линии во всех таблицах и индексах', [
+        'ALTER TABLE oee_metrics ADD COLUMN line_code TEXT',
+        _assign_default_line,
+        _add_line_code_to_power_tables,
+        'CREATE INDEX IF NOT EXISTS idx_production_data_line_timestamp '
+        'ON production_data(line_code, timestamp, production_delta)',
+        'CREATE INDEX IF NOT EXISTS idx_oee_metrics_line_timestamp '
+        'ON oee_metrics(line_code, timestamp)',
+        'DROP INDEX IF EXISTS idx_downtime_events_shift',
+        'CREATE INDEX IF NOT EXISTS idx_downtime_events_line_shift '
+        'ON downtime_events(line_code, shift_number, start_time, duration_seconds)',
+    ]),
+    (6, 'Перерывы связи с устройствами в device_outages', [
+        '''
+        CREATE TABLE IF NOT EXISTS device_outages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            line_code TEXT NOT NULL,
+            start_time DATETIME,
+            end_time DATETIME,
+            duration_seconds REAL,
+            counter_before INTEGER,
+            counter_after INTEGER,
+            recovered_count INTEGER,
+            error TEXT
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_device_outages_line_start '
+        'ON device_outages(line_code, start_time)',
+    ]),
+]
+
+
+def get_schema_version(conn):
+    """Текущая версия схемы"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def apply_migrations(conn, migrations=None):
+    """
+    Применение всех миграций новее текущей версии схемы
+
+    Каждая миграция выполняется в отдельной транзакции вместе с обновлением
+    user_version, поэтому прерванная миграция будет повторена целиком.
+
+    Returns:
+        Версия схемы после применения миграций
+    """
+    current_version = get_schema_version(conn)
+
+    for version, description, steps in migrations or MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN')
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        current_version = version
+        print(f"✅ Миграция БД {version}: {description}")
+
+    return current_version
@@ -1,28 +1,234 @@
 # modbus_client.py
-from pymodbus.client import ModbusTcpClient
+import asyncio
+from pymodbus.client import ModbusTcpClient, AsyncModbusTcpClient
+from pymodbus.exceptions import ConnectionException
+from pymodbus.pdu import ExceptionResponse
 import time
 from config import Config
+from metrics import MODBUS_ERRORS, MODBUS_RTT
+
+# Количество регистров, занимаемых значением каждого типа
+REGISTER_WIDTHS = {
+    'uint16': 1,
+    'uint32': 2,
+}
+
+
+def plan_read_spans(register_map, max_gap=None, max_count=None):
+    """
+    Планирование минимального набора непрерывных чтений по карте регистров
+    
+    Соседние значения объединяются в один запрос, если промежуток между ними
+    не больше max_gap регистров, а длина запроса не превышает max_count.
+    
+    Returns:
+        Список кортежей (начальный адрес, количество регистров)
+    """
+    if max_gap is None:
+        max_gap = Config.MODBUS_MAX_READ_GAP
+    if max_count is None:
+        max_count = Config.MODBUS_MAX_READ_COUNT
+    
+    ranges = sorted(
+        (item['address'], item['address'] + REGISTER_WIDTHS[item['type']])
+        for item in register_map.values()
+    )
+    
+    spans = []
+    for start, end in ranges:
+        if spans:
+            span_start, span_end = spans[-1]
+            if start - span_end <= max_gap and max(end, span_end) - span_start <= max_count:
+                spans[-1] = (span_start, max(end, span_end))
+                continue
+        spans.append((start, end))
+    
+    return [(start, end - start) for start, end in spans]
+
+
+def decode_registers(register_map, blocks):
+    """
+    Декодирование значений из прочитанных блоков регистров
+    
+    Args:
+        register_map: Карта регистров {имя: {'address', 'type'}}
+        blocks: Словарь {начальный адрес блока: список регистров}
+    
+    Returns:
+        Словарь {имя: значение}; None для значений, не попавших в блоки
+    """
+    values = {}
+    for name, item in register_map.items():
+        address = item['address']
+        width = REGISTER_WIDTHS[item['type']]
+        values[name] = None
+        
+        for start, registers in blocks.items():
+            offset = address - start
+            if 0 <= offset and offset + width <= len(registers):
+                words = registers[offset:offset + width]
+                if width == 2:
+                    # Big-endian: (reg1 << 16) | reg2
+                    values[name] = (words[0] << 16) | words[1]
+                else:
+                    values[name] = words[0]
+                break
+    return values
+
 
 class ProductionMonitor:
-    def __init__(self):
+    def __init__(self, persistent=None, device=None):
         self.config = Config
-        self.client = ModbusTcpClient(
-            self.config.MODBUS_HOST, 
-            port=self.config.MODBUS_PORT, 
-            timeout=5
+        
+        # Параметры устройства (по умолчанию - устройство из Config)
+        device = device or {}
+        self.host = device.get('host', self.config.MODBUS_HOST)
+        self.port = device.get('port', self.config.MODBUS_PORT)
+        self.device_id = device.get('device_id', self.config.MODBUS_DEVICE_ID)
+        self.line_code = device.get('line_code', self.config.LINE_CODE)
+        self.timeout = device.get('timeout', self.config.MODBUS_TIMEOUT)
+        
+        self.client = self._create_client()
+        self.register_map = device.get('register_map', self.config.REGISTER_MAP)
+        self.read_spans = plan_read_spans(self.register_map)
+        
+        # Постоянное подключение: сокет не закрывается между опросами
+        if persistent is None:
+            persistent = self.config.MODBUS_PERSISTENT_CONNECTION
+        self.persistent = persistent
+        
+        # Экспоненциальная задержка переподключения
+        self.reconnect_delay = 0
+        self.next_connect_attempt = 0
+        self.was_connected = False
+        
+        # Состояние подключения
+        self.health = {
+            'connected': False,
+            'persistent': self.persistent,
+            'reconnect_count': 0,
+            'consecutive_failures': 0,
+            'last_error': None,
+            'last_error_time': None,
+            'last_rtt_ms': None,
+            'avg_rtt_ms': None,
+            'next_retry_in': 0
+        }
+    
+    def _create_client(self):
+        """Создание Modbus клиента"""
+        return ModbusTcpClient(
+            self.host, 
+            port=self.port, 
+            timeout=self.timeout
+        )
+    
+    def _connect(self):
+        """Подключение к устройству с учетом задержки переподключения"""
+        if self.persistent and self.client.connected:
+            return True
+        
+        if self._in_backoff():
+            return False
+        
+        if not self.client.connect():
+            self._connection_failed("Не удалось подключиться к устройству")
+            return False
+        
+        self._connection_established()
+        return True
+    
+    def _in_backoff(self):
+        """Проверка, не истекла ли еще задержка перед переподключением"""
+        now = time.monotonic()
+        if now < self.next_connect_attempt:
+            self.health['next_retry_in'] = round(self.next_connect_attempt - now, 1)
+            return True
+        return False
+    
+    def _connection_established(self):
+        """Учет успешного подключения"""
+        if self.was_connected:
+            self.health['reconnect_count'] += 1
+        self.was_connected = True
+        self.health['connected'] = True
+    
+    def _release(self):
+        """Закрытие сокета после чтения (только в режиме без постоянного подключения)"""
+        if not self.persistent:
+            self.client.close()
+            self.health['connected'] = False
+    
+    def _connection_failed(self, error):
+        """Обработка обрыва: закрываем сокет и откладываем следующую попытку"""
+        self.client.close()
+        
+        self.reconnect_delay = min(
+            self.config.MODBUS_RECONNECT_MAX_DELAY,
+            max(self.config.MODBUS_RECONNECT_MIN_DELAY, self.reconnect_delay * 2)
         )
+        self.next_connect_attempt = time.monotonic() + self.reconnect_delay
+        
+        self.health['connected'] = False
+        self.health['consecutive_failures'] += 1
+        MODBUS_ERRORS.inc(line=self.line_code)
+        self.health['last_error'] = str(error)
+        self.health['last_error_time'] = time.time()
+        self.health['next_retry_in'] = self.reconnect_delay
+    
+    def _read_succeeded(self, rtt):
+        """Фиксация успешного обмена: сброс задержки и учет времени отклика"""
+        self.reconnect_delay = 0
+        self.next_connect_attempt = 0
+        
+        MODBUS_RTT.observe(rtt, line=self.line_code)
+        rtt_ms = rtt * 1000
+        avg = self.health['avg_rtt_ms']
+        self.health['consecutive_failures'] = 0
+        self.health['next_retry_in'] = 0
+        self.health['last_rtt_ms'] = round(rtt_ms, 2)
+        self.health['avg_rtt_ms'] = round(rtt_ms if avg is None else avg * 0.9 + rtt_ms * 0.1, 2)
+    
+    def _read_input_registers(self, address, count):
+        """Чтение входных регистров с детектированием обрыва соединения"""
+        started = time.monotonic()
+        try:
+            result = self.client.read_input_registers(
+                address, 
+                count=count, 
+                slave=self.device_id
+            )
+        except (ConnectionException, OSError) as e:
+            # Broken pipe / сброс соединения - переподключимся со следующей попытки
+            self._connection_failed(e)
+            raise
+        
+        if isinstance(result, ExceptionResponse) or not result.isError():
+            # Устройство ответило (пусть даже кодом ошибки) - соединение живо
+            self._read_succeeded(time.monotonic() - started)
+        else:
+            # Таймаут или ошибка транспорта: сокет в неизвестном состоянии
+            self._connection_failed(result)
+        return result
+    
+    def get_connection_health(self):
+        """Состояние подключения к устройству"""
+        health = dict(self.health)
+        health['connected'] = bool(self.client.connected) if self.persistent else False
+        return health
+    
+    def close(self):
+        """Закрытие постоянного подключения"""
+        self.client.close()
+        self.health['connected'] = False
         
     def read_32bit_counter(self, address):
         """Чтение 32-битного счетчика (Big-endian)"""
         try:
-            if not self.client.connect():
+            if not self._connect():
                 return None
                 
-            result = self.client.read_input_registers(
-                address, 
-                count=2, 
-                device_id=self.config.MODBUS_DEVICE_ID
-            )
+            result = self._read_input_registers(address, count=2)
             
             if not result.isError():
                 reg1, reg2 = result.registers
@@ -32,42 +238,56 @@ class ProductionMonitor:
         except Exception as e:
             print(f"Ошибка чтения 32-битного счетчика {address}: {e}")
         finally:
-            self.client.close()
+            self._release()
         return None
     
     def read_16bit_counter(self, address):
         """Чтение 16-битного счетчика"""
         try:
-            if not self.client.connect():
+            if not self._connect():
                 return None
                 
-            result = self.client.read_input_registers(
-                address, 
-                count=1, 
-                device_id=self.config.MODBUS_DEVICE_ID
-            )
+            result = self._read_input_registers(address, count=1)
             
             if not result.isError():
                 return result.registers[0]
         except Exception as e:
             print(f"Ошибка чтения 16-битного счетчика {address}: {e}")
         finally:
-            self.client.close()
+            self._release()
         return None
     
+    def read_register_map(self):
+        """Чтение всех регистров карты за одно подключение блочными запросами"""
+        blocks = {}
+        try:
+            if not self._connect():
+                return None
+            
+            for start, count in self.read_spans:
+                result = self._read_input_registers(start, count)
+                if not result.isError():
+                    blocks[start] = result.registers
+                else:
+                    print(f"Ошибка чтения блока {start}-{start + count - 1}: {result}")
+        except Exception as e:
+            print(f"Ошибка блочного чтения регистров: {e}")
+        finally:
+            self._release()
+        
+        return decode_registers(self.register_map, blocks)
+    
     def get_production_data(self):
         """Получение всех данных производства"""
         try:
-            ivams_count = self.read_32bit_counter(self.config.IVAMS_COUNTER_ADDR)
-            hour_count = self.read_16bit_counter(self.config.HOUR_COUNTER_ADDR)
-            aux_count = self.read_16bit_counter(self.config.AUX_COUNTER_ADDR)
+            values = self.read_register_map()
             
-            if ivams_count is not None:
+            if values and values.get('ivams_total') is not None:
                 return {
                     'timestamp': time.time(),
-                    'ivams_total': ivams_count,
-                    'hour_count': hour_count or 0,
-                    'aux_count': aux_count or 0,
+                    'ivams_total': values['ivams_total'],
+                    'hour_count': values.get('hour_count') or 0,
+                    'aux_count': values.get('aux_count') or 0,
                     'success': True
                 }
         except Exception as e:
@@ -100,4 +320,96 @@ class ProductionMonitor:
             }
         except Exception as e:
             print(f"Ошибка расчета OEE: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+class AsyncProductionMonitor(ProductionMonitor):
+    """Асинхронный опрос устройства для многопоточного движка опроса (poller.py)"""
+    
+    def _create_client(self):
+        """Создание асинхронного Modbus клиента"""
+        # Встроенное переподключение pymodbus отключено - задержками управляем сами
+        return AsyncModbusTcpClient(
+            self.host, 
+            port=self.port, 
+            timeout=self.timeout,
+            reconnect_delay=0
+        )
+    
+    async def _connect(self):
+        """Подключение к устройству с учетом задержки переподключения"""
+        if self.persistent and self.client.connected:
+            return True
+        
+        if self._in_backoff():
+            return False
+        
+        if not await self.client.connect():
+            self._connection_failed("Не удалось подключиться к устройству")
+            return False
+        
+        self._connection_established()
+        return True
+    
+    async def _read_input_registers(self, address, count):
+        """Чтение входных регистров с детектированием обрыва соединения"""
+        started = time.monotonic()
+        try:
+            result = await self.client.read_input_registers(
+                address, 
+                count=count, 
+                slave=self.device_id
+            )
+        except (ConnectionException, OSError) as e:
+            self._connection_failed(e)
+            raise
+        
+        if isinstance(result, ExceptionResponse) or not result.isError():
+            self._read_succeeded(time.monotonic() - started)
+        else:
+            self._connection_failed(result)
+        return result
+    
+    async def read_register_map(self):
+        """Чтение всех регистров карты блочными запросами"""
+        blocks = {}
+        try:
+            if not await self._connect():
+                return None
+            
+            for start, count in self.read_spans:
+                result = await self._read_input_registers(start, count)
+                if not result.isError():
+                    blocks[start] = result.registers
+                else:
+                    print(f"Ошибка чтения блока {start}-{start + count - 1} ({self.host}): {result}")
+        except asyncio.CancelledError:
+            # Превышен таймаут опроса - незавершенный запрос оставляет сокет в неизвестном состоянии
+            self._connection_failed("Превышено время ожидания опроса")
+            raise
+        except Exception as e:
+            print(f"Ошибка блочного чтения регистров ({self.host}): {e}")
+        finally:
+            self._release()
+        
+        return decode_registers(self.register_map, blocks)
+    
+    async def get_production_data(self):
+        """Получение всех данных производства"""
+        try:
+            values = await self.read_register_map()
+            
+            if values and values.get('ivams_total') is not None:
+                return {
+                    'timestamp': time.time(),
+                    'ivams_total': values['ivams_total'],
+                    'hour_count': values.get('hour_count') or 0,
+                    'aux_count': values.get('aux_count') or 0,
+                    'success': True
+                }
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Ошибка получения данных ({self.host}): {e}")
+            
+        return {'success': False}
@@ -1,16 +1,103 @@
 # models.py
 from datetime import datetime, time, timedelta
 from config import Config
+from metrics import OEE_COMPUTE, timed
+
+class LineRegistry:
+    """Реестр производственных линий (Config.DEVICES)"""
+    
+    @staticmethod
+    def get_lines():
+        """Все линии в порядке конфигурации"""
+        return Config.DEVICES
+    
+    @staticmethod
+    def get_line_codes():
+        return [line['line_code'] for line in Config.DEVICES]
+    
+    @staticmethod
+    def get_default_code():
+        """Линия по умолчанию (первая в реестре)"""
+        return Config.DEVICES[0]['line_code'] if Config.DEVICES else Config.LINE_CODE
+    
+    @staticmethod
+    def get_line(line_code=None):
+        """Настройки линии или None, если линия не зарегистрирована"""
+        line_code = line_code or LineRegistry.get_default_code()
+        return next((line for line in Config.DEVICES if line['line_code'] == line_code), None)
+    
+    @staticmethod
+    def is_known(line_code):
+        return LineRegistry.get_line(line_code) is not None
+    
+    @staticmethod
+    def get_setting(line_code, key, default):
+        """Настройка линии с откатом на общую настройку"""
+        line = LineRegistry.get_line(line_code) or {}
+        return line.get(key, default)
+    
+    @staticmethod
+    def get_shifts(line_code=None):
+        return LineRegistry.get_setting(line_code, 'shifts', Config.SHIFTS)
+    
+    @staticmethod
+    def get_target_rate(line_code=None):
+        """Целевая производительность линии, шт/час"""
+        return LineRegistry.get_setting(line_code, 'target_rate', Config.TARGET_PRODUCTION_RATE)
+    
+    @staticmethod
+    def get_target_shift_production(line_code=None):
+        return LineRegistry.get_setting(line_code, 'target_shift_production', Config.TARGET_SHIFT_PRODUCTION)
+    
+    @staticmethod
+    def get_register_map(line_code=None):
+        return LineRegistry.get_setting(line_code, 'register_map', Config.REGISTER_MAP)
+    
+    @staticmethod
+    def get_downtime_thresholds(line_code=None, product=None):
+        """
+        Пороги обнаружения простоев, секунды (micro_stop, downtime, recovery)
+        
+        Порядок (каждый уровень переопределяет заданные ключи): общие
+        настройки, 'downtime_thresholds' линии, Config.DOWNTIME_PRODUCT_THRESHOLDS
+        продукта, 'product_downtime_thresholds' линии для продукта
+        """
+        thresholds = {
+            'micro_stop': Config.MICRO_STOP_THRESHOLD,
+            'downtime': Config.DOWNTIME_THRESHOLD,
+            'recovery': Config.DOWNTIME_RECOVERY_MIN
+        }
+        thresholds.update(LineRegistry.get_setting(line_code, 'downtime_thresholds', {}))
+        if product is not None:
+            thresholds.update(Config.DOWNTIME_PRODUCT_THRESHOLDS.get(product, {}))
+            thresholds.update(LineRegistry.get_setting(line_code, 'product_downtime_thresholds', {}).get(product, {}))
+        return thresholds
+    
+    @staticmethod
+    def describe(line_code):
+        """Описание линии для API (без сетевых настроек контроллера)"""
+        line = LineRegistry.get_line(line_code) or {}
+        return {
+            'line_code': line_code,
+            'line_name': line.get('line_name', line_code),
+            'target_rate': LineRegistry.get_target_rate(line_code),
+            'target_shift_production': LineRegistry.get_target_shift_production(line_code),
+            'polling_interval': line.get('polling_interval', Config.POLLING_INTERVAL),
+            'shifts': [
+                {'number': shift['number'], 'start': shift['start'].isoformat(), 'end': shift['end'].isoformat()}
+                for shift in LineRegistry.get_shifts(line_code)
+            ]
+        }
 
 class ShiftManager:
-    """Управление сменами"""
+    """Управление сменами (план смен - по линии из LineRegistry)"""
     
     @staticmethod
-    def get_current_shift():
+    def get_current_shift(line_code=None):
         """Определение текущей смены"""
         now = datetime.now().time()
         
-        for shift in Config.SHIFTS:
+        for shift in LineRegistry.get_shifts(line_code):
             if shift["start"] < shift["end"]:
                 # Обычная смена (в пределах одного дня)
                 if shift["start"] <= now < shift["end"]:
@@ -22,16 +109,90 @@ class ShiftManager:
         return None
     
     @staticmethod
-    def get_shift_start_time(shift_number=None, for_date=None):
+    def get_shift_key(moment=None, line_code=None):
+        """
+        Смена, к которой относится момент времени
+        
+        Returns:
+            Кортеж (дата смены в ISO формате, номер смены); ночная смена
+            относится к дате своего начала (как в Database.get_shift_data)
+        """
+        if moment is None:
+            moment = datetime.now()
+        now = moment.time()
+        
+        for shift in LineRegistry.get_shifts(line_code):
+            if shift["start"] < shift["end"]:
+                if shift["start"] <= now < shift["end"]:
+                    return moment.date().isoformat(), shift["number"]
+            else:
+                if now >= shift["start"]:
+                    return moment.date().isoformat(), shift["number"]
+                if now < shift["end"]:
+                    return (moment.date() - timedelta(days=1)).isoformat(), shift["number"]
+        return moment.date().isoformat(), None
+    
+    @staticmethod
+    def get_shift_window(shift_date, shift_number, line_code=None):
+        """
+        Границы смены (местное время)
+        
+        Args:
+            shift_date: Дата начала смены (ISO строка или date)
+            shift_number: Номер смены
+        
+        Returns:
+            Кортеж (начало, конец) datetime или None, если смена не найдена
+        """
+        if isinstance(shift_date, str):
+            shift_date = datetime.strptime(shift_date, '%Y-%m-%d').date()
+        
+        shift = next((s for s in LineRegistry.get_shifts(line_code) if s["number"] == shift_number), None)
+        if shift is None:
+            return None
+        
+        start = datetime.combine(shift_date, shift["start"])
+        return start, start + timedelta(minutes=ShiftManager.get_shift_duration(shift_number, line_code))
+    
+    @staticmethod
+    def iter_shifts(start, end, line_code=None):
+        """
+        Смены, начавшиеся в интервале [start, end), в хронологическом порядке
+        
+        Returns:
+            Список кортежей (дата смены ISO, номер, начало, конец)
+        """
+        shifts = []
+        day = start.date() - timedelta(days=1)
+        while day <= end.date():
+            for shift in LineRegistry.get_shifts(line_code):
+                window = ShiftManager.get_shift_window(day, shift["number"], line_code)
+                if start <= window[0] < end:
+                    shifts.append((day.isoformat(), shift["number"], window[0], window[1]))
+            day += timedelta(days=1)
+        return sorted(shifts, key=lambda item: item[2])
+    
+    @staticmethod
+    def get_shift_duration(shift_number, line_code=None):
+        """Длительность смены в минутах"""
+        shift = next((s for s in LineRegistry.get_shifts(line_code) if s["number"] == shift_number), None)
+        if shift is None:
+            return 12 * 60
+        start = shift["start"].hour * 60 + shift["start"].minute
+        end = shift["end"].hour * 60 + shift["end"].minute
+        return (end - start) % (24 * 60) or 24 * 60
+    
+    @staticmethod
+    def get_shift_start_time(shift_number=None, for_date=None, line_code=None):
         """Получение времени начала смены"""
         if for_date is None:
             for_date = datetime.now().date()
         
         if shift_number is None:
-            shift = ShiftManager.get_current_shift()
+            shift = ShiftManager.get_current_shift(line_code)
             shift_number = shift["number"] if shift else 1
         
-        shift_config = next((s for s in Config.SHIFTS if s["number"] == shift_number), None)
+        shift_config = next((s for s in LineRegistry.get_shifts(line_code) if s["number"] == shift_number), None)
         if shift_config:
             # Для ночной смены начало - предыдущий день в 19:00
             if shift_config["start"].hour >= 19:
@@ -46,7 +207,9 @@ class OEECalculator:
     def __init__(self):
         self.config = Config
     
-    def calculate_oee(self, actual_production, planned_production, operating_time, available_time, good_units=None):
+    @timed(OEE_COMPUTE, kind='current')
+    def calculate_oee(self, actual_production, planned_production, operating_time, available_time, good_units=None,
+                      target_rate=None):
         """
         Полный расчет OEE
         
@@ -56,6 +219,7 @@ class OEECalculator:
             operating_time: Время работы (мин)
             available_time: Доступное время (мин)
             good_units: Количество годных изделий (если None, используется quality_rate)
+            target_rate: Целевая производительность линии, шт/час (по умолчанию общая)
         """
         
         try:
@@ -68,7 +232,7 @@ class OEECalculator:
             # Performance (Производительность)
             if operating_time > 0:
                 # Рассчитываем идеальное производство за указанное время
-                ideal_production = (self.config.TARGET_PRODUCTION_RATE / 60) * operating_time
+                ideal_production = ((target_rate or self.config.TARGET_PRODUCTION_RATE) / 60) * operating_time
                 performance = min(1.0, actual_production / ideal_production) if ideal_production > 0 else 0
             else:
                 performance = 0
@@ -114,62 +278,148 @@ class OEECalculator:
                 'available_time': available_time
             }
     def calculate_shift_oee(self, shift_data):
-        """Расчет OEE для смены"""
+        """Расчет OEE для смены (shift_data может содержать shift_number и line_code)"""
+        line_code = shift_data.get('line_code')
         shift_duration = 12 * 60  # 12 часов в минутах
-        planned_production = self.config.TARGET_SHIFT_PRODUCTION
+        if 'shift_number' in shift_data:
+            shift_duration = ShiftManager.get_shift_duration(shift_data['shift_number'], line_code)
+        planned_production = LineRegistry.get_target_shift_production(line_code)
         
         return self.calculate_oee(
             actual_production=shift_data['total_production'],
             planned_production=planned_production,
             operating_time=shift_duration - shift_data['downtime_minutes'],
-            available_time=shift_duration
+            available_time=shift_duration,
+            target_rate=LineRegistry.get_target_rate(line_code)
         )
 
-class DowntimeMonitor:
-    """Мониторинг простоев оборудования"""
+class OutageDetector:
+    """
+    Обнаружение перерывов связи с устройством
+
+    Перерыв открывается, когда с последней успешной выборки прошло больше
+    ROLLUP_GAP_FACTOR интервалов опроса (начало - время этой выборки), и
+    закрывается первой успешной выборкой. В перерыве фиксируются показания
+    счетчика до и после и прирост за перерыв - накопительный счетчик
+    позволяет восстановить выпуск, которого не видел опрос.
+    """
     
-    def __init__(self):
+    def __init__(self, expected_interval=None):
         self.config = Config
-        self.last_production_count = None
-        self.last_production_time = None
-        self.downtime_start = None
-        self.current_downtime_reason = None
-    
-    def check_downtime(self, current_count, timestamp):
-        """Проверка состояния простоя"""
-        
-        if self.last_production_count is None:
-            self.last_production_count = current_count
-            self.last_production_time = timestamp
-            return False, None
-        
-        # Проверяем, изменился ли счетчик
-        if current_count > self.last_production_count:
-            # Производство идет - сбрасываем мониторинг простоя
-            self.last_production_count = current_count
-            self.last_production_time = timestamp
-            self.downtime_start = None
-            self.current_downtime_reason = None
-            return False, None
-        
-        # Счетчик не изменился - проверяем время
-        time_since_last_production = timestamp - self.last_production_time
-        
-        if time_since_last_production >= self.config.DOWNTIME_THRESHOLD:
-            # Превышен порог простоя
-            if self.downtime_start is None:
-                self.downtime_start = self.last_production_time
-                self.current_downtime_reason = "Автоматически детектированный простой"
-            
-            downtime_duration = timestamp - self.downtime_start
-            return True, {
-                'start_time': self.downtime_start,
-                'duration': downtime_duration,
-                'reason': self.current_downtime_reason
-            }
+        self.expected_interval = expected_interval or self.config.POLLING_INTERVAL
+        self.last_success_time = None
+        self.last_counter = None
+        self.outage = None
+    
+    def sample_failed(self, timestamp, error=None):
+        """
+        Учет неудачного опроса
+        
+        Returns:
+            Перерыв, если он только что открыт, иначе None
+        """
+        if self.outage is not None:
+            self.outage['duration'] = timestamp - self.outage['start_time']
+            return None
+        
+        if self.last_success_time is None:
+            # Связи нет с запуска - перерыв отсчитывается от первого опроса
+            start_time = timestamp
+        elif timestamp - self.last_success_time < self.expected_interval * self.config.ROLLUP_GAP_FACTOR:
+            return None
+        else:
+            start_time = self.last_success_time
+        
+        self.outage = {
+            'start_time': start_time,
+            'end_time': None,
+            'duration': timestamp - start_time,
+            'counter_before': self.last_counter,
+            'counter_after': None,
+            'recovered_count': None,
+            'error': error
+        }
+        return self.outage
+    
+    def sample_succeeded(self, timestamp, counter, production_delta):
+        """
+        Учет успешной выборки
+        
+        Returns:
+            Закрытый перерыв (с приростом за него) или None
+        """
+        self.last_success_time = timestamp
+        self.last_counter = counter
+        
+        finished = self.outage
+        if finished is None:
+            return None
         
-        return False, None
+        self.outage = None
+        finished['end_time'] = timestamp
+        finished['duration'] = timestamp - finished['start_time']
+        finished['counter_after'] = counter
+        finished['recovered_count'] = production_delta
+        return finished
+    
+    def get_status(self):
+        """Открытый перерыв для dashboard или None"""
+        if self.outage is None:
+            return None
+        return {
+            'since': datetime.fromtimestamp(self.outage['start_time']).isoformat(),
+            'duration': round(self.outage['duration']),
+            'last_counter': self.outage['counter_before'],
+            'error': self.outage['error']
+        }
+
+class CounterTracker:
+    """Последние значения счетчиков по линиям для расчета прироста без запросов к БД"""
+    
+    def __init__(self):
+        self.config = Config
+        self.last_values = {}
+        self.stats = {'rollovers': 0, 'resets': 0}
+    
+    def seed(self, line_code, value):
+        """Начальное значение счетчика (последнее сохраненное в БД)"""
+        if value is not None:
+            self.last_values[line_code] = value
     
-    def add_downtime_reason(self, reason):
-        """Добавление причины простоя (для ручного ввода)"""
-        self.current_downtime_reason = reason
\ No newline at end of file
+    def update(self, line_code, value):
+        """
+        Учет нового показания счетчика
+        
+        Returns:
+            Прирост с предыдущего показания (шт)
+        """
+        if value is None:
+            return 0
+        
+        last = self.last_values.get(line_code)
+        self.last_values[line_code] = value
+        
+        if last is None or value == last:
+            return 0
+        
+        if value > last:
+            return value - last
+        
+        counter_max = self.config.COUNTER_MAX
+        window = self.config.COUNTER_ROLLOVER_WINDOW
+        
+        if last >= counter_max - window and value < window:
+            # Переполнение 32-битного счетчика: досчитываем до максимума и от нуля
+            self.stats['rollovers'] += 1
+            print(f"🔄 Переполнение счетчика {line_code}: {last} -> {value}")
+            return counter_max - last + value
+        
+        self.stats['resets'] += 1
+        if value < window:
+            # Сброс устройства: счетчик начал заново с нуля
+            print(f"⚠️ Сброс счетчика {line_code}: {last} -> {value}")
+            return value
+        
+        # Необъяснимый скачок назад - принимаем новое значение как базу
+        print(f"⚠️ Счетчик {line_code} уменьшился: {last} -> {value}, прирост не учтен")
+        return 0
@@ -0,0 +1,125 @@
+# poller.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from modbus_client import AsyncProductionMonitor
+from scheduler import FixedRateScheduler
+from config import Config
+from metrics import POLL_DURATION, POLLS
+
+class PollerEngine:
+    """
+    Асинхронный движок опроса нескольких устройств
+    
+    Каждое устройство опрашивается в своей задаче asyncio на собственной
+    фиксированной сетке (FixedRateScheduler) и с собственным таймаутом, поэтому
+    недоступный контроллер не задерживает остальные. Сетки устройств сдвинуты
+    по фазе, чтобы опросы не совпадали по времени. Результат опроса передается в handler(device, data),
+    который выполняется в пуле потоков (запись в БД, OEE, простои).
+    """
+    
+    def __init__(self, devices, handler, workers=None):
+        self.config = Config
+        self.devices = devices
+        self.handler = handler
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or self.config.POLLER_WORKERS,
+            thread_name_prefix='poll-handler'
+        )
+        self.monitors = {}
+        self.schedulers = {}
+        self.loop = None
+        self.thread = None
+        self._stopping = None
+    
+    def start(self):
+        """Запуск цикла опроса в фоновом потоке"""
+        self.thread = threading.Thread(target=self._run, name='poller', daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Остановка всех задач опроса"""
+        if self.loop and self._stopping:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+    
+    def get_health(self):
+        """Состояние подключения по каждой линии"""
+        return {
+            line_code: monitor.get_connection_health()
+            for line_code, monitor in self.monitors.items()
+        }
+    
+    def get_schedule_metrics(self):
+        """Метрики сетки опроса по каждой линии (задержка, перерасход, джиттер)"""
+        return {
+            line_code: scheduler.get_metrics()
+            for line_code, scheduler in self.schedulers.items()
+        }
+    
+    def _run(self):
+        asyncio.run(self._main())
+    
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        
+        tasks = [
+            asyncio.create_task(
+                self._poll_device(device, phase=index / len(self.devices)),
+                name=f"poll-{device['line_code']}"
+            )
+            for index, device in enumerate(self.devices)
+        ]
+        await self._stopping.wait()
+        
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for monitor in self.monitors.values():
+            monitor.close()
+        self.executor.shutdown(wait=False)
+    
+    async def _poll_device(self, device, phase=0.0):
+        """Цикл опроса одного устройства (phase - сдвиг сетки в долях интервала)"""
+        line_code = device['line_code']
+        interval = device.get('polling_interval', self.config.POLLING_INTERVAL)
+        timeout = device.get('timeout', self.config.MODBUS_TIMEOUT)
+        
+        monitor = AsyncProductionMonitor(device=device)
+        self.monitors[line_code] = monitor
+        scheduler = FixedRateScheduler(interval, phase=phase * interval)
+        self.schedulers[line_code] = scheduler
+        
+        while True:
+            sample_interval = await scheduler.wait_next()
+            started = time.perf_counter()
+            
+            try:
+                production_data = await asyncio.wait_for(
+                    monitor.get_production_data(), 
+                    timeout=timeout
+                )
+                result = 'ok' if production_data['success'] else 'failed'
+            except asyncio.TimeoutError:
+                print(f"❌ Превышено время опроса {line_code} ({device['host']})")
+                production_data = {'success': False}
+                result = 'timeout'
+            
+            read_finished = time.perf_counter()
+            POLL_DURATION.observe(read_finished - started, line=line_code, stage='read')
+            POLLS.inc(line=line_code, result=result)
+            
+            # Фактический интервал между тиками: обработчик учитывает его при поиске
+            # пропусков опроса (пропущенный по расписанию тик - не перерыв связи)
+            production_data['sample_interval'] = sample_interval or interval
+            
+            try:
+                await self.loop.run_in_executor(self.executor, self.handler, device, production_data)
+            except Exception as e:
+                print(f"❌ Ошибка обработки данных {line_code}: {e}")
+            
+            finished = time.perf_counter()
+            POLL_DURATION.observe(finished - read_finished, line=line_code, stage='handle')
+            POLL_DURATION.observe(finished - started, line=line_code, stage='total')
+            scheduler.tick_finished()
@@ -0,0 +1,141 @@
+# push.py
+import json
+import queue
+import threading
+from config import Config
+from snapshot import json_default
+
+class EventBroadcaster:
+    """
+    Рассылка обновлений dashboard по Server-Sent Events
+
+    Единая точка рассылки: поток опроса после каждого тика вызывает
+    publish_tick, изменения относительно предыдущего тика (разделы состояния
+    и ячейки поминутной карты) кодируются в SSE кадр один раз и кладутся
+    в очередь каждого подписчика. Подписчик, который не успевает читать
+    (очередь заполнена), отключается - браузер переподключится сам.
+    """
+
+    def __init__(self, queue_size=None):
+        self.config = Config
+        self.queue_size = queue_size or self.config.PUSH_CLIENT_QUEUE_SIZE
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.last_sections = {}
+        self.last_cells = {}
+
+        self.stats = {
+            'connected': 0,
+            'events': 0,
+            'disconnected_slow': 0
+        }
+
+    def subscribe(self, line_code):
+        """Новый подписчик: очередь готовых SSE кадров"""
+        client = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.clients[client] = line_code
+            self.stats['connected'] += 1
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.clients.pop(client, None)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['clients'] = len(self.clients)
+        return stats
+
+    @staticmethod
+    def format_event(event, data, event_id=None):
+        """SSE кадр из имени события и JSON данных"""
+        if not isinstance(data, (bytes, str)):
+            data = json.dumps(data, ensure_ascii=False, default=json_default)
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        frame = f"event: {event}\n"
+        if event_id is not None:
+            frame += f"id: {event_id}\n"
+        return (frame + f"data: {data}\n\n").encode('utf-8')
+
+    def publish_tick(self, line_code, state, cells=()):
+        """
+        Рассылка изменений за тик
+
+        Args:
+            line_code: Код линии
+            state: Текущее состояние линии (словарь разделов)
+            cells: Ячейки поминутной карты (дата, час, минута, значение)
+        """
+        last = self.last_sections.setdefault(line_code, {})
+        delta = {}
+        for key, value in state.items():
+            encoded = json.dumps(value, ensure_ascii=False, sort_keys=True, default=json_default)
+            if last.get(key) != encoded:
+                last[key] = encoded
+                delta[key] = value
+
+        last_cells = self.last_cells.get(line_code, {})
+        changed_cells = [
+            [date, hour, minute, value] for date, hour, minute, value in cells
+            if last_cells.get((date, hour, minute)) != value
+        ]
+        if cells:
+            # Помним только ячейки последнего тика, а не весь день
+            self.last_cells[line_code] = {(date, hour, minute): value for date, hour, minute, value in cells}
+
+        frames = []
+        if delta:
+            frames.append(self.format_event('delta', delta))
+        if changed_cells:
+            frames.append(self.format_event('cells', {'cells': changed_cells}))
+        if frames:
+            self._fan_out(line_code, frames)
+
+    def _fan_out(self, line_code, frames):
+        with self.lock:
+            clients = [client for client, line in self.clients.items() if line == line_code]
+
+        for client in clients:
+            try:
+                for frame in frames:
+                    client.put_nowait(frame)
+            except queue.Full:
+                # Медленный клиент - отключаем, чтобы не держать память
+                self.unsubscribe(client)
+                try:
+                    while True:
+                        client.get_nowait()
+                except queue.Empty:
+                    pass
+                client.put_nowait(None)
+                self.stats['disconnected_slow'] += 1
+        self.stats['events'] += len(frames)
+
+    def stream(self, line_code, snapshot):
+        """
+        Генератор SSE потока для одного подписчика
+
+        Первым кадром отдается полный снимок состояния (StateSnapshot),
+        далее - изменения. Снимок берется после подписки, чтобы не потерять
+        изменения между ними.
+        """
+        client = self.subscribe(line_code)
+        try:
+            body, etag = snapshot.get()
+            yield b"retry: 3000\n\n"
+            yield self.format_event('state', body, etag)
+            while True:
+                try:
+                    frame = client.get(timeout=self.config.PUSH_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    # Комментарий держит соединение через прокси
+                    yield b": keepalive\n\n"
+                    continue
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self.unsubscribe(client)
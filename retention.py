@@ -0,0 +1,294 @@
+# retention.py
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from config import Config
+from shards import month_end
+
+class RetentionManager:
+    """
+    Хранение сырых данных ограниченное время
+
+    Сырые выборки production_data и oee_metrics хранятся RAW_RETENTION_DAYS
+    дней. Более старые данные обрабатываются небольшими порциями по времени
+    (RETENTION_CHUNK_MINUTES): минуты и часы, которых еще нет в minute_power /
+    hourly_power, досчитываются из сырых выборок, сырые строки при
+    необходимости копируются в архивную БД и удаляются. Каждая порция - своя
+    короткая транзакция, между порциями пауза, чтобы не задерживать запись
+    данных опроса.
+
+    В режиме шардов (DATABASE_SHARDING) сырые данные лежат в помесячных
+    файлах: месяц, целиком вышедший за срок хранения, досчитывается
+    в агрегаты линии, а файл удаляется или переносится в каталог архива.
+    """
+
+    def __init__(self, db, retention_days=None, archive_path=None):
+        self.config = Config
+        self.db = db
+        self.retention_days = retention_days or self.config.RAW_RETENTION_DAYS
+        self.archive_path = archive_path if archive_path is not None else self.config.RETENTION_ARCHIVE_PATH
+        self.chunk = timedelta(minutes=self.config.RETENTION_CHUNK_MINUTES)
+        self.thread = None
+        self._stopping = threading.Event()
+
+        self.stats = {
+            'runs': 0,
+            'chunks': 0,
+            'deleted_rows': 0,
+            'archived_rows': 0,
+            'rolled_up_minutes': 0,
+            'last_run': None,
+            'last_error': None
+        }
+
+    def start(self):
+        """Запуск фоновой очистки"""
+        self.thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Ошибка очистки старых данных: {e}")
+                self.stats['last_error'] = str(e)
+            self._stopping.wait(self.config.RETENTION_CHECK_INTERVAL)
+
+    def run_once(self):
+        """Обработка всех сырых данных старше срока хранения"""
+        # Граница выровнена по минуте, чтобы минута не агрегировалась частями
+        cutoff = (datetime.utcnow() - timedelta(days=self.retention_days)).replace(second=0, microsecond=0)
+        cutoff_str = cutoff.strftime('%Y-%m-%d %H:%M:%S')
+
+        if self.db.sharded:
+            self._expire_months(cutoff)
+            self.stats['runs'] += 1
+            self.stats['last_run'] = datetime.now().isoformat()
+            return
+
+        self._attach_archive()
+        try:
+            while not self._stopping.is_set():
+                with self.db.connections.reader() as conn:
+                    oldest = conn.execute('SELECT MIN(timestamp) FROM production_data').fetchone()[0]
+                if oldest is None or oldest >= cutoff_str:
+                    break
+
+                chunk_start = datetime.strptime(oldest[:19], '%Y-%m-%d %H:%M:%S').replace(second=0)
+                chunk_end = min(chunk_start + self.chunk, cutoff).strftime('%Y-%m-%d %H:%M:%S')
+                if not self._process_chunk(chunk_start.strftime('%Y-%m-%d %H:%M:%S'), chunk_end):
+                    # Ничего не удалено (нестандартный формат времени) - не зацикливаемся
+                    break
+                time.sleep(self.config.RETENTION_BATCH_PAUSE)
+
+            self._purge_oee_metrics(cutoff_str)
+        finally:
+            self._detach_archive()
+
+        self.stats['runs'] += 1
+        self.stats['last_run'] = datetime.now().isoformat()
+
+    def _process_chunk(self, start, end):
+        """
+        Агрегация, архивирование и удаление сырых данных за [start, end)
+
+        Returns:
+            Количество удаленных строк
+        """
+        with self.db.connections.writer() as conn:
+            rolled_up = self._rollup_chunk(conn, start, end)
+
+            archived = 0
+            if self.archive_path:
+                archived = conn.execute('''
+                    INSERT INTO archive.production_data
+                    SELECT * FROM main.production_data
+                    WHERE timestamp >= ? AND timestamp < ?
+                ''', (start, end)).rowcount
+
+            deleted = conn.execute('''
+                DELETE FROM production_data
+                WHERE timestamp >= ? AND timestamp < ?
+            ''', (start, end)).rowcount
+
+        if rolled_up > 0:
+            # Досчитанные минуты и часы меняют уже закэшированные дни
+            self.db.invalidate_cached_days()
+
+        self.stats['chunks'] += 1
+        self.stats['rolled_up_minutes'] += max(0, rolled_up)
+        self.stats['archived_rows'] += archived
+        self.stats['deleted_rows'] += deleted
+        return deleted
+
+    def _rollup_chunk(self, conn, start, end, source='production_data'):
+        """
+        Досчет агрегатов за [start, end) из сырых выборок source
+
+        Returns:
+            Количество досчитанных минут
+        """
+        # Минуты без агрегата досчитываем из сырых выборок. Строка без выборок
+        # (sample_count = 0: записанная до статистики агрегатов или восстановленная
+        # за перерыв связи) сырые выборки не учитывала - их выпуск добавляется к ней
+        rolled_up = conn.execute(f'''
+            INSERT INTO minute_power
+            (line_code, date, hour, minute, power_value, total_count, min_delta, max_delta, sample_count, gap_seconds)
+            SELECT
+                line_code AS l,
+                date(timestamp, 'localtime') AS d,
+                CAST(strftime('%H', timestamp, 'localtime') AS INTEGER) AS h,
+                CAST(strftime('%M', timestamp, 'localtime') AS INTEGER) AS m,
+                SUM(production_delta), SUM(production_delta),
+                MIN(production_delta), MAX(production_delta), COUNT(*), 0
+            FROM {source}
+            WHERE timestamp >= ? AND timestamp < ?
+            GROUP BY l, d, h, m
+            HAVING NOT EXISTS (
+                SELECT 1 FROM minute_power mp
+                WHERE mp.line_code = l AND mp.date = d AND mp.hour = h AND mp.minute = m
+                AND COALESCE(mp.sample_count, 0) > 0
+            )
+            ON CONFLICT(line_code, date, hour, minute) DO UPDATE SET
+                total_count = COALESCE(minute_power.total_count, 0) + excluded.total_count,
+                power_value = COALESCE(minute_power.total_count, 0) + excluded.total_count,
+                min_delta = excluded.min_delta,
+                max_delta = excluded.max_delta,
+                sample_count = excluded.sample_count
+        ''', (start, end)).rowcount
+
+        # Часы без агрегата (или без выборок) считаем по минутным агрегатам
+        conn.execute(f'''
+            INSERT INTO hourly_power
+            (line_code, date, hour, power_value, total_count, min_delta, max_delta, sample_count, gap_seconds)
+            SELECT line_code, date, hour, SUM(minute_count) / 60.0, SUM(minute_count),
+                   MIN(min_delta), MAX(max_delta), SUM(sample_count), SUM(gap_seconds)
+            FROM (
+                SELECT *, CASE WHEN sample_count > 0 THEN total_count ELSE power_value END AS minute_count
+                FROM minute_power
+            )
+            WHERE (line_code, date, hour) IN (
+                SELECT DISTINCT
+                    line_code,
+                    date(timestamp, 'localtime'),
+                    CAST(strftime('%H', timestamp, 'localtime') AS INTEGER)
+                FROM {source}
+                WHERE timestamp >= ? AND timestamp < ?
+            )
+            GROUP BY line_code, date, hour
+            ON CONFLICT(line_code, date, hour) DO UPDATE SET
+                power_value = excluded.power_value,
+                total_count = excluded.total_count,
+                min_delta = excluded.min_delta,
+                max_delta = excluded.max_delta,
+                sample_count = excluded.sample_count,
+                gap_seconds = excluded.gap_seconds
+            WHERE COALESCE(hourly_power.sample_count, 0) = 0
+        ''', (start, end))
+        return rolled_up
+
+    def _expire_months(self, cutoff):
+        """Режим шардов: помесячные файлы старше срока хранения - в агрегаты и в архив/удаление"""
+        connections = self.db.connections
+        archive_dir = (os.path.dirname(self.archive_path) or '.') if self.archive_path else None
+
+        for line_code in self.db.line_codes:
+            for month in connections.get_months(line_code):
+                if self._stopping.is_set():
+                    return
+                if month_end(month) > cutoff:
+                    continue
+
+                # Запечатанный файл (WAL слит) присоединяется к соединению записи линии
+                connections.seal(line_code, month)
+                with connections.writer(line_code) as conn:
+                    conn.execute('ATTACH DATABASE ? AS raw', (connections.month_path(line_code, month),))
+                try:
+                    chunk_start = datetime.strptime(month + '-01', '%Y-%m-%d')
+                    rolled_up = 0
+                    while chunk_start < month_end(month) and not self._stopping.is_set():
+                        chunk_end = min(chunk_start + self.chunk, month_end(month))
+                        with connections.writer(line_code) as conn:
+                            rolled_up += max(0, self._rollup_chunk(
+                                conn,
+                                chunk_start.strftime('%Y-%m-%d %H:%M:%S'),
+                                chunk_end.strftime('%Y-%m-%d %H:%M:%S'),
+                                'raw.production_data'
+                            ))
+                        self.stats['chunks'] += 1
+                        chunk_start = chunk_end
+                finally:
+                    with connections.writer(line_code) as conn:
+                        conn.execute('DETACH DATABASE raw')
+
+                if self._stopping.is_set():
+                    return
+                if rolled_up:
+                    self.db.invalidate_cached_days()
+                self.stats['rolled_up_minutes'] += rolled_up
+                connections.remove_month(line_code, month, archive_dir)
+                print(f"📊 Сырые данные {line_code} за {month} {'перенесены в архив' if archive_dir else 'удалены'}")
+                time.sleep(self.config.RETENTION_BATCH_PAUSE)
+
+    def _purge_oee_metrics(self, cutoff):
+        """Удаление (и архивирование) старых OEE метрик порциями"""
+        batch_size = self.config.RETENTION_BATCH_SIZE
+        while not self._stopping.is_set():
+            with self.db.connections.writer() as conn:
+                rows = conn.execute('''
+                    SELECT MIN(id), MAX(id) FROM (
+                        SELECT id FROM oee_metrics
+                        WHERE timestamp < ?
+                        ORDER BY timestamp LIMIT ?
+                    )
+                ''', (cutoff, batch_size)).fetchone()
+                if rows[0] is None:
+                    break
+
+                if self.archive_path:
+                    self.stats['archived_rows'] += conn.execute('''
+                        INSERT INTO archive.oee_metrics
+                        SELECT * FROM main.oee_metrics
+                        WHERE id BETWEEN ? AND ? AND timestamp < ?
+                    ''', (rows[0], rows[1], cutoff)).rowcount
+
+                self.stats['deleted_rows'] += conn.execute('''
+                    DELETE FROM oee_metrics
+                    WHERE id BETWEEN ? AND ? AND timestamp < ?
+                ''', (rows[0], rows[1], cutoff)).rowcount
+            time.sleep(self.config.RETENTION_BATCH_PAUSE)
+
+    def _attach_archive(self):
+        """Подключение архивной БД к соединению на запись"""
+        if not self.archive_path:
+            return
+        archive_dir = os.path.dirname(self.archive_path)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+
+        with self.db.connections.writer() as conn:
+            conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+            for table in ('production_data', 'oee_metrics'):
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS archive.{table}
+                    AS SELECT * FROM main.{table} WHERE 0
+                ''')
+                # Архив, созданный до добавления колонок (line_code), догоняет схему
+                archived = {row[1] for row in conn.execute(f'PRAGMA archive.table_info({table})')}
+                for row in conn.execute(f'PRAGMA main.table_info({table})').fetchall():
+                    if row[1] not in archived:
+                        conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN {row[1]} {row[2]}')
+
+    def _detach_archive(self):
+        if not self.archive_path:
+            return
+        with self.db.connections.writer() as conn:
+            conn.execute('DETACH DATABASE archive')
@@ -0,0 +1,205 @@
+# rollups.py
+import threading
+from datetime import datetime
+from config import Config
+
+class RollupEngine:
+    """
+    Инкрементальные агрегаты по потоку приростов счетчика
+
+    Для каждой линии держит открытые корзины минуты и часа. Каждая
+    выборка добавляется во все открытые корзины; корзина закрывается, когда
+    приходит выборка (или проверка close_expired) из следующего периода, и
+    возвращается вызывающему для однократной записи в БД.
+
+    Корзина содержит сумму приростов, минимум/максимум прироста за выборку,
+    количество выборок и суммарную длительность пропусков опроса.
+
+    Прирост первой выборки после пропуска (нет связи с устройством)
+    распределяется по времени пропуска: счетчик - накопительный, поэтому
+    выпуск за пропуск известен, а минуты и часы пропуска получают его долю
+    пропорционально длительности. Для уже закрытых периодов возвращаются
+    восстановленные корзины (reconstructed) - запись агрегатов их суммирует.
+
+    Итоги смен не агрегируются: их записывает ShiftReportJob (shift_reports)
+    по закрытой смене.
+    """
+
+    LEVELS = ('minute', 'hour')
+
+    def __init__(self, gap_factor=None):
+        self.config = Config
+        self.gap_factor = gap_factor or self.config.ROLLUP_GAP_FACTOR
+        self.lines = {}
+        self.lock = threading.Lock()
+
+    def add_sample(self, line_code, timestamp, delta, expected_interval=None):
+        """
+        Учет выборки
+
+        Args:
+            line_code: Код линии
+            timestamp: Время выборки (unix time)
+            delta: Прирост счетчика с предыдущей выборки (шт)
+            expected_interval: Плановый интервал опроса (для учета пропусков)
+
+        Returns:
+            Список закрытых корзин
+        """
+        expected_interval = expected_interval or self.config.POLLING_INTERVAL
+        moment = datetime.fromtimestamp(timestamp)
+
+        with self.lock:
+            line = self.lines.setdefault(line_code, {'last_sample': None})
+            closed = self._roll(line_code, line, moment)
+
+            gap = 0.0
+            shares = None
+            if line['last_sample'] is not None:
+                elapsed = timestamp - line['last_sample']
+                if elapsed > expected_interval * self.gap_factor:
+                    gap = elapsed - expected_interval
+                    if delta >= 0 and elapsed <= self.config.OUTAGE_BACKFILL_MAX_HOURS * 3600:
+                        shares = self._spread(line_code, line, line['last_sample'], timestamp, delta, gap, closed)
+            line['last_sample'] = timestamp
+
+            for level in self.LEVELS:
+                bucket = line[level]
+                level_delta, level_gap = shares[level] if shares else (delta, gap)
+                bucket['total'] += level_delta
+                bucket['sample_count'] += 1
+                bucket['gap_seconds'] += level_gap
+                bucket['min_delta'] = level_delta if bucket['min_delta'] is None else min(bucket['min_delta'], level_delta)
+                bucket['max_delta'] = level_delta if bucket['max_delta'] is None else max(bucket['max_delta'], level_delta)
+
+        return closed
+
+    def _spread(self, line_code, line, start, end, delta, gap, closed):
+        """
+        Распределение прироста и пропуска за интервал [start, end) по минутам
+
+        Доли прошедших периодов добавляются в closed восстановленными
+        корзинами, доли текущих открытых корзин возвращаются.
+
+        Returns:
+            Словарь {уровень: (прирост, секунды пропуска)} для открытых корзин
+        """
+        span = end - start
+        pieces = []
+        moment = start
+        while moment < end:
+            piece_end = min(end, (moment // 60 + 1) * 60)
+            pieces.append((moment, piece_end - moment))
+            moment = piece_end
+
+        # Целые доли прироста с сохранением суммы (метод наибольших остатков)
+        exact = [delta * seconds / span for _, seconds in pieces]
+        counts = [int(value) for value in exact]
+        remainders = sorted(range(len(pieces)), key=lambda index: exact[index] - counts[index], reverse=True)
+        for index in remainders[:delta - sum(counts)]:
+            counts[index] += 1
+
+        current = {level: [0, 0.0] for level in self.LEVELS}
+        past = {}
+        for (moment, seconds), count in zip(pieces, counts):
+            piece_moment = datetime.fromtimestamp(moment)
+            piece_gap = gap * seconds / span
+            for level in self.LEVELS:
+                key = self._bucket_key(level, piece_moment)
+                if key == line[level]['key']:
+                    current[level][0] += count
+                    current[level][1] += piece_gap
+                    continue
+                bucket = past.get((level, key))
+                if bucket is None:
+                    bucket = past[(level, key)] = self._new_bucket(line_code, level, key, piece_moment)
+                    bucket['reconstructed'] = True
+                bucket['total'] += count
+                bucket['gap_seconds'] += piece_gap
+
+        for bucket in past.values():
+            bucket['gap_seconds'] = round(bucket['gap_seconds'], 3)
+            closed.append(self._finalize(bucket, complete=True))
+        return {level: (total, round(gap_share, 3)) for level, (total, gap_share) in current.items()}
+
+    def close_expired(self, line_code, timestamp):
+        """Закрытие корзин, период которых истек (вызывается и без новых выборок)"""
+        with self.lock:
+            line = self.lines.get(line_code)
+            if not line:
+                return []
+            return self._roll(line_code, line, datetime.fromtimestamp(timestamp), create=False)
+
+    def close_all(self):
+        """Закрытие всех открытых корзин (при остановке)"""
+        closed = []
+        with self.lock:
+            for line in self.lines.values():
+                for level in self.LEVELS:
+                    bucket = line.pop(level, None)
+                    if bucket:
+                        closed.append(self._finalize(bucket, complete=False))
+        return closed
+
+    def get_open_bucket(self, line_code, level):
+        """Копия открытой корзины с текущим значением мощности"""
+        with self.lock:
+            bucket = self.lines.get(line_code, {}).get(level)
+            if not bucket:
+                return None
+            return self._finalize(dict(bucket), complete=False)
+
+    def _roll(self, line_code, line, moment, create=True):
+        """Закрытие корзин, в период которых момент уже не попадает"""
+        closed = []
+        for level in self.LEVELS:
+            key = self._bucket_key(level, moment)
+            bucket = line.get(level)
+            if bucket and bucket['key'] != key:
+                closed.append(self._finalize(bucket, complete=True))
+                bucket = None
+                line.pop(level)
+            if bucket is None and create:
+                line[level] = self._new_bucket(line_code, level, key, moment)
+        return closed
+
+    @staticmethod
+    def _bucket_key(level, moment):
+        if level == 'minute':
+            return moment.date().isoformat(), moment.hour, moment.minute
+        return moment.date().isoformat(), moment.hour
+
+    @staticmethod
+    def _new_bucket(line_code, level, key, moment):
+        bucket = {
+            'line_code': line_code,
+            'level': level,
+            'key': key,
+            'opened_at': moment.timestamp(),
+            'total': 0,
+            'min_delta': None,
+            'max_delta': None,
+            'sample_count': 0,
+            'gap_seconds': 0.0
+        }
+        bucket['date'], bucket['hour'] = key[0], key[1]
+        if level == 'minute':
+            bucket['minute'] = key[2]
+        return bucket
+
+    @staticmethod
+    def _finalize(bucket, complete):
+        """
+        Расчет мощности корзины (шт/мин)
+
+        Для минуты - сумма за минуту, для часа - среднее в минуту: для
+        закрытого часа за 60 минут, для открытого - за прошедшее время.
+        """
+        if bucket['level'] == 'minute':
+            power = bucket['total']
+        else:
+            minutes = 60 if complete else max(1.0, (datetime.now().timestamp() - bucket['opened_at']) / 60)
+            power = bucket['total'] / minutes
+        bucket['power_value'] = round(power, 2)
+        bucket['complete'] = complete
+        return bucket
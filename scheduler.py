@@ -0,0 +1,121 @@
+# scheduler.py
+import asyncio
+import time
+from config import Config
+
+class FixedRateScheduler:
+    """
+    Планировщик опроса с фиксированной сеткой по монотонным часам
+    
+    Тики назначаются на моменты start + k * interval и не зависят от того,
+    сколько длился предыдущий опрос, поэтому интервалы между выборками не
+    "уплывают". Если опрос не уложился в интервал, пропущенные тики либо
+    отбрасываются (policy='skip'), либо выполняются сразу друг за другом,
+    но не более max_catch_up подряд (policy='catch_up').
+    """
+    
+    POLICIES = ('skip', 'catch_up')
+    
+    def __init__(self, interval, policy=None, phase=0.0, max_catch_up=None, clock=time.monotonic):
+        self.config = Config
+        self.interval = interval
+        self.policy = policy or self.config.POLLING_MISSED_TICK_POLICY
+        if self.policy not in self.POLICIES:
+            raise ValueError(f"Неизвестная политика пропуска тиков: {self.policy}")
+        self.max_catch_up = max_catch_up if max_catch_up is not None else self.config.POLLING_MAX_CATCH_UP
+        self.clock = clock
+        
+        self.start = self.clock() + phase
+        self.tick_index = 0
+        self.tick_started = None
+        self.last_fired = None
+        
+        self.metrics = {
+            'interval': interval,
+            'policy': self.policy,
+            'ticks': 0,
+            'overruns': 0,
+            'skipped_ticks': 0,
+            'last_lag_ms': 0,
+            'max_lag_ms': 0,
+            'avg_lag_ms': 0,
+            'last_duration_ms': 0,
+            'max_duration_ms': 0,
+            'last_spacing': None,
+            'jitter_ms': 0
+        }
+    
+    def next_deadline(self):
+        """Момент следующего тика по сетке"""
+        return self.start + self.tick_index * self.interval
+    
+    async def wait_next(self):
+        """
+        Ожидание следующего тика
+        
+        Returns:
+            Фактический интервал с предыдущего тика (секунды) или None для первого тика
+        """
+        deadline = self._plan_deadline(self.clock())
+        
+        delay = deadline - self.clock()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        return self._fire(deadline)
+    
+    def tick_finished(self):
+        """Фиксация окончания работы тика (длительность и перерасход интервала)"""
+        if self.tick_started is None:
+            return
+        
+        duration = self.clock() - self.tick_started
+        duration_ms = round(duration * 1000, 2)
+        self.metrics['last_duration_ms'] = duration_ms
+        self.metrics['max_duration_ms'] = max(self.metrics['max_duration_ms'], duration_ms)
+        if duration > self.interval:
+            self.metrics['overruns'] += 1
+    
+    def get_metrics(self):
+        """Метрики планировщика"""
+        return dict(self.metrics)
+    
+    def _plan_deadline(self, now):
+        """Выбор момента следующего тика с учетом политики пропуска"""
+        deadline = self.next_deadline()
+        behind = int((now - deadline) // self.interval) if now > deadline else 0
+        
+        if behind > 0:
+            if self.policy == 'skip':
+                # Отбрасываем все пропущенные тики, ждем ближайший будущий
+                skipped = behind + 1
+            else:
+                # Догоняем, но не больше max_catch_up тиков подряд
+                skipped = max(0, behind - self.max_catch_up)
+            self.tick_index += skipped
+            self.metrics['skipped_ticks'] += skipped
+            deadline = self.next_deadline()
+        
+        return deadline
+    
+    def _fire(self, deadline):
+        """Фиксация срабатывания тика"""
+        now = self.clock()
+        self.tick_index += 1
+        self.tick_started = now
+        
+        lag_ms = round(max(0.0, now - deadline) * 1000, 2)
+        self.metrics['ticks'] += 1
+        self.metrics['last_lag_ms'] = lag_ms
+        self.metrics['max_lag_ms'] = max(self.metrics['max_lag_ms'], lag_ms)
+        self.metrics['avg_lag_ms'] = round(self.metrics['avg_lag_ms'] * 0.9 + lag_ms * 0.1, 2)
+        
+        spacing = None
+        if self.last_fired is not None:
+            spacing = now - self.last_fired
+            jitter_ms = abs(spacing - self.interval) * 1000
+            self.metrics['last_spacing'] = round(spacing, 3)
+            self.metrics['jitter_ms'] = round(self.metrics['jitter_ms'] * 0.9 + jitter_ms * 0.1, 2)
+        self.last_fired = now
+        
+        return spacing
@@ -0,0 +1,353 @@
+# shards.py
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from config import Config
+
+# Таблицы сырых выборок - в помесячных файлах, остальные - в файле линии
+RAW_TABLES = ('production_data', 'oee_metrics')
+LINE_TABLES = ('minute_power', 'hourly_power', 'downtime_events', 'shift_reports', 'device_outages')
+
+def month_of(timestamp):
+    """Месяц 'YYYY-MM' по строке времени UTC ('YYYY-MM-DD HH:MM:SS')"""
+    return timestamp[:7]
+
+def month_end(month):
+    """Начало следующего месяца (UTC)"""
+    year, number = int(month[:4]), int(month[5:7])
+    return datetime(year + number // 12, number % 12 + 1, 1)
+
+class ShardedConnections:
+    """
+    Хранилище, разделенное по линиям и месяцам
+
+    У каждой линии свой каталог SHARD_DIR/<линия>: line.db - агрегаты,
+    простои и сменные отчеты, raw-YYYY-MM.db - сырые выборки
+    production_data / oee_metrics за месяц (UTC). У каждого файла свое
+    соединение на запись (ConnectionManager), поэтому линии и месяцы не
+    ждут общей блокировки.
+
+    Чтение идет через соединение с line.db, к которому присоединены (ATTACH)
+    помесячные файлы диапазона, а временные представления production_data /
+    oee_metrics объединяют их (UNION ALL) - SQL запросов Database тот же,
+    что и для одного файла. Прошедший месяц через SHARD_SEAL_GRACE
+    "запечатывается": WAL сливается в файл, и дальше файл читается
+    с immutable=1 (без блокировок и проверок изменений).
+    """
+
+    def __init__(self, base_dir=None, init_schema=None, manager_class=None):
+        self.config = Config
+        self.base_dir = base_dir or self.config.SHARD_DIR
+        self.init_schema = init_schema
+        self.manager_class = manager_class
+        self.lock = threading.RLock()
+        self.managers = {}
+        self.months = {}
+        self.sealed = set()
+        self.readers = OrderedDict()
+        self.idle_readers = 0
+        self.busy_readers = {}
+        self.stale_readers = set()
+
+        self.stats = {
+            'files_created': 0,
+            'sealed': 0,
+            'readers_opened': 0,
+            'attach_limited': 0
+        }
+
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    # ---------- Файлы ----------
+
+    def line_dir(self, line_code):
+        return os.path.join(self.base_dir, re.sub(r'[^0-9A-Za-z_-]', '_', line_code or Config.LINE_CODE))
+
+    def line_path(self, line_code):
+        return os.path.join(self.line_dir(line_code), 'line.db')
+
+    def month_path(self, line_code, month):
+        return os.path.join(self.line_dir(line_code), f'raw-{month}.db')
+
+    def get_months(self, line_code):
+        """Месяцы, за которые у линии есть файл сырых данных (по возрастанию)"""
+        line_code = line_code or Config.LINE_CODE
+        with self.lock:
+            if line_code not in self.months:
+                months = set()
+                if os.path.isdir(self.line_dir(line_code)):
+                    for name in os.listdir(self.line_dir(line_code)):
+                        match = re.fullmatch(r'raw-(\d{4}-\d{2})\.db', name)
+                        if match:
+                            months.add(match.group(1))
+                self.months[line_code] = months
+            return sorted(self.months[line_code])
+
+    def is_sealed_month(self, month):
+        """Месяц закончился и поздних записей за него уже не ждем"""
+        return datetime.utcnow() >= month_end(month) + timedelta(seconds=self.config.SHARD_SEAL_GRACE)
+
+    def _manager(self, line_code, month=None):
+        """ConnectionManager файла (создается и инициализируется при первом обращении)"""
+        line_code = line_code or Config.LINE_CODE
+        key = (line_code, month)
+        with self.lock:
+            manager = self.managers.get(key)
+            if manager is not None:
+                return manager
+
+            path = self.month_path(line_code, month) if month else self.line_path(line_code)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            created = not os.path.exists(path)
+            manager = self.manager_class(path)
+            with manager.writer() as conn:
+                self.init_schema(conn)
+            self.managers[key] = manager
+
+            if created:
+                self.stats['files_created'] += 1
+            if month:
+                self.get_months(line_code)
+                self.months[line_code].add(month)
+            return manager
+
+    # ---------- Запись ----------
+
+    @contextmanager
+    def writer(self, line_code=None, month=None):
+        """
+        Соединение на запись в файл линии или в помесячный файл (month)
+
+        Поздняя запись в запечатанный месяц допускается: соединения чтения
+        с immutable=1 закрываются, и файл запечатывается заново при
+        следующем чтении.
+        """
+        line_code = line_code or Config.LINE_CODE
+        if month and (line_code, month) in self.sealed:
+            with self.lock:
+                self._drop_readers(line_code, month)
+                self.sealed.discard((line_code, month))
+        with self._manager(line_code, month).writer() as conn:
+            yield conn
+
+    @contextmanager
+    def attached(self, path, alias, line_code=None, month=None):
+        """Соединение на запись с присоединенным файлом path (ATTACH вне транзакции)"""
+        with self.writer(line_code, month) as conn:
+            conn.execute('ATTACH DATABASE ? AS ' + alias, (path,))
+        try:
+            with self.writer(line_code, month) as conn:
+                yield conn
+        finally:
+            with self.writer(line_code, month) as conn:
+                conn.execute('DETACH DATABASE ' + alias)
+
+    def seal(self, line_code, month):
+        """Перевод помесячного файла в режим только чтения (WAL слит, соединения закрыты)"""
+        line_code = line_code or Config.LINE_CODE
+        with self.lock:
+            self._drop_readers(line_code, month)
+            manager = self.managers.pop((line_code, month), None)
+            if manager is not None:
+                manager.close()
+
+            path = self.month_path(line_code, month)
+            if os.path.exists(path + '-wal'):
+                conn = sqlite3.connect(path)
+                try:
+                    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                    conn.execute('PRAGMA journal_mode = DELETE')
+                finally:
+                    conn.close()
+            self.sealed.add((line_code, month))
+            self.stats['sealed'] += 1
+
+    def remove_month(self, line_code, month, archive_dir=None):
+        """Закрытие и удаление (или перенос в архивный каталог) помесячного файла"""
+        line_code = line_code or Config.LINE_CODE
+        with self.lock:
+            self.seal(line_code, month)
+            self.sealed.discard((line_code, month))
+            self.get_months(line_code)
+            self.months[line_code].discard(month)
+
+            path = self.month_path(line_code, month)
+            if archive_dir:
+                target_dir = os.path.join(archive_dir, os.path.basename(self.line_dir(line_code)))
+                os.makedirs(target_dir, exist_ok=True)
+                os.replace(path, os.path.join(target_dir, os.path.basename(path)))
+            elif os.path.exists(path):
+                os.remove(path)
+
+    # ---------- Чтение ----------
+
+    def _select_months(self, line_code, raw_range):
+        """Помесячные файлы, пересекающие диапазон (начало, конец) времени UTC"""
+        if raw_range is None:
+            return []
+        start, end = raw_range
+        months = [
+            month for month in self.get_months(line_code)
+            if (start is None or month >= month_of(start)) and (end is None or month <= month_of(end))
+        ]
+        if len(months) > self.config.SHARD_MAX_ATTACHED:
+            # Лимит ATTACH в SQLite - берем самые свежие месяцы
+            self.stats['attach_limited'] += 1
+            months = months[-self.config.SHARD_MAX_ATTACHED:]
+        return months
+
+    @contextmanager
+    def reader(self, line_code=None, raw_range=None):
+        """
+        Соединение только для чтения по линии
+
+        Args:
+            line_code: Код линии
+            raw_range: Диапазон сырых данных (начало, конец) - строки времени
+                UTC или None для открытой границы; None - сырые данные не нужны
+        """
+        line_code = line_code or Config.LINE_CODE
+        self._manager(line_code)
+
+        months = self._select_months(line_code, raw_range)
+        for month in months:
+            if (line_code, month) not in self.sealed and self.is_sealed_month(month):
+                self.seal(line_code, month)
+        key = (line_code, tuple(months), tuple((line_code, month) in self.sealed for month in months))
+
+        with self.lock:
+            idle = self.readers.get(key)
+            conn = idle.pop() if idle else None
+            if conn is not None:
+                self.idle_readers -= 1
+                self.readers.move_to_end(key)
+        if conn is None:
+            conn = self._open_reader(line_code, months, key[2])
+        with self.lock:
+            self.busy_readers[conn] = key
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._release_reader(key, conn)
+
+    def _open_reader(self, line_code, months, sealed):
+        manager = self._manager(line_code)
+        conn = sqlite3.connect(f'file:{self.line_path(line_code)}?mode=ro', uri=True, check_same_thread=False)
+        manager._configure(conn)
+
+        for index, (month, is_sealed) in enumerate(zip(months, sealed)):
+            if not is_sealed:
+                # Файл текущего месяца должен существовать (с WAL) до присоединения
+                self._manager(line_code, month)
+            flags = 'mode=ro&immutable=1' if is_sealed else 'mode=ro'
+            conn.execute(f'ATTACH DATABASE ? AS raw{index}', (f'file:{self.month_path(line_code, month)}?{flags}',))
+
+        if months:
+            # Временные представления перекрывают пустые таблицы line.db
+            for table in RAW_TABLES:
+                union = ' UNION ALL '.join(f'SELECT * FROM raw{index}.{table}' for index in range(len(months)))
+                conn.execute(f'CREATE TEMP VIEW {table} AS {union}')
+
+        conn.execute('PRAGMA query_only = ON')
+        self.stats['readers_opened'] += 1
+        return conn
+
+    def _release_reader(self, key, conn):
+        with self.lock:
+            self.busy_readers.pop(conn, None)
+            if conn in self.stale_readers:
+                # Пока соединение было занято, присоединенный месяц изменился
+                self.stale_readers.discard(conn)
+                conn.close()
+                return
+            self.readers.setdefault(key, []).append(conn)
+            self.readers.move_to_end(key)
+            self.idle_readers += 1
+
+            # Держим не больше SHARD_READER_CACHE простаивающих соединений
+            while self.idle_readers > self.config.SHARD_READER_CACHE:
+                oldest_key = next(iter(self.readers))
+                idle = self.readers[oldest_key]
+                if idle:
+                    idle.pop(0).close()
+                    self.idle_readers -= 1
+                if not idle:
+                    del self.readers[oldest_key]
+
+    def _drop_readers(self, line_code, month):
+        """Закрытие соединений чтения, к которым присоединен месяц (занятые - при возврате)"""
+        with self.lock:
+            for key in [key for key in self.readers if key[0] == line_code and month in key[1]]:
+                for conn in self.readers.pop(key):
+                    conn.close()
+                    self.idle_readers -= 1
+            for conn, key in self.busy_readers.items():
+                if key[0] == line_code and month in key[1]:
+                    self.stale_readers.add(conn)
+
+    # ---------- Перенос данных и служебное ----------
+
+    def import_database(self, source_path, line_codes):
+        """
+        Перенос данных однофайловой БД в шарды (первый запуск в режиме шардов)
+
+        Исходный файл не изменяется. Колонки берутся по именам - схема
+        источника должна быть приведена к текущей версии (миграции).
+        """
+        for line_code in line_codes:
+            with self.attached(source_path, 'src', line_code) as conn:
+                for table in LINE_TABLES:
+                    self._copy_rows(conn, table, 'line_code = ?', (line_code,))
+                months = [row[0] for row in conn.execute('''
+                    SELECT DISTINCT substr(timestamp, 1, 7) FROM src.production_data WHERE line_code = ?
+                    UNION
+                    SELECT DISTINCT substr(timestamp, 1, 7) FROM src.oee_metrics WHERE line_code = ?
+                ''', (line_code, line_code)).fetchall() if row[0]]
+
+            for month in months:
+                next_month = month_end(month).strftime('%Y-%m-%d %H:%M:%S')
+                with self.attached(source_path, 'src', line_code, month) as conn:
+                    for table in RAW_TABLES:
+                        self._copy_rows(
+                            conn, table, 'line_code = ? AND timestamp >= ? AND timestamp < ?',
+                            (line_code, f'{month}-01 00:00:00', next_month)
+                        )
+            print(f"✅ Данные линии {line_code} перенесены в шарды ({len(months)} мес. сырых данных)")
+
+    @staticmethod
+    def _copy_rows(conn, table, condition, params):
+        columns = [row[1] for row in conn.execute(f'PRAGMA main.table_info({table})') if row[1] != 'id']
+        source_columns = {row[1] for row in conn.execute(f'PRAGMA src.table_info({table})')}
+        columns = [column for column in columns if column in source_columns]
+        column_list = ', '.join(columns)
+        conn.execute(f'''
+            INSERT INTO main.{table} ({column_list})
+            SELECT {column_list} FROM src.{table} WHERE {condition}
+        ''', params)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['mode'] = 'sharded'
+            stats['open_files'] = len(self.managers)
+            stats['idle_readers'] = self.idle_readers
+        return stats
+
+    def close(self):
+        """Закрытие всех соединений"""
+        with self.lock:
+            for idle in self.readers.values():
+                for conn in idle:
+                    conn.close()
+            self.readers.clear()
+            self.idle_readers = 0
+            for manager in self.managers.values():
+                manager.close()
+            self.managers.clear()
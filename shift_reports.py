@@ -0,0 +1,159 @@
+# shift_reports.py
+import threading
+from datetime import datetime, timedelta
+from models import ShiftManager, OEECalculator
+from config import Config
+
+class ShiftReportJob:
+    """
+    Итоговые отчеты по сменам
+
+    Фоновый поток ждет окончания очередной смены (границы по ShiftManager,
+    у каждой линии - свой план смен) и через SHIFT_REPORT_DELAY секунд
+    записывает строку shift_reports этой линии: выпуск, простои и OEE
+    по OEECalculator.calculate_shift_oee.
+    При запуске дозаполняются отчеты по прошедшим сменам, которых еще нет
+    в таблице. Запросы по закрытым сменам читают готовую строку вместо
+    пересчета по сырым данным.
+    """
+
+    def __init__(self, db, calculator=None, line_codes=None):
+        self.config = Config
+        self.db = db
+        self.calculator = calculator or OEECalculator()
+        self.line_codes = line_codes or [Config.LINE_CODE]
+        self.delay = timedelta(seconds=self.config.SHIFT_REPORT_DELAY)
+        self.thread = None
+        self._stopping = threading.Event()
+
+        self.stats = {
+            'finalized': 0,
+            'backfilled': 0,
+            'last_report': None,
+            'next_close': None,
+            'last_error': None
+        }
+
+    def start(self):
+        """Запуск фонового расчета отчетов"""
+        self.thread = threading.Thread(target=self._run, name='shift-reports', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    def finalize(self, shift_date, shift_number, line_code=None):
+        """
+        Расчет и запись отчета по смене
+
+        Returns:
+            Словарь отчета или None при ошибке
+        """
+        line_code = line_code or self.config.LINE_CODE
+        shift_data = self.db.get_shift_data(shift_date, shift_number, line_code)
+        shift_data['shift_number'] = shift_number
+        shift_data['line_code'] = line_code
+
+        oee_data = self.calculator.calculate_shift_oee(shift_data)
+        if not oee_data:
+            return None
+
+        report = {
+            'shift_date': shift_date,
+            'shift_number': shift_number,
+            'total_production': shift_data['total_production'],
+            'data_points': shift_data['data_points'],
+            'downtime_minutes': shift_data['downtime_minutes'],
+            'planned_production': oee_data['planned_production'],
+            'oee_percentage': oee_data['oee_percentage'],
+            'availability': oee_data['availability'],
+            'performance': oee_data['performance'],
+            'quality': oee_data['quality'],
+            'production_rate': oee_data['production_rate']
+        }
+        if not self.db.save_shift_report(report, line_code):
+            return None
+
+        self.stats['finalized'] += 1
+        self.stats['last_report'] = f"{line_code} {shift_date} смена {shift_number}"
+        return report
+
+    def backfill(self, now=None):
+        """Отчеты по закрытым сменам, для которых их еще нет"""
+        now = now or datetime.now()
+        first_sample = self.db.get_first_sample_time()
+        if first_sample is None:
+            return 0
+
+        since = max(first_sample, now - timedelta(days=self.config.SHIFT_REPORT_BACKFILL_DAYS))
+
+        count = 0
+        for line_code in self.line_codes:
+            # Смена, в которую попала первая выборка, могла начаться до нее
+            shifts = [
+                shift for shift in ShiftManager.iter_shifts(since - timedelta(days=1), now, line_code)
+                if shift[3] > since and shift[3] + self.delay <= now
+            ]
+            existing = self.db.get_shift_report_keys(line_code)
+            for shift_date, shift_number, _, _ in shifts:
+                if self._stopping.is_set():
+                    return count
+                if (shift_date, shift_number) in existing:
+                    continue
+                if self.finalize(shift_date, shift_number, line_code):
+                    count += 1
+
+        if count:
+            print(f"📊 Дозаполнено сменных отчетов: {count}")
+        self.stats['backfilled'] += count
+        return count
+
+    def _next_close(self, now):
+        """
+        Ближайшие смены, отчеты по которым еще предстоит записать
+
+        Returns:
+            Список (код линии, смена из ShiftManager.iter_shifts) с самым ранним
+            окончанием - линии с одинаковым планом смен закрываются вместе
+        """
+        upcoming = []
+        for line_code in self.line_codes:
+            for shift in ShiftManager.iter_shifts(now - timedelta(days=2), now + timedelta(days=2), line_code):
+                if shift[3] + self.delay > now:
+                    upcoming.append((line_code, shift))
+                    break
+        if not upcoming:
+            return []
+        shift_end = min(shift[3] for _, shift in upcoming)
+        return [item for item in upcoming if item[1][3] == shift_end]
+
+    def _run(self):
+        try:
+            self.backfill()
+        except Exception as e:
+            print(f"❌ Ошибка дозаполнения сменных отчетов: {e}")
+            self.stats['last_error'] = str(e)
+
+        while not self._stopping.is_set():
+            now = datetime.now()
+            upcoming = self._next_close(now)
+            if not upcoming:
+                # Смены не настроены - проверим позже
+                self._stopping.wait(self.config.RETENTION_CHECK_INTERVAL)
+                continue
+
+            shift_end = upcoming[0][1][3]
+            self.stats['next_close'] = shift_end.isoformat()
+            if self._stopping.wait((shift_end + self.delay - now).total_seconds()):
+                break
+
+            for line_code, (shift_date, shift_number, _, _) in upcoming:
+                try:
+                    if self.finalize(shift_date, shift_number, line_code):
+                        print(f"✅ Отчет по смене {shift_number} за {shift_date} ({line_code}) сохранен")
+                except Exception as e:
+                    print(f"❌ Ошибка расчета отчета по смене {line_code}: {e}")
+                    self.stats['last_error'] = str(e)
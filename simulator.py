@@ -0,0 +1,286 @@
+# simulator.py
+"""
+Имитатор контроллера линии (Modbus TCP) для стенда и нагрузочных тестов
+
+Отвечает на чтение регистров (функции 3 и 4) по карте Config.REGISTER_MAP:
+общий счетчик 6000 (uint32, big-endian), часовой 6001 и дополнительный
+6011. Значения счетчиков - функция времени по сценарию (PROFILES): ровная
+работа, простои, переполнение счетчика, медленные и сбойные ответы.
+Каждое устройство - свой порт, все устройства обслуживаются одним циклом
+asyncio, поэтому задержка ответа одной линии не задерживает другие.
+
+Запуск:
+    python simulator.py --lines 3 --profile stops --base-port 15020 --speed 60
+и устройства из вывода - в Config.DEVICES.
+"""
+import argparse
+import asyncio
+import random
+import struct
+import threading
+import time
+from config import Config
+
+# Сценарии выпуска (параметры ProductionProfile)
+PROFILES = {
+    'steady': {'rate': 1000},
+    'stops': {'rate': 1000, 'run_seconds': 600, 'stop_seconds': 240},
+    'rollover': {'rate': 1000, 'start_counter': Config.COUNTER_MAX - 500},
+    'slow': {'rate': 1000, 'latency': 0.5, 'jitter': 0.3},
+    'failing': {'rate': 1000, 'failure_rate': 0.2},
+}
+
+# Коды исключений Modbus
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+SLAVE_DEVICE_FAILURE = 4
+
+class ProductionProfile:
+    """
+    Сценарий выпуска линии
+
+    Счетчик растет со скоростью rate шт/час; если задан run_seconds, работа
+    чередуется с простоями по stop_seconds. speed ускоряет время сценария
+    (60 - минута сценария за секунду). Сбои: с вероятностью failure_rate
+    запрос получает один из failures - 'exception' (код ошибки Modbus),
+    'drop' (разрыв соединения) или 'silence' (ответа нет).
+    """
+
+    def __init__(self, rate=1000, run_seconds=None, stop_seconds=0, start_counter=2265349,
+                 latency=0.0, jitter=0.0, failure_rate=0.0, failures=('exception', 'drop', 'silence'),
+                 speed=1.0, seed=None):
+        self.rate = rate
+        self.run_seconds = run_seconds
+        self.stop_seconds = stop_seconds
+        self.start_counter = start_counter
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failures = failures
+        self.speed = speed
+        self.random = random.Random(seed)
+        self.started = time.time()
+
+    @classmethod
+    def from_name(cls, name, **overrides):
+        params = dict(PROFILES[name])
+        params.update(overrides)
+        return cls(**params)
+
+    def elapsed(self, now=None):
+        """Время сценария (секунды с запуска с учетом ускорения)"""
+        return ((now or time.time()) - self.started) * self.speed
+
+    def running_seconds(self, elapsed):
+        """Время работы (без простоев) за elapsed секунд сценария"""
+        if not self.run_seconds:
+            return elapsed
+        cycle = self.run_seconds + self.stop_seconds
+        full, rest = divmod(elapsed, cycle)
+        return full * self.run_seconds + min(rest, self.run_seconds)
+
+    def is_running(self, now=None):
+        if not self.run_seconds:
+            return True
+        return self.elapsed(now) % (self.run_seconds + self.stop_seconds) < self.run_seconds
+
+    def counters(self, now=None):
+        """Значения счетчиков {имя: значение} на момент now"""
+        elapsed = self.elapsed(now)
+        produced = int(self.rate / 3600 * self.running_seconds(elapsed))
+        hour_start = elapsed - elapsed % 3600
+        produced_this_hour = produced - int(self.rate / 3600 * self.running_seconds(hour_start))
+        return {
+            'ivams_total': (self.start_counter + produced) % Config.COUNTER_MAX,
+            'hour_count': produced_this_hour % 65536,
+            'aux_count': (produced // 10) % 65536
+        }
+
+    def response_delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def pick_failure(self):
+        """Сбой для очередного запроса или None"""
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            return self.random.choice(self.failures)
+        return None
+
+def register_image(register_map, values):
+    """
+    Значения → {адрес: 16-битное слово} (uint32 - старшее слово первым)
+
+    При пересечении адресов (в карте по умолчанию 6001 - младшее слово
+    общего счетчика) приоритет у 32-битных счетчиков, как в контроллере.
+    """
+    words = {}
+    for name, item in sorted(register_map.items(), key=lambda entry: entry[1]['type'] == 'uint32'):
+        value = values.get(name, 0)
+        if item['type'] == 'uint32':
+            words[item['address']] = (value >> 16) & 0xFFFF
+            words[item['address'] + 1] = value & 0xFFFF
+        else:
+            words[item['address']] = value & 0xFFFF
+    return words
+
+class SimulatedDevice:
+    """Одно устройство: TCP сервер Modbus на своем порту"""
+
+    def __init__(self, line_code, port, profile, host='127.0.0.1', register_map=None):
+        self.line_code = line_code
+        self.host = host
+        self.port = port
+        self.profile = profile
+        self.register_map = register_map or Config.REGISTER_MAP
+        self.server = None
+
+        self.stats = {
+            'connections': 0,
+            'requests': 0,
+            'responses': 0,
+            'exceptions': 0,
+            'dropped': 0,
+            'silenced': 0
+        }
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.stats['connections'] += 1
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction_id, protocol_id, length, unit_id = struct.unpack('>HHHB', header)
+                pdu = await reader.readexactly(length - 1)
+                self.stats['requests'] += 1
+
+                failure = self.profile.pick_failure()
+                if failure == 'drop':
+                    self.stats['dropped'] += 1
+                    break
+                if failure == 'silence':
+                    # Запрос остается без ответа - клиент уходит по таймауту
+                    self.stats['silenced'] += 1
+                    continue
+
+                delay = self.profile.response_delay()
+                if delay:
+                    await asyncio.sleep(delay)
+
+                response = self._exception(pdu[0], SLAVE_DEVICE_FAILURE) if failure else self._respond(pdu)
+                writer.write(struct.pack('>HHHB', transaction_id, protocol_id, len(response) + 1, unit_id) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, pdu):
+        function_code = pdu[0]
+        if function_code not in (3, 4):
+            return self._exception(function_code, ILLEGAL_FUNCTION)
+
+        address, count = struct.unpack('>HH', pdu[1:5])
+        if not 1 <= count <= Config.MODBUS_MAX_READ_COUNT:
+            return self._exception(function_code, ILLEGAL_DATA_ADDRESS)
+
+        words = register_image(self.register_map, self.profile.counters())
+        values = [words.get(address + offset, 0) for offset in range(count)]
+        self.stats['responses'] += 1
+        return struct.pack(f'>BB{count}H', function_code, 2 * count, *values)
+
+    def _exception(self, function_code, code):
+        self.stats['exceptions'] += 1
+        return struct.pack('>BB', function_code | 0x80, code)
+
+class Simulator:
+    """Набор имитируемых устройств в фоновом потоке со своим циклом asyncio"""
+
+    def __init__(self, profile='steady', lines=1, base_port=15020, host='127.0.0.1', speed=1.0, seed=None):
+        self.devices = [
+            SimulatedDevice(
+                f'SIM_{index + 1}',
+                base_port + index,
+                ProductionProfile.from_name(profile, speed=speed, seed=None if seed is None else seed + index),
+                host
+            )
+            for index in range(lines)
+        ]
+        self.loop = None
+        self.thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """Запуск серверов (возврат после того, как порты открыты)"""
+        self.thread = threading.Thread(target=self._run, name='modbus-simulator', daemon=True)
+        self.thread.start()
+        self._ready.wait(10)
+        return self
+
+    def stop(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        if self.thread:
+            self.thread.join(5)
+
+    def get_devices(self, polling_interval=None, timeout=None):
+        """Описание устройств для Config.DEVICES"""
+        return [
+            {
+                'line_code': device.line_code,
+                'line_name': f'Имитатор {device.line_code}',
+                'host': device.host,
+                'port': device.port,
+                'device_id': 1,
+                'polling_interval': polling_interval or Config.POLLING_INTERVAL,
+                'timeout': timeout or Config.MODBUS_TIMEOUT,
+            }
+            for device in self.devices
+        ]
+
+    def get_stats(self):
+        return {device.line_code: dict(device.stats) for device in self.devices}
+
+    def _run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        for device in self.devices:
+            await device.start()
+        self._ready.set()
+        await self._stopping.wait()
+        for device in self.devices:
+            await device.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Имитатор контроллеров линий (Modbus TCP)')
+    parser.add_argument('--lines', type=int, default=1, help='количество линий')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='steady', help='сценарий выпуска')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=15020, help='порт первой линии (далее по порядку)')
+    parser.add_argument('--speed', type=float, default=1.0, help='ускорение времени сценария')
+    parser.add_argument('--seed', type=int, default=None, help='зерно случайных сбоев и задержек')
+    args = parser.parse_args()
+
+    simulator = Simulator(args.profile, args.lines, args.base_port, args.host, args.speed, args.seed).start()
+    print(f"🔧 Имитатор: {args.lines} лин., сценарий '{args.profile}', порты {args.base_port}-{args.base_port + args.lines - 1}")
+    print("📊 Устройства для Config.DEVICES:")
+    for device in simulator.get_devices():
+        print(f"    {device},")
+
+    try:
+        while True:
+            time.sleep(60)
+            print(f"📊 {simulator.get_stats()}")
+    except KeyboardInterrupt:
+        simulator.stop()
+
+if __name__ == '__main__':
+    main()
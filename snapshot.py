@@ -0,0 +1,40 @@
+# snapshot.py
+import hashlib
+import json
+
+def json_default(value):
+    """Сериализация datetime/time и прочих нестандартных значений"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+class StateSnapshot:
+    """
+    Готовый к отдаче снимок состояния линии
+
+    Поток опроса раз в тик сериализует состояние в JSON и публикует пару
+    (тело, ETag) одной заменой ссылки - читатели без блокировок получают
+    либо старый, либо новый снимок целиком и отдают байты как есть.
+    """
+
+    def __init__(self, state=None):
+        self.version = 0
+        self._current = None
+        self.publish(state or {})
+
+    def publish(self, state):
+        """Сериализация и атомарная публикация нового снимка"""
+        body = json.dumps(state, ensure_ascii=False, default=json_default).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        self.version += 1
+        self._current = (body, etag)
+        return etag
+
+    def get(self):
+        """
+        Текущий снимок
+
+        Returns:
+            Кортеж (JSON байты, ETag)
+        """
+        return self._current
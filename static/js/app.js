@@ -11,6 +11,7 @@ class OEEDashboard {    constructor() {
         this.currentView = 'all'; // 'all' или 'shift'
         this.selectedDate = 'today'; // Выбранная дата
         this.availableDates = []; // Доступные даты
+        this.lineCode = new URLSearchParams(window.location.search).get('line'); // Линия (?line=)
 
         this.initCharts();
         this.loadAvailableDates();
@@ -20,11 +21,16 @@ class OEEDashboard {    constructor() {
     }ollHint();
     }
 
+    apiUrl(path) {
+        // Все запросы к API - по линии страницы
+        return this.lineCode ? `${path}?line=${encodeURIComponent(this.lineCode)}` : path;
+    }
+
     createEmptyMinuteData() {
         return Array.from({ length: 24 }, () => new Array(60).fill(0));
      async loadAvailableDates() {
         try {
-            const response = await fetch('/api/available_dates');
+            const response = await fetch(this.apiUrl('/api/available_dates'));
             const data = await response.json();
 
             if (data.dates) {
@@ -69,14 +75,21 @@ class OEEDashboard {    constructor() {
 
     async loadHistoricalData() {
         try {
-            let response;
-            if (this.selectedDate === 'today') {
-                response = await fetch('/api/minute_power');
+            const url = this.apiUrl(this.selectedDate === 'today'
+                ? '/api/minute_power'
+                : `/api/minute_power/${this.selectedDate}`);
+
+            // Компактный формат: 1440 значений float32, JSON - запасной вариант
+            const response = await fetch(url, {
+                headers: { 'Accept': 'application/x-minute-grid, application/json;q=0.9' }
+            });
+
+            let data;
+            if ((response.headers.get('Content-Type') || '').startsWith('application/x-minute-grid')) {
+                data = { minute_power: this.decodeMinuteGrid(await response.arrayBuffer()) };
             } else {
-                response = await fetch(`/api/minute_power/${this.selectedDate}`);
+                data = await response.json();
             }
-            
-            const data = await response.json();
 
             if (data.minute_power) {
                 this.minuteData = data.minute_power;
@@ -88,6 +101,16 @@ class OEEDashboard {    constructor() {
         }
     }
 
+    decodeMinuteGrid(buffer) {
+        // Значения float32 little-endian по порядку час*60 + минута
+        const view = new DataView(buffer);
+        return Array.from({ length: 24 }, (_, hour) =>
+            Array.from({ length: 60 }, (_, minute) =>
+                Math.round(view.getFloat32((hour * 60 + minute) * 4, true) * 100) / 100
+            )
+        );
+    }
+
     async loadDateData() {
         const dateSelect = document.getElementById('date-select');
         if (dateSelect) {
@@ -453,22 +476,48 @@ class OEEDashboard {    constructor() {
 
     async updateDashboard() {
         try {
-            const response = await fetch('/api/current_data');
+            const response = await fetch(this.apiUrl('/api/current_data'));
             const data = await response.json();
-
-            if (data.production_data && data.oee_data) {
-                this.updateKPIs(data);
-                this.updateProductionData(data);
-                this.updateOEEGauge(data.oee_data);
-                this.updateDowntimeAlert(data.downtime_status);
-                this.updateShiftInfo(data.shift_info);
-                this.updateLastUpdate(data.last_update);
-            }
+            this.currentData = data;
+            this.applyCurrentData(data);
         } catch (error) {
             console.error('Ошибка обновления данных:', error);
         }
     }
 
+    applyCurrentData(data) {
+        if (data.production_data && data.oee_data) {
+            this.updateKPIs(data);
+            this.updateProductionData(data);
+            this.updateOEEGauge(data.oee_data);
+            this.updateDowntimeAlert(data.downtime_status);
+            this.updateShiftInfo(data.shift_info);
+            this.updateLastUpdate(data.last_update);
+        }
+    }
+
+    applyMinuteCells(cells) {
+        // Ячейки карты приходят только для сегодняшнего дня
+        if (this.selectedDate !== 'today') return;
+
+        const now = new Date();
+        const today = `${now.getFullYear()}-${String(now.getMonth() + 1).padStart(2, '0')}-${String(now.getDate()).padStart(2, '0')}`;
+        let changed = false;
+
+        cells.forEach(([date, hour, minute, value]) => {
+            if (date !== today) return;
+            if (!this.minuteData[hour]) {
+                this.minuteData[hour] = new Array(60).fill(0);
+            }
+            this.minuteData[hour][minute] = value;
+            changed = true;
+        });
+
+        if (changed) {
+            this.updateMinuteHeatmap();
+        }
+    }
+
     updateKPIs(data) {
         // OEE
         const oeeValue = document.getElementById('oee-value');
@@ -511,6 +560,16 @@ class OEEDashboard {    constructor() {
 
         if (!powerKpiEl || !powerStatusEl || !data.production_data) return;
 
+        if (data.production_data.success === false) {
+            // Нет связи: мощность неизвестна
+            powerKpiEl.textContent = '—';
+            powerKpiEl.className = 'kpi-value power-value idle';
+            powerStatusEl.textContent = 'Нет связи с оборудованием';
+            this.lastPowerValue = null;
+            this.lastProductionCount = null;
+            return;
+        }
+
         const currentProduction = data.production_data.ivams_total;
         let currentPower = 0;
 
@@ -643,11 +702,60 @@ class OEEDashboard {    constructor() {
     }
 
     startAutoUpdate() {
-        this.updateDashboard();
-        setInterval(() => {
+        // Push канал (SSE), опрос - только если он недоступен
+        if (window.EventSource) {
+            this.startEventStream();
+        } else {
+            this.updateDashboard();
+            this.startPolling();
+        }
+    }
+
+    startPolling() {
+        if (this.pollTimer) return;
+        this.pollTimer = setInterval(() => {
             this.updateDashboard();
         }, this.updateInterval);
     }
+
+    stopPolling() {
+        if (this.pollTimer) {
+            clearInterval(this.pollTimer);
+            this.pollTimer = null;
+        }
+    }
+
+    startEventStream() {
+        this.currentData = {};
+        const source = new EventSource(this.apiUrl('/api/stream'));
+
+        // Полный снимок при подключении
+        source.addEventListener('state', (event) => {
+            this.currentData = JSON.parse(event.data);
+            this.applyCurrentData(this.currentData);
+        });
+
+        // Изменившиеся разделы состояния за тик
+        source.addEventListener('delta', (event) => {
+            Object.assign(this.currentData, JSON.parse(event.data));
+            this.applyCurrentData(this.currentData);
+        });
+
+        // Изменившиеся ячейки поминутной карты
+        source.addEventListener('cells', (event) => {
+            this.applyMinuteCells(JSON.parse(event.data).cells);
+        });
+
+        source.onopen = () => {
+            this.stopPolling();
+        };
+
+        source.onerror = () => {
+            // Браузер переподключается сам, до этого данные берем опросом
+            console.error('Push канал недоступен, переход на опрос');
+            this.startPolling();
+        };
+    }
 }
 
 // Запускаем dashboard когда страница загружена